@@ -0,0 +1,107 @@
+import multiprocessing
+
+import numpy as np
+
+from csr_graph import load_csr_graph
+
+# CSR graph of the worker processes, memory mapped once by the pool initializer
+worker_graph = None
+
+
+def get_frontier_edges(indptr, indices, frontier):
+    """
+    Returns the (source, destination) pairs of all the edges leaving the frontier nodes
+    """
+    starts = indptr[frontier]
+    degrees = indptr[frontier + 1] - starts
+    sources = np.repeat(frontier, degrees)
+    # positions of the edges in indices: starts[i], starts[i] + 1, ..., starts[i] + degrees[i] - 1
+    offsets = np.arange(degrees.sum()) - np.repeat(np.cumsum(degrees) - degrees, degrees)
+    return sources, np.asarray(indices[np.repeat(starts, degrees) + offsets])
+
+
+def get_dependencies(indptr, indices, source, n_nodes):
+    """
+    Brandes' dependencies of the source on every node (unweighted directed graph), with a level-synchronous
+    BFS in which each level is processed as a whole with vectorized operations
+    """
+    distances = np.full(n_nodes, -1, dtype=np.int64)
+    sigma = np.zeros(n_nodes)
+    distances[source] = 0
+    sigma[source] = 1.0
+    frontier = np.array([source], dtype=np.int64)
+    levels = []
+    level = 0
+    while len(frontier):
+        sources, destinations = get_frontier_edges(indptr, indices, frontier)
+        unvisited = distances[destinations] == -1
+        distances[destinations[unvisited]] = level + 1
+        # edges of the shortest paths DAG
+        on_path = distances[destinations] == level + 1
+        sources, destinations = sources[on_path], destinations[on_path]
+        np.add.at(sigma, destinations, sigma[sources])
+        levels.append((sources, destinations))
+        frontier = np.unique(destinations)
+        level += 1
+
+    delta = np.zeros(n_nodes)
+    for sources, destinations in reversed(levels):
+        np.add.at(delta, sources, sigma[sources] / sigma[destinations] * (1.0 + delta[destinations]))
+    delta[source] = 0.0
+    return delta
+
+
+def init_worker(graph_path):
+    global worker_graph
+    worker_graph = load_csr_graph(graph_path)
+
+
+def accumulate_dependencies(pivots, csr_graph=None):
+    """
+    Sum and sum of squares of the dependencies of the given pivots on every node
+    """
+    if csr_graph is None:
+        csr_graph = worker_graph
+    indptr = np.asarray(csr_graph.indptr)
+    total = np.zeros(csr_graph.n_nodes)
+    total_squares = np.zeros(csr_graph.n_nodes)
+    for pivot in pivots:
+        delta = get_dependencies(indptr, csr_graph.indices, pivot, csr_graph.n_nodes)
+        total += delta
+        total_squares += delta * delta
+    return total, total_squares
+
+
+def compute_approximate_betweenness(graph_path, n_samples, workers=1, seed=None):
+    """
+    Estimates the betweenness centrality of every node from the dependencies of n_samples pivots sampled
+    uniformly without replacement (Brandes and Pich): each pivot contributes an unbiased estimate
+    n_nodes * delta_pivot(v), so the result is their mean and the error is its standard error.
+    Returns the estimates and the standard errors, as arrays indexed by node id.
+    """
+    csr_graph = load_csr_graph(graph_path)
+    n_nodes = csr_graph.n_nodes
+    n_samples = min(n_samples, n_nodes)
+    pivots = np.random.RandomState(seed).choice(n_nodes, n_samples, replace=False)
+
+    # pool workers are daemonic and can't fork again: when already in a worker, run in this process
+    if workers > 1 and not multiprocessing.current_process().daemon:
+        chunks = np.array_split(pivots, workers * 4)
+        pool = multiprocessing.Pool(workers, initializer=init_worker, initargs=(graph_path,))
+        try:
+            partials = pool.map(accumulate_dependencies, chunks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        partials = [accumulate_dependencies(pivots, csr_graph)]
+
+    total = sum(partial[0] for partial in partials)
+    total_squares = sum(partial[1] for partial in partials)
+    mean = total / n_samples
+    variance = np.maximum(total_squares / n_samples - mean * mean, 0.0)
+    # finite population correction, exact when every node is a pivot
+    correction = 1.0 if n_samples == 1 else float(n_nodes - n_samples) / (n_nodes - 1)
+    estimates = n_nodes * mean
+    standard_errors = n_nodes * np.sqrt(variance * correction / n_samples)
+    return estimates, standard_errors
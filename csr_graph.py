@@ -0,0 +1,149 @@
+import os
+
+import numpy as np
+
+CSR_INDPTR_SUFFIX = ".csr_indptr.npy"
+CSR_INDICES_SUFFIX = ".csr_indices.npy"
+PKG_BLOB_SUFFIX = ".pkg_blob.npy"
+PKG_OFFSETS_SUFFIX = ".pkg_offsets.npy"
+
+
+def get_base_path(graph_path):
+    graph_abs_path = os.path.abspath(graph_path)
+    if graph_abs_path.endswith(".graph"):
+        return graph_abs_path[:-len(".graph")]
+    return graph_abs_path
+
+
+class StringTable(object):
+    """
+    Read-only list of strings stored as a single utf-8 blob plus an offsets array;
+    table[i] returns the i-th string
+    """
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return self.blob[start:end].tobytes().decode("utf-8")
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+
+def build_string_table(strings):
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(s) for s in encoded])
+    # np.frombuffer fails on an empty buffer (numpy 1.13), e.g. for the tables of an empty snapshot
+    blob = np.frombuffer(b"".join(encoded), dtype=np.uint8) if encoded else np.zeros(0, dtype=np.uint8)
+    return blob, offsets
+
+
+class PackageInterner(object):
+    """
+    Assigns dense integer ids to packages, in order of first appearance
+    """
+
+    def __init__(self):
+        self.ids = {}
+        self.packages = []
+
+    def __len__(self):
+        return len(self.packages)
+
+    def get_id(self, package):
+        node_id = self.ids.get(package)
+        if node_id is None:
+            node_id = len(self.packages)
+            self.ids[package] = node_id
+            self.packages.append(package)
+        return node_id
+
+
+class CSRGraph(object):
+    """
+    Directed graph in compressed sparse row format: the out-neighbours of node i are
+    indices[indptr[i]:indptr[i + 1]]. Node i is labeled with packages[i].
+    """
+
+    def __init__(self, indptr, indices, packages):
+        self.indptr = indptr
+        self.indices = indices
+        self.packages = packages
+
+    @property
+    def n_nodes(self):
+        return len(self.indptr) - 1
+
+    @property
+    def n_edges(self):
+        return len(self.indices)
+
+    def get_out_neighbors(self, node_id):
+        return self.indices[self.indptr[node_id]:self.indptr[node_id + 1]]
+
+    def get_out_degrees(self):
+        return np.diff(self.indptr)
+
+    def get_in_degrees(self):
+        return np.bincount(self.indices, minlength=self.n_nodes)
+
+    def get_sources(self):
+        return np.repeat(np.arange(self.n_nodes, dtype=np.int32), self.get_out_degrees())
+
+    def get_subgraph_edges(self, node_ids):
+        """
+        (source, destination) edges of the subgraph induced on node_ids
+        """
+        nodes = set(int(node_id) for node_id in node_ids)
+        edges = []
+        for source in sorted(nodes):
+            edges.extend((source, int(destination)) for destination in self.get_out_neighbors(source)
+                         if destination in nodes)
+        return edges
+
+
+def build_csr(n_nodes, sources, destinations):
+    order = np.argsort(sources, kind="mergesort")
+    indices = np.asarray(destinations, dtype=np.int32)[order]
+    indptr = np.zeros(n_nodes + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum(np.bincount(sources, minlength=n_nodes))
+    return indptr, indices
+
+
+def save_csr_graph(graph_path, packages, sources, destinations):
+    base_path = get_base_path(graph_path)
+    indptr, indices = build_csr(len(packages), sources, destinations)
+    blob, offsets = build_string_table(packages)
+    np.save(base_path + CSR_INDPTR_SUFFIX, indptr)
+    np.save(base_path + CSR_INDICES_SUFFIX, indices)
+    np.save(base_path + PKG_BLOB_SUFFIX, blob)
+    np.save(base_path + PKG_OFFSETS_SUFFIX, offsets)
+
+
+def has_csr_graph(graph_path):
+    base_path = get_base_path(graph_path)
+    for suffix in (CSR_INDPTR_SUFFIX, CSR_INDICES_SUFFIX, PKG_BLOB_SUFFIX, PKG_OFFSETS_SUFFIX):
+        if not os.path.isfile(base_path + suffix):
+            return False
+    return True
+
+
+def load_csr_graph(graph_path, mmap_mode='r'):
+    """
+    Loads the CSR representation written by save_csr_graph; with the default mmap_mode the arrays are
+    memory mapped, so loading is immediate and the pages are shared by all the processes reading the graph
+    """
+    base_path = get_base_path(graph_path)
+    indptr = np.load(base_path + CSR_INDPTR_SUFFIX, mmap_mode=mmap_mode)
+    indices = np.load(base_path + CSR_INDICES_SUFFIX, mmap_mode=mmap_mode)
+    blob = np.load(base_path + PKG_BLOB_SUFFIX, mmap_mode=mmap_mode)
+    offsets = np.load(base_path + PKG_OFFSETS_SUFFIX, mmap_mode=mmap_mode)
+    return CSRGraph(indptr, indices, StringTable(blob, offsets))
@@ -1,12 +1,34 @@
 import calendar
-import datetime
-import time
+
+import numpy as np
+
+# not calendar.month_abbr, which depends on the locale
+MONTHS = dict((abbr, month) for month, abbr in
+              enumerate(["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"], 1))
+
+# the apps share a few thousand distinct dates
+converted_timestamps = {}
 
 
 def play_store_timestamp_to_unix_timestamp(google_play_timestamp):
-    pieces = google_play_timestamp.split()
-    day = int(pieces[0])
-    month = list(calendar.month_abbr).index(pieces[1])
-    year = int(pieces[2])
-    dt = datetime.datetime(year=year, month=month, day=day)
-    return time.mktime(dt.timetuple())
+    """
+    Unix timestamp of the midnight (UTC) of a Play Store date, e.g. "21 Aug 2017"
+    """
+    timestamp = converted_timestamps.get(google_play_timestamp)
+    if timestamp is None:
+        pieces = google_play_timestamp.split()
+        day = int(pieces[0])
+        month = MONTHS[pieces[1]]
+        year = int(pieces[2])
+        timestamp = calendar.timegm((year, month, day, 0, 0, 0))
+        converted_timestamps[google_play_timestamp] = timestamp
+    return timestamp
+
+
+def play_store_timestamps_to_unix_timestamps(google_play_timestamps):
+    """
+    int64 array of the Unix timestamps of a sequence of Play Store dates; each distinct date is parsed once
+    """
+    dates, inverse = np.unique(np.asarray(google_play_timestamps), return_inverse=True)
+    timestamps = np.array([play_store_timestamp_to_unix_timestamp(date) for date in dates], dtype=np.int64)
+    return timestamps[inverse]
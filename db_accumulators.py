@@ -0,0 +1,359 @@
+from array import array
+
+import numpy as np
+import scipy.sparse
+
+import date_tools
+from csr_graph import PackageInterner
+from permission_sets import get_cooccurrence
+from sketches import HyperLogLog, QuantileSketch, SpaceSaving
+from stats_tools import count_values, to_array
+from topk import TopK, top_k, top_k_indices
+
+
+class Accumulator(object):
+    """
+    Collects the data needed by a single statistics section while the apps collection is scanned.
+    fields lists the (dotted) document fields the accumulator reads, so that all the accumulators
+    fed by the same cursor can share a single projection.
+    """
+    fields = ()
+
+    def add(self, doc):
+        raise NotImplementedError
+
+
+def get_app_details(doc):
+    details = doc.get("details")
+    if not details:
+        return {}
+    return details.get("appDetails") or {}
+
+
+class DownloadsAccumulator(Accumulator):
+    fields = ("details.appDetails.numDownloads",)
+
+    def __init__(self):
+        self.buckets = {}
+
+    def add(self, doc):
+        n_downloads = get_app_details(doc).get("numDownloads")
+        if n_downloads is None:
+            return
+        n_downloads = n_downloads.split("+")[0] + "+"
+        self.buckets[n_downloads] = self.buckets.get(n_downloads, 0) + 1
+
+
+class SizeAccumulator(Accumulator):
+    fields = ("docid", "details.appDetails.file")
+
+    def __init__(self, limit=10):
+        self.limit = limit
+        self.top = TopK(limit)
+        self.bottom = TopK(limit, largest=False)
+        self.sizes = array('d')
+
+    def add(self, doc):
+        f = get_app_details(doc).get("file")
+        if not f:
+            return
+        size = f[0].get("size")
+        if size is None:
+            return
+        size = int(size)
+        self.top.push((doc.get("docid"), size))
+        self.bottom.push((doc.get("docid"), size))
+        self.sizes.append(size)
+
+
+class UploadDateAccumulator(Accumulator):
+    """
+    Counts the apps per upload date string; the dates are converted to timestamps only once each
+    """
+    fields = ("details.appDetails.uploadDate",)
+
+    def __init__(self):
+        self.dates = {}
+        self.timestamps = None
+
+    def add(self, doc):
+        date = get_app_details(doc).get("uploadDate")
+        if not date:
+            return
+        self.dates[date] = self.dates.get(date, 0) + 1
+
+    def get_timestamps(self):
+        """
+        Upload timestamp of every app (unless already set, e.g. from a snapshot, computed from the dates counts)
+        """
+        if self.timestamps is None:
+            dates = list(self.dates.keys())
+            counts = [self.dates[date] for date in dates]
+            self.timestamps = np.repeat(date_tools.play_store_timestamps_to_unix_timestamps(dates), counts)
+        return self.timestamps
+
+
+class RatingAccumulator(Accumulator):
+    def __init__(self, rating_field, limit=10):
+        self.rating_field = rating_field
+        self.fields = ("docid", "aggregateRating." + rating_field)
+        self.limit = limit
+        self.top = TopK(limit)
+        self.ratings = array('d')
+
+    def add(self, doc):
+        aggregate_rating = doc.get("aggregateRating")
+        if not aggregate_rating:
+            return
+        rating = aggregate_rating.get(self.rating_field)
+        if not rating:
+            return
+        rating = float(rating)
+        self.top.push((doc.get("docid"), rating))
+        self.ratings.append(rating)
+
+
+def is_android_permission(permission):
+    return permission.startswith('ANDROID.PERMISSION')
+
+
+class PermissionsMatrix(object):
+    """
+    Sparse apps x permissions matrix: matrix[i, j] is how many times the app i requests the permission
+    permissions[j]; get_docid(i) is the package of the app i
+    """
+
+    def __init__(self, matrix, permissions, get_docid):
+        self.matrix = matrix
+        self.permissions = permissions
+        self.get_docid = get_docid
+
+    def get_app_counts(self):
+        return np.asarray(self.matrix.sum(axis=1)).ravel()
+
+    def get_permission_counts(self):
+        return np.asarray(self.matrix.sum(axis=0)).ravel()
+
+    def get_permissions_counter(self):
+        counts = self.get_permission_counts()
+        return dict((self.permissions[i], int(counts[i])) for i in np.flatnonzero(counts))
+
+    def get_n_permissions_buckets(self):
+        return count_values(self.get_app_counts())
+
+    def get_top_requesters(self, limit):
+        app_counts = self.get_app_counts()
+        return [(self.get_docid(i), int(app_counts[i])) for i in top_k_indices(app_counts, limit)]
+
+    def get_cooccurrence(self):
+        """
+        Dense permissions x permissions matrix: [i, j] is the number of apps requesting both permissions
+        (the diagonal is the number of apps requesting each permission)
+        """
+        return get_cooccurrence(self.matrix)
+
+
+class PermissionsAccumulator(Accumulator):
+    """
+    Interns the android permissions (uppercase) requested by every app into the rows of a PermissionsMatrix
+    """
+    fields = ("docid", "details.appDetails.permission")
+
+    def __init__(self):
+        self.interner = PackageInterner()
+        self.docids = []
+        self.indices = array('i')
+        self.indptr = array('l', [0])
+        self.n_apps = 0
+        self.permissions_matrix = None
+
+    def add(self, doc):
+        self.add_permissions(get_app_details(doc).get("permission") or [])
+        self.docids.append(doc.get("docid"))
+
+    def add_permissions(self, permissions):
+        for permission in permissions:
+            permission = permission.upper()
+            if is_android_permission(permission):
+                self.indices.append(self.interner.get_id(permission))
+        self.indptr.append(len(self.indices))
+        self.n_apps += 1
+
+    def get_permissions_matrix(self):
+        if self.permissions_matrix is None:
+            indices = to_array(self.indices)
+            matrix = scipy.sparse.csr_matrix((np.ones(len(indices), dtype=np.int32), indices, to_array(self.indptr)),
+                                             shape=(self.n_apps, len(self.interner)))
+            get_docid = self.docids.__getitem__ if self.docids is not None else None
+            self.permissions_matrix = PermissionsMatrix(matrix, self.interner.packages, get_docid)
+        return self.permissions_matrix
+
+    def get_permissions_counter(self):
+        return self.get_permissions_matrix().get_permissions_counter()
+
+    def get_n_permissions_buckets(self):
+        return self.get_permissions_matrix().get_n_permissions_buckets()
+
+    def get_top_requesters(self, limit):
+        return self.get_permissions_matrix().get_top_requesters(limit)
+
+    def get_cooccurrence(self):
+        return self.get_permissions_matrix().get_cooccurrence()
+
+
+class PermissionSetsAccumulator(PermissionsAccumulator):
+    """
+    Same matrix of PermissionsAccumulator, without the packages of the apps (only the sets of permissions
+    requested together are needed)
+    """
+    fields = ("details.appDetails.permission",)
+
+    def __init__(self):
+        super(PermissionSetsAccumulator, self).__init__()
+        self.docids = None
+
+    def add(self, doc):
+        self.add_permissions(get_app_details(doc).get("permission") or [])
+
+
+class PermissionsSummary(object):
+    """
+    Same interface of PermissionsAccumulator, for permissions statistics already reduced elsewhere
+    (e.g. by the DB server)
+    """
+
+    def __init__(self, permissions_counter, n_permissions_buckets, top_requesters):
+        self.permissions_counter = permissions_counter
+        self.n_permissions_buckets = n_permissions_buckets
+        self.top_requesters = top_requesters
+
+    def get_permissions_counter(self):
+        return dict(self.permissions_counter)
+
+    def get_n_permissions_buckets(self):
+        return dict(self.n_permissions_buckets)
+
+    def get_top_requesters(self, limit):
+        return self.top_requesters[:limit]
+
+
+class CreatorsAccumulator(Accumulator):
+    fields = ("creator",)
+
+    def __init__(self):
+        self.buckets = {}
+
+    def add(self, doc):
+        creator = doc.get("creator")
+        self.buckets[creator] = self.buckets.get(creator, 0) + 1
+
+    def get_top(self, limit):
+        return top_k(self.buckets.items(), limit)
+
+    def get_productivity(self):
+        return count_values(array('l', self.buckets.values()))
+
+
+class CreatorsSummary(object):
+    """
+    Same interface of CreatorsAccumulator, for creators statistics already reduced elsewhere
+    (e.g. by the DB server)
+    """
+
+    def __init__(self, top, productivity):
+        self.top = top
+        self.productivity = productivity
+
+    def get_top(self, limit):
+        return self.top[:limit]
+
+    def get_productivity(self):
+        return dict(self.productivity)
+
+
+class ApproximateSizeAccumulator(SizeAccumulator):
+    """
+    Same as SizeAccumulator, with a QuantileSketch in place of the array of all the sizes
+    """
+
+    def __init__(self, limit=10):
+        super(ApproximateSizeAccumulator, self).__init__(limit)
+        self.sizes = QuantileSketch()
+
+
+class ApproximateRatingAccumulator(RatingAccumulator):
+    """
+    Same as RatingAccumulator, with a QuantileSketch in place of the array of all the ratings
+    """
+
+    def __init__(self, rating_field, limit=10):
+        super(ApproximateRatingAccumulator, self).__init__(rating_field, limit)
+        self.ratings = QuantileSketch()
+
+
+class ApproximatePermissionsAccumulator(Accumulator):
+    """
+    Permissions statistics in constant memory: the distinct android permissions are counted by a HyperLogLog
+    and the most requested ones by a SpaceSaving sketch. The histogram of the number of permissions per app
+    and the top requesters are exact.
+    """
+    fields = ("docid", "details.appDetails.permission")
+
+    def __init__(self, limit=10, capacity=1000):
+        self.distinct = HyperLogLog()
+        self.frequent = SpaceSaving(capacity)
+        self.n_permissions_buckets = {}
+        self.top_requesters = TopK(limit)
+
+    def add(self, doc):
+        n_permissions = 0
+        for permission in get_app_details(doc).get("permission") or []:
+            permission = permission.upper()
+            if is_android_permission(permission):
+                self.distinct.add(permission)
+                self.frequent.add(permission)
+                n_permissions += 1
+        self.n_permissions_buckets[n_permissions] = self.n_permissions_buckets.get(n_permissions, 0) + 1
+        self.top_requesters.push((doc.get("docid"), n_permissions))
+
+    def get_n_permissions_buckets(self):
+        return dict(self.n_permissions_buckets)
+
+    def get_top_requesters(self, limit):
+        return self.top_requesters.get_sorted()[:limit]
+
+
+class ApproximateCreatorsAccumulator(Accumulator):
+    """
+    Creators statistics in constant memory: the distinct creators are counted by a HyperLogLog and the most
+    prolific ones by a SpaceSaving sketch
+    """
+    fields = ("creator",)
+
+    def __init__(self, capacity=10000):
+        self.distinct = HyperLogLog()
+        self.frequent = SpaceSaving(capacity)
+
+    def add(self, doc):
+        creator = doc.get("creator")
+        self.distinct.add(creator)
+        self.frequent.add(creator)
+
+
+def get_projection_fields(accumulators):
+    fields = set()
+    for accumulator in accumulators:
+        fields.update(accumulator.fields)
+    return sorted(fields)
+
+
+def feed(accumulators, docs):
+    """
+    Feeds every document of the cursor to all the accumulators; returns the number of documents read
+    """
+    n_docs = 0
+    for doc in docs:
+        for accumulator in accumulators:
+            accumulator.add(doc)
+        n_docs += 1
+    return n_docs
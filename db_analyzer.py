@@ -1,306 +1,502 @@
 import datetime
-import heapq
 import json
 import numpy as np
 import os
-import re
+import scipy.sparse
 from collections import OrderedDict
-from operator import itemgetter
 
-from rake_nltk import Rake
-
-import date_tools
 import plot_tools
-from db_interface import get_creators, get_all, get_permissions, get_package_by_permissions_size, \
-    get_apps_downloads, get_apps_files, get_apps_upload_date, get_apps_bayesian_ratings, get_apps_star_ratings, \
-    get_descriptions
+from db_accumulators import DownloadsAccumulator, SizeAccumulator, UploadDateAccumulator, RatingAccumulator, \
+    PermissionsAccumulator, PermissionsMatrix, PermissionsSummary, PermissionSetsAccumulator, CreatorsAccumulator, \
+    CreatorsSummary, ApproximateSizeAccumulator, ApproximateRatingAccumulator, ApproximatePermissionsAccumulator, \
+    ApproximateCreatorsAccumulator, feed, get_projection_fields, is_android_permission
+from db_interface import get_fields, count_apps, \
+    get_collection_fingerprint, get_packages_hash, \
+    get_field_frequency, get_top_values, get_values, get_permissions_frequency, get_permissions_size_frequency, \
+    get_permissions_top_requesters, get_android_permissions, \
+    get_creators_top, get_creators_productivity
+from permission_sets import get_frequent_sets, get_lift, get_top_pairs
+from result_cache import ResultCache
+from sketches import QuantileSketch
+from snapshot import Snapshot
+from stats_tools import histogram_mean, histogram_std, histogram_percentile, describe, to_array
+from topk import top_k, bottom_k, top_k_indices
+
+
+def describe_values(values, statistics, name):
+    """
+    Mean, standard deviation, 95th and 99th percentiles of the values, an array or a QuantileSketch (whose
+    percentiles rank error is added to the statistics as <name>_percentiles_rank_error)
+    """
+    if isinstance(values, QuantileSketch):
+        statistics[name + "_percentiles_rank_error"] = values.get_rank_error()
+        return values.describe()
+    return describe(values)
+
+
+def get_histogram_data(values):
+    """
+    (data, weights) to plot the histogram of the values, an array or a QuantileSketch
+    """
+    if isinstance(values, QuantileSketch):
+        return values.get_weighted_values()
+    return to_array(values), None
+
+
+def report_downloads(downloads, statistics, n_apps, title, output):
+    plot_tools.generate_histrogram_strings(downloads.buckets,
+                                           "{0}\nNumber of apps distribution per number of downloads".format(title),
+                                           "# downloads, lower bound", "# apps", output)
+
+
+def report_sizes(sizes, statistics, n_apps, title, output):
+    statistics["biggest_apps"] = sizes.top.get_sorted()
+    statistics["smallest_apps"] = sizes.bottom.get_sorted()
+    values, weights = get_histogram_data(sizes.sizes)
+    mean, std, (perc_95, perc_99) = describe_values(sizes.sizes, statistics, "app_size")
+    statistics["avg_app_size"] = mean
+    statistics["stdev_app_size"] = std
+    statistics["95perc_app_size"] = perc_95
+    statistics["99perc_app_size"] = perc_99
+    print("{0} Computing apps size histogram".format(datetime.datetime.now()))
+    plot_tools.generate_histogram_from_data_log(values,
+                                                [1000, 5000, 10000, 50000, 100000, 500000, 1000000, 5000000,
+                                                 10000000, 50000000, 100000000, 500000000, 1000000000,
+                                                 5000000000],
+                                                "{0}\nNumber of apps distribution per app size".format(title),
+                                                "app size (bytes)", "# apps", output, weights)
+
+
+def report_upload_dates(upload_dates, statistics, n_apps, title, output):
+    timestamps = upload_dates.get_timestamps()
+    statistics["avg_app_timestamp"] = np.mean(timestamps)
+    plot_tools.generate_histogram_from_timestamps(timestamps,
+                                                  "{0}\nNumber of apps distribution per last update time".format(
+                                                      title),
+                                                  "date of last update", "# apps", output)
+
+
+def report_bayesian_ratings(ratings, statistics, n_apps, title, output):
+    statistics["top_bayesian_rated_apps"] = ratings.top.get_sorted()
+    values, weights = get_histogram_data(ratings.ratings)
+    mean, std, (perc_95, perc_99) = describe_values(ratings.ratings, statistics, "bayesian_rating")
+    statistics["avg_bayesian_rating"] = mean
+    statistics["stdev_bayesian_rating"] = std
+    statistics["95perc_bayesian_rating"] = perc_95
+    statistics["99perc_bayesian_rating"] = perc_99
+    print("{0} Computing bayesian rating histogram".format(datetime.datetime.now()))
+    # small dirty trick to force bins alignment
+    if weights is not None:
+        weights = np.append(weights, [1, 1])
+    plot_tools.generate_histogram_from_data(np.append(values, [1, 5]), 16,
+                                            "{0}\nNumber of apps distribution per Bayesian rating".format(title),
+                                            "Bayesian rating", "# apps", output, weights)
+
+
+def report_star_ratings(ratings, statistics, n_apps, title, output):
+    values, weights = get_histogram_data(ratings.ratings)
+    mean, std, (perc_95, perc_99) = describe_values(ratings.ratings, statistics, "star_rating")
+    statistics["avg_star_rating"] = mean
+    statistics["stdev_star_rating"] = std
+    statistics["95perc_star_rating"] = perc_95
+    statistics["99perc_star_rating"] = perc_99
+    print("{0} Computing star rating histogram".format(datetime.datetime.now()))
+    plot_tools.generate_histogram_from_data(values, 16,
+                                            "{0}\nNumber of apps distribution per star rating".format(title),
+                                            "star rating", "# apps", output, weights)
+
+
+def report_permissions_per_app(n_permissions_buckets, statistics, title, output):
+    print("{0} Computing avg and std permissions per app".format(datetime.datetime.now()))
+    statistics["avg_permissions_per_app"] = histogram_mean(n_permissions_buckets)
+    statistics["stdev_permissions_per_app"] = histogram_std(n_permissions_buckets)
+    statistics["95perc_permissions_per_app"] = histogram_percentile(n_permissions_buckets, 95)
+    statistics["99perc_permissions_per_app"] = histogram_percentile(n_permissions_buckets, 99)
+
+    print("{0} Computing # permissions requests histogram".format(datetime.datetime.now()))
+    plot_tools.generate_histogram(n_permissions_buckets,
+                                  "{0}\nNumber of apps distribution per number of permissions requested".format(
+                                      title),
+                                  "# permissions requested", "# apps", output)
+
+
+def report_permissions(permissions, statistics, n_apps, title, output):
+    permissions_counter = permissions.get_permissions_counter()
+    statistics["n_permissions"] = len(permissions_counter.keys())
+    report_permissions_per_app(permissions.get_n_permissions_buckets(), statistics, title, output)
+
+    print("{0} Computing top and bottom 10 requested permissions".format(datetime.datetime.now()))
+    top_10_pairs = []
+    for permission, n_requests in top_k(permissions_counter.items(), 10):
+        top_10_pairs.append((permission, float(n_requests) / n_apps * 100))
+    statistics["most_requested_permissions"] = top_10_pairs
+
+    bottom_10_pairs = []
+    for permission, n_requests in bottom_k(permissions_counter.items(), 10):
+        bottom_10_pairs.append((permission, float(n_requests) / n_apps * 100))
+    statistics["less_requested_permissions"] = bottom_10_pairs
+
+    print("{0} Computing top permissions requesters".format(datetime.datetime.now()))
+    statistics["top_permissions_requesters"] = permissions.get_top_requesters(10)
+
+
+def report_permissions_approximate(permissions, statistics, n_apps, title, output):
+    """
+    Same as report_permissions, for an ApproximatePermissionsAccumulator: the least requested permissions
+    are not reported, the error bounds of the approximate statistics are
+    """
+    statistics["n_permissions"] = permissions.distinct.get_estimate()
+    statistics["n_permissions_relative_error"] = permissions.distinct.get_relative_error()
+    report_permissions_per_app(permissions.get_n_permissions_buckets(), statistics, title, output)
+
+    print("{0} Computing top 10 requested permissions".format(datetime.datetime.now()))
+    top_10 = permissions.frequent.get_top(10)
+    statistics["most_requested_permissions"] = [(permission, float(n_requests) / n_apps * 100)
+                                                for permission, n_requests, _ in top_10]
+    # the true percentage of a listed permission is at most max_error less, the one of an unlisted permission is
+    # at most max_unlisted
+    statistics["most_requested_permissions_max_error"] = max([float(error) / n_apps * 100
+                                                              for _, _, error in top_10] or [0.0])
+    statistics["most_requested_permissions_max_unlisted"] = float(permissions.frequent.floor) / n_apps * 100
+
+    print("{0} Computing top permissions requesters".format(datetime.datetime.now()))
+    statistics["top_permissions_requesters"] = permissions.get_top_requesters(10)
+
+
+# fraction of the apps that must request a permissions set for it to be frequent
+MIN_PERMISSION_SET_SUPPORT = 0.01
+
+
+def report_permission_sets(permissions, statistics, n_apps, title, output):
+    permissions_matrix = permissions.get_permissions_matrix()
+    names = permissions_matrix.permissions
+    min_count = max(1, int(np.ceil(MIN_PERMISSION_SET_SUPPORT * n_apps)))
+    print("{0} Computing permissions co-occurrence".format(datetime.datetime.now()))
+    cooccurrence = permissions_matrix.get_cooccurrence()
+    statistics["top_cooccurring_permissions"] = [(names[i], names[j], float(count) / n_apps * 100)
+                                                 for i, j, count in get_top_pairs(cooccurrence, 10)]
+    lift = get_lift(cooccurrence, n_apps)
+    statistics["top_lift_permission_pairs"] = [(names[i], names[j], float(value))
+                                               for i, j, value in get_top_pairs(lift, 10, cooccurrence >= min_count)]
+
+    print("{0} Computing frequent permission sets".format(datetime.datetime.now()))
+    frequent_sets = top_k(get_frequent_sets(permissions_matrix.matrix, cooccurrence, min_count), 20)
+    statistics["frequent_permission_sets"] = [([names[i] for i in ids], float(count) / n_apps * 100)
+                                              for ids, count in frequent_sets]
+
+    print("{0} Computing permissions co-occurrence heatmap".format(datetime.datetime.now()))
+    top_ids = np.sort(top_k_indices(np.diag(cooccurrence), 30))
+    labels = [names[i].replace("ANDROID.PERMISSION.", "") for i in top_ids]
+    plot_tools.generate_heatmap(cooccurrence[np.ix_(top_ids, top_ids)] * 100.0 / max(n_apps, 1), labels,
+                                "{0}\nCo-occurrence of the 30 most requested permissions".format(title),
+                                "% of apps requesting both permissions", output)
+
+
+def report_creators(creators, statistics, n_apps, title, output):
+    productivity = creators.get_productivity()
+    statistics["n_apps"] = n_apps
+    statistics["n_creators"] = sum(productivity.values())
+
+    print("{0} Computing top 10 prolific creators".format(datetime.datetime.now()))
+    top_10_pairs = creators.get_top(10)
+    statistics["most_prolific_creators"] = top_10_pairs
+
+    print("{0} Computing creators productivity histogram excluding top 10".format(datetime.datetime.now()))
+    productivity_buckets = dict(productivity)
+    for developer, n_released in top_10_pairs:
+        productivity_buckets[n_released] -= 1
+        if productivity_buckets[n_released] == 0:
+            del productivity_buckets[n_released]
+
+    plot_tools.generate_histogram(productivity_buckets,
+                                  "{0}\nNumber of developers distribution per number of apps released\n".format(
+                                      title) +
+                                  "(excluding top 10 most prolific developers)",
+                                  "# apps released", "# developers", output)
 
+    print("{0} Computing avg and std apps per creator".format(datetime.datetime.now()))
+    statistics["avg_apps_per_creator"] = histogram_mean(productivity)
+    statistics["stdev_apps_per_creator"] = histogram_std(productivity)
+    statistics["95perc_apps_per_creator"] = histogram_percentile(productivity, 95)
+    statistics["99perc_apps_per_creator"] = histogram_percentile(productivity, 99)
 
-def compute_db_statistics(stats_path, packages, title, overwrite):
+
+def report_creators_approximate(creators, statistics, n_apps, title, output):
+    """
+    Same as report_creators, for an ApproximateCreatorsAccumulator: only the number of creators, the most
+    prolific ones and the average apps per creator are reported, with their error bounds
+    """
+    statistics["n_apps"] = n_apps
+    statistics["n_creators"] = creators.distinct.get_estimate()
+    statistics["n_creators_relative_error"] = creators.distinct.get_relative_error()
+
+    print("{0} Computing top 10 prolific creators".format(datetime.datetime.now()))
+    top_10 = creators.frequent.get_top(10)
+    statistics["most_prolific_creators"] = [(creator, n_released) for creator, n_released, _ in top_10]
+    statistics["most_prolific_creators_max_error"] = max([error for _, _, error in top_10] or [0])
+    statistics["most_prolific_creators_max_unlisted"] = creators.frequent.floor
+    statistics["avg_apps_per_creator"] = float(n_apps) / max(statistics["n_creators"], 1)
+
+
+# (name, output file suffix, statistics keys, accumulator factory, report function, description)
+DB_STATISTICS_SECTIONS = [
+    ("downloads", ".downloads.eps", [], DownloadsAccumulator, report_downloads, "# downloads histogram"),
+    ("apps_size", ".apps_size.eps", ["biggest_apps"], SizeAccumulator, report_sizes, "app size statistics"),
+    ("app_last_updates", ".app_last_updates.eps", [], UploadDateAccumulator, report_upload_dates,
+     "apps updates histogram"),
+    ("bayesian_ratings", ".bayesian_ratings.eps", ["avg_bayesian_rating"],
+     lambda: RatingAccumulator("bayesianMeanRating"), report_bayesian_ratings, "apps bayesian rating statistics"),
+    ("star_ratings", ".star_ratings.eps", ["avg_star_rating"], lambda: RatingAccumulator("starRating"),
+     report_star_ratings, "apps star rating statistics"),
+    ("permissions_requests", ".permissions_requests.eps",
+     ["n_permissions", "avg_permissions_per_app", "most_requested_permissions", "top_permissions_requesters"],
+     PermissionsAccumulator, report_permissions, "# of permissions"),
+    ("permission_sets", ".permission_sets.eps",
+     ["top_cooccurring_permissions", "top_lift_permission_pairs", "frequent_permission_sets"],
+     PermissionSetsAccumulator, report_permission_sets, "permissions co-occurrence and frequent sets"),
+    ("creators_productivity", ".creators_productivity.eps",
+     ["n_creators", "most_prolific_creators", "avg_apps_per_creator", "95perc_apps_per_creator"],
+     CreatorsAccumulator, report_creators, "# of creators"),
+]
+
+
+# --approximate sections, in constant memory: (name, output file suffix or None, statistics keys, accumulator
+# factory, report function, description); the downloads and update dates histograms are small, so exact
+APPROXIMATE_DB_STATISTICS_SECTIONS = [
+    ("downloads", ".approximate.downloads.eps", [], DownloadsAccumulator, report_downloads, "# downloads histogram"),
+    ("apps_size", ".approximate.apps_size.eps", ["biggest_apps", "app_size_percentiles_rank_error"],
+     ApproximateSizeAccumulator, report_sizes, "app size statistics"),
+    ("app_last_updates", ".approximate.app_last_updates.eps", [], UploadDateAccumulator, report_upload_dates,
+     "apps updates histogram"),
+    ("bayesian_ratings", ".approximate.bayesian_ratings.eps", ["avg_bayesian_rating"],
+     lambda: ApproximateRatingAccumulator("bayesianMeanRating"), report_bayesian_ratings,
+     "apps bayesian rating statistics"),
+    ("star_ratings", ".approximate.star_ratings.eps", ["avg_star_rating"],
+     lambda: ApproximateRatingAccumulator("starRating"), report_star_ratings, "apps star rating statistics"),
+    ("permissions_requests", ".approximate.permissions_requests.eps",
+     ["n_permissions", "avg_permissions_per_app", "most_requested_permissions", "top_permissions_requesters"],
+     ApproximatePermissionsAccumulator, report_permissions_approximate, "# of permissions"),
+    ("creators_productivity", None, ["n_creators", "most_prolific_creators", "avg_apps_per_creator"],
+     ApproximateCreatorsAccumulator, report_creators_approximate, "# of creators"),
+]
+
+
+SIZE_EXPRESSION = {"$arrayElemAt": ["$details.appDetails.file.size", 0]}
+
+
+def collect_server_side(accumulators, packages, materialized_counts=False):
+    """
+    Fills the accumulators using aggregation pipelines executed by the DB server. Only the values
+    needed for exact percentiles and histograms of continuous fields (sizes and ratings) are
+    streamed back, projected to a single scalar each. With materialized_counts, the top permission
+    requesters are read from the permissionCount field stored by --prepare-db.
+    """
+    collected = []
+    value_streams = []
+    for accumulator in accumulators:
+        if isinstance(accumulator, DownloadsAccumulator):
+            for doc in get_field_frequency(packages, "details.appDetails.numDownloads"):
+                if doc["_id"] is None:
+                    continue
+                bucket = doc["_id"].split("+")[0] + "+"
+                accumulator.buckets[bucket] = accumulator.buckets.get(bucket, 0) + doc["count"]
+        elif isinstance(accumulator, UploadDateAccumulator):
+            for doc in get_field_frequency(packages, "details.appDetails.uploadDate"):
+                if not doc["_id"]:
+                    continue
+                accumulator.dates[doc["_id"]] = accumulator.dates.get(doc["_id"], 0) + doc["count"]
+        elif isinstance(accumulator, SizeAccumulator):
+            accumulator.top.extend((doc["docid"], int(doc["value"]))
+                                   for doc in get_top_values(packages, SIZE_EXPRESSION, accumulator.limit, -1))
+            accumulator.bottom.extend((doc["docid"], int(doc["value"]))
+                                      for doc in get_top_values(packages, SIZE_EXPRESSION, accumulator.limit, 1))
+            value_streams.append(("size", SIZE_EXPRESSION, lambda v: v is not None, int, accumulator.sizes))
+        elif isinstance(accumulator, RatingAccumulator):
+            expression = "$aggregateRating." + accumulator.rating_field
+            accumulator.top.extend((doc["docid"], float(doc["value"]))
+                                   for doc in get_top_values(packages, expression, accumulator.limit, -1,
+                                                             excluded=(None, 0, "")))
+            value_streams.append((accumulator.rating_field, expression, bool, float, accumulator.ratings))
+        elif isinstance(accumulator, PermissionSetsAccumulator):
+            for doc in get_android_permissions(packages):
+                accumulator.add_permissions(doc.get("permissions") or [])
+        elif isinstance(accumulator, PermissionsAccumulator):
+            permissions_counter = {}
+            for doc in get_permissions_frequency(packages):
+                permissions_counter[doc["_id"]] = doc["count"]
+            n_permissions_buckets = {}
+            for doc in get_permissions_size_frequency(packages):
+                n_permissions_buckets[doc["_id"]] = doc["count"]
+            top_requesters = [(doc["docid"], doc["value"])
+                              for doc in get_permissions_top_requesters(packages, 10, materialized_counts)]
+            accumulator = PermissionsSummary(permissions_counter, n_permissions_buckets, top_requesters)
+        elif isinstance(accumulator, CreatorsAccumulator):
+            top = [(doc["_id"], doc["count"]) for doc in get_creators_top(packages, 10)]
+            productivity = {}
+            for doc in get_creators_productivity(packages):
+                productivity[doc["_id"]] = doc["creators"]
+            accumulator = CreatorsSummary(top, productivity)
+        collected.append(accumulator)
+
+    if value_streams:
+        print("{0} Streaming values for percentiles".format(datetime.datetime.now()))
+        expressions = dict((key, expression) for key, expression, _, _, _ in value_streams)
+        for doc in get_values(packages, expressions):
+            for key, _, is_valid, cast, values in value_streams:
+                value = doc.get(key)
+                if is_valid(value):
+                    values.append(cast(value))
+    return collected
+
+
+SNAPSHOT_RATING_COLUMNS = {"bayesianMeanRating": "bayesian_ratings", "starRating": "star_ratings"}
+
+
+def get_nonzero_counts(ids, table):
+    """
+    {table string: occurrences} of the ids (-1, i.e. missing, is counted as None)
+    """
+    counts = np.bincount(ids[ids >= 0], minlength=len(table))
+    frequency = dict((table[i], int(counts[i])) for i in np.flatnonzero(counts))
+    n_missing = int(np.count_nonzero(ids < 0))
+    if n_missing:
+        frequency[None] = n_missing
+    return frequency
+
+
+def collect_from_snapshot(accumulators, snapshot, packages):
+    """
+    Fills the accumulators from the columns of an exported snapshot with vectorized operations, without
+    reading the DB; returns the number of apps
+    """
+    rows = snapshot.get_rows_mask(packages)
+    package_table = snapshot.get_table("packages")
+    for accumulator in accumulators:
+        if isinstance(accumulator, DownloadsAccumulator):
+            for n_downloads, count in get_nonzero_counts(snapshot.download_ids[rows],
+                                                         snapshot.get_table("downloads")).items():
+                if n_downloads is None:
+                    continue
+                bucket = n_downloads.split("+")[0] + "+"
+                accumulator.buckets[bucket] = accumulator.buckets.get(bucket, 0) + count
+        elif isinstance(accumulator, UploadDateAccumulator):
+            timestamps = snapshot.upload_dates[rows]
+            accumulator.timestamps = timestamps[~np.isnan(timestamps)]
+        elif isinstance(accumulator, SizeAccumulator):
+            valid_rows = np.flatnonzero(rows & (snapshot.sizes >= 0))
+            sizes = snapshot.sizes[valid_rows]
+            for scores, top in ((sizes, accumulator.top), (-sizes, accumulator.bottom)):
+                top.extend((package_table[snapshot.package_ids[valid_rows[i]]], int(sizes[i]))
+                           for i in top_k_indices(scores, accumulator.limit))
+            accumulator.sizes = sizes
+        elif isinstance(accumulator, RatingAccumulator):
+            column = getattr(snapshot, SNAPSHOT_RATING_COLUMNS[accumulator.rating_field])
+            valid_rows = np.flatnonzero(rows & ~np.isnan(column))
+            ratings = column[valid_rows]
+            accumulator.top.extend((package_table[snapshot.package_ids[valid_rows[i]]], float(ratings[i]))
+                                   for i in top_k_indices(ratings, accumulator.limit))
+            accumulator.ratings = ratings
+        elif isinstance(accumulator, PermissionsAccumulator):
+            names = [permission.upper() for permission in snapshot.get_table("permissions")]
+            is_android = np.array([is_android_permission(name) for name in names], dtype=bool)
+            unique_names = sorted(set(name for name in names if is_android_permission(name)))
+            # only the ids of android permissions are used
+            name_ids = np.searchsorted(unique_names, names) if names else np.zeros(0, dtype=np.int64)
+            element_rows = snapshot.get_list_rows(snapshot.permission_offsets)
+            selected = rows[element_rows] & is_android[snapshot.permission_ids]
+            selected_rows = np.flatnonzero(rows)
+            # rows of the matrix are the selected apps only
+            matrix_rows = np.searchsorted(selected_rows, element_rows[selected])
+            matrix = scipy.sparse.csr_matrix((np.ones(len(matrix_rows), dtype=np.int32),
+                                              (matrix_rows, name_ids[snapshot.permission_ids[selected]])),
+                                             shape=(len(selected_rows), len(unique_names)))
+            accumulator.permissions_matrix = PermissionsMatrix(
+                matrix, unique_names, lambda i: package_table[snapshot.package_ids[selected_rows[i]]])
+        elif isinstance(accumulator, CreatorsAccumulator):
+            accumulator.buckets = get_nonzero_counts(snapshot.creator_ids[rows], snapshot.get_table("creators"))
+    return int(np.count_nonzero(rows))
+
+
+def compute_db_statistics(stats_path, packages, title, overwrite, server_side=False, cache_size=None,
+                          invalidate=None, snapshot_path=None, jobs=1, approximate=False, materialized_counts=False):
+    """
+    Computes the statistics of the apps in the DB or, if snapshot_path is given, in an exported snapshot.
+    The apps are read by jobs threads, and the plots are rendered by a pool of jobs processes while the
+    statistics are computed.
+    With approximate, the DB is scanned keeping sketches of constant size instead of all the values: the
+    statistics, with their error bounds, are saved to a separate .db_statistics.approximate.json file.
+    materialized_counts (only with server_side) uses the count fields stored by --prepare-db.
+    """
+    if approximate and (server_side or snapshot_path):
+        raise ValueError("The approximate statistics are computed scanning the DB, not on the server or from a "
+                         "snapshot")
+    if materialized_counts and not server_side:
+        raise ValueError("The materialized counts are used only by the server side statistics")
     stats_abs_path = os.path.abspath(stats_path)
-    json_path = os.path.abspath(stats_abs_path + ".db_statistics.json")
+    if approximate:
+        json_path = os.path.abspath(stats_abs_path + ".db_statistics.approximate.json")
+        sections = APPROXIMATE_DB_STATISTICS_SECTIONS
+    else:
+        json_path = os.path.abspath(stats_abs_path + ".db_statistics.json")
+        sections = DB_STATISTICS_SECTIONS
     if os.path.isfile(json_path):
         with open(json_path, "r") as f:
             statistics = json.load(f, object_pairs_hook=OrderedDict)
     else:
         statistics = OrderedDict()
 
-    n_apps = get_all(packages).count()
+    cache = ResultCache(stats_abs_path + "_cache", cache_size)
+    if invalidate:
+        print("{0} Invalidated {1} cache entries".format(datetime.datetime.now(), cache.invalidate(invalidate)))
+    snapshot = None
+    if snapshot_path:
+        snapshot = Snapshot(snapshot_path)
+        fingerprint = {"snapshot": cache.get_file_fingerprint(snapshot.path),
+                       "packages": get_packages_hash(packages) if packages else None}
+    else:
+        fingerprint = get_collection_fingerprint(packages)
+    params = {"title": title}
+    if approximate:
+        params["approximate"] = True
+    if materialized_counts:
+        params["materialized_counts"] = True
 
-    # statistics about number of downloads
-    downloads_histogram_path = os.path.abspath(stats_abs_path + ".downloads.eps")
-    if not os.path.isfile(downloads_histogram_path) or overwrite:
-        print("{0} Computing # downloads histogram".format(datetime.datetime.now()))
-        dl_buckets = {}
-        for doc in get_apps_downloads(packages):
-            try:
-                n_downloads = doc.get("details").get("appDetails").get("numDownloads")
-                if n_downloads is None:
-                    continue
-                n_downloads = n_downloads.split("+")[0] + "+"
-                dl_buckets[n_downloads] = dl_buckets.get(n_downloads, 0) + 1
-            except AttributeError:
-                continue
-        plot_tools.generate_histrogram_strings(dl_buckets,
-                                               "{0}\nNumber of apps distribution per number of downloads".format(title),
-                                               "# downloads, lower bound", "# apps", downloads_histogram_path)
-
-    # statistics about app size
-    size_histogram_path = os.path.abspath(stats_abs_path + ".apps_size.eps")
-    if not os.path.isfile(size_histogram_path) or "biggest_apps" not in statistics or overwrite:
-        print("{0} Computing app size statistics".format(datetime.datetime.now()))
-        top_10 = []
-        bottom_10 = []
-        sizes = []
-        for doc in get_apps_files(packages):
-            try:
-                f = doc.get("details").get("appDetails").get("file")
-                if f:
-                    size = f[0].get("size")
-                else:
-                    continue
-            except AttributeError:
-                continue
-            if size is None:
-                continue
+    # every section that needs to be (re)computed is fed by the same cursor
+    pending = []
+    for name, suffix, keys, accumulator_factory, report, description in sections:
+        output = os.path.abspath(stats_abs_path + suffix) if suffix else None
+        cached = None if overwrite else cache.get_json(name, fingerprint, params)
+        if cached is not None:
+            statistics.update(cached)
+        if cached is None or (output and not os.path.isfile(output)) or any(key not in statistics for key in keys):
+            pending.append((name, accumulator_factory(), report, description, output))
+
+    if pending:
+        # started before the scan, so that the workers don't inherit the accumulators memory
+        plot_tools.start_render_queue(jobs)
+        try:
+            accumulators = [section[1] for section in pending]
+            if snapshot is not None:
+                print("{0} Reading {1} sections from the snapshot".format(datetime.datetime.now(), len(pending)))
+                n_apps = collect_from_snapshot(accumulators, snapshot, packages)
+            elif server_side:
+                print("{0} Aggregating {1} sections on the DB server".format(datetime.datetime.now(), len(pending)))
+                n_apps = count_apps(packages)
+                accumulators = collect_server_side(accumulators, packages, materialized_counts)
             else:
-                size = int(size)
-            if not top_10 or size > min(top_10, key=itemgetter(1))[1]:
-                pkg = doc.get("docid")
-                if len(top_10) == 10:
-                    top_10.remove(min(top_10, key=itemgetter(1)))
-                top_10.append((pkg, size))
-
-            if not bottom_10 or size < max(bottom_10, key=itemgetter(1))[1]:
-                pkg = doc.get("docid")
-                if len(bottom_10) == 10:
-                    bottom_10.remove(max(bottom_10, key=itemgetter(1)))
-                bottom_10.append((pkg, size))
-
-            sizes.append(size)
-        top_10.sort(key=itemgetter(1))
-        bottom_10.sort(key=itemgetter(1))
-        statistics["biggest_apps"] = list(reversed(top_10))
-        statistics["smallest_apps"] = bottom_10
-        statistics["avg_app_size"] = np.mean(sizes)
-        statistics["stdev_app_size"] = np.std(sizes)
-        statistics["95perc_app_size"] = np.percentile(sizes, 95)
-        statistics["99perc_app_size"] = np.percentile(sizes, 99)
-        print("{0} Computing apps size histogram".format(datetime.datetime.now()))
-        plot_tools.generate_histogram_from_data_log(sizes,
-                                                    [1000, 5000, 10000, 50000, 100000, 500000, 1000000, 5000000,
-                                                     10000000, 50000000, 100000000, 500000000, 1000000000,
-                                                     5000000000],
-                                                    "{0}\nNumber of apps distribution per app size".format(title),
-                                                    "app size (bytes)", "# apps", size_histogram_path)
-
-    # statistics about latest apps update
-    update_histogram_path = os.path.abspath(stats_abs_path + ".app_last_updates.eps")
-    if not os.path.isfile(update_histogram_path) or overwrite:
-        print("{0} Computing apps updates histogram".format(datetime.datetime.now()))
-        timestamps = []
-        for doc in get_apps_upload_date(packages):
-            try:
-                date = doc.get("details").get("appDetails").get("uploadDate")
-                if not date:
-                    continue
-                upload_timestamp = date_tools.play_store_timestamp_to_unix_timestamp(date)
-                timestamps.append(upload_timestamp)
-            except AttributeError:
-                continue
-        statistics["avg_app_timestamp"] = np.mean(timestamps)
-        plot_tools.generate_histogram_from_timestamps(timestamps,
-                                                      "{0}\nNumber of apps distribution per last update time".format(
-                                                          title),
-                                                      "date of last update", "# apps", update_histogram_path)
-
-    # statistics about bayesian rating
-    bayesian_histogram_path = os.path.abspath(stats_abs_path + ".bayesian_ratings.eps")
-    if not os.path.isfile(bayesian_histogram_path) or "avg_bayesian_rating" not in statistics or overwrite:
-        print("{0} Computing apps bayesian rating statistics".format(datetime.datetime.now()))
-        top_10 = []
-        ratings = []
-        for doc in get_apps_bayesian_ratings(packages):
-            try:
-                rating = doc.get("aggregateRating").get("bayesianMeanRating")
-                if rating:
-                    rating = float(rating)
-                else:
-                    continue
-            except AttributeError:
-                continue
-            if not top_10 or rating > min(top_10, key=itemgetter(1))[1]:
-                pkg = doc.get("docid")
-                if len(top_10) == 10:
-                    top_10.remove(min(top_10, key=itemgetter(1)))
-                top_10.append((pkg, rating))
-            ratings.append(rating)
-
-        top_10.sort(key=itemgetter(1))
-        statistics["top_bayesian_rated_apps"] = list(reversed(top_10))
-        statistics["avg_bayesian_rating"] = np.mean(ratings)
-        statistics["stdev_bayesian_rating"] = np.std(ratings)
-        statistics["95perc_bayesian_rating"] = np.percentile(ratings, 95)
-        statistics["99perc_bayesian_rating"] = np.percentile(ratings, 99)
-        print("{0} Computing bayesian rating histogram".format(datetime.datetime.now()))
-        # small dirty trick to force bins alignment
-        ratings.append(1)
-        ratings.append(5)
-        plot_tools.generate_histogram_from_data(ratings, 16,
-                                                "{0}\nNumber of apps distribution per Bayesian rating".format(title),
-                                                "Bayesian rating", "# apps", bayesian_histogram_path)
-
-    # statistics about star rating
-    star_histogram_path = os.path.abspath(stats_abs_path + ".star_ratings.eps")
-    if not os.path.isfile(star_histogram_path) or "avg_star_rating" not in statistics or overwrite:
-        print("{0} Computing apps star rating statistics".format(datetime.datetime.now()))
-        ratings = []
-        for doc in get_apps_star_ratings(packages):
-            try:
-                rating = doc.get("aggregateRating").get("starRating")
-                if rating:
-                    rating = float(rating)
-                else:
-                    continue
-            except AttributeError:
-                continue
-            ratings.append(rating)
-
-        statistics["avg_star_rating"] = np.mean(ratings)
-        statistics["stdev_star_rating"] = np.std(ratings)
-        statistics["95perc_star_rating"] = np.percentile(ratings, 95)
-        statistics["99perc_star_rating"] = np.percentile(ratings, 99)
-        print("{0} Computing star rating histogram".format(datetime.datetime.now()))
-        plot_tools.generate_histogram_from_data(ratings, 16,
-                                                "{0}\nNumber of apps distribution per star rating".format(title),
-                                                "star rating", "# apps", star_histogram_path)
-
-    # statistics about permissions request
-    permissions_histogram_path = os.path.abspath(stats_abs_path + ".permissions_requests.eps")
-    if not os.path.isfile(permissions_histogram_path) or "n_permissions" not in statistics \
-            or "avg_permissions_per_app" not in statistics or "most_requested_permissions" not in statistics \
-            or "top_permissions_requesters" not in statistics or overwrite:
-        print("{0} Computing # of permissions".format(datetime.datetime.now()))
-        n_permissions_buckets = {}
-        permissions_counter = {}
-        n_permissions_list = []
-        for doc in get_permissions(packages):
-            try:
-                permissions = doc.get("details").get("appDetails").get("permission")
-            except AttributeError:
-                permissions = []
-            if permissions is None:
-                permissions = []
-            permissions = [p for p in permissions if p.upper().startswith('ANDROID.PERMISSION')]
-            n_permissions_list.append(len(permissions))
-            n_permissions_buckets[len(permissions)] = n_permissions_buckets.get(len(permissions), 0) + 1
-            for permission in permissions:
-                permission = permission.upper()
-                permissions_counter[permission] = permissions_counter.get(permission, 0) + 1
-        statistics["n_permissions"] = len(permissions_counter.keys())
-        print("{0} Computing avg and std permissions per app".format(datetime.datetime.now()))
-        statistics["avg_permissions_per_app"] = np.mean(n_permissions_list)
-        statistics["stdev_permissions_per_app"] = np.std(n_permissions_list)
-        statistics["95perc_permissions_per_app"] = np.percentile(n_permissions_list, 95)
-        statistics["99perc_permissions_per_app"] = np.percentile(n_permissions_list, 99)
-
-        print("{0} Computing top and bottom 10 requested permissions".format(datetime.datetime.now()))
-        top_10 = heapq.nlargest(10, permissions_counter, key=permissions_counter.get)
-        top_10_pairs = []
-        for permission in top_10:
-            top_10_pairs.append((permission, float(permissions_counter[permission]) / n_apps * 100))
-        statistics["most_requested_permissions"] = top_10_pairs
-
-        bottom_10 = heapq.nsmallest(10, permissions_counter, key=permissions_counter.get)
-        bottom_10_pairs = []
-        for permission in bottom_10:
-            bottom_10_pairs.append((permission, float(permissions_counter[permission]) / n_apps * 100))
-        statistics["less_requested_permissions"] = bottom_10_pairs
-
-        print("{0} Computing # permissions requests histogram".format(datetime.datetime.now()))
-        plot_tools.generate_histogram(n_permissions_buckets,
-                                      "{0}\nNumber of apps distribution per number of permissions requested".format(
-                                          title),
-                                      "# permissions requested", "# apps", permissions_histogram_path)
-
-        print("{0} Computing top permissions requesters".format(datetime.datetime.now()))
-        top_10 = heapq.nlargest(10, n_permissions_buckets.keys())
-        top_10_pairs = []
-        counter = 0
-        for n_permissions in top_10:
-            docs = get_package_by_permissions_size(n_permissions)
-            for doc in docs:
-                top_10_pairs.append((doc.get("docid"), n_permissions))
-                counter += 1
-                if counter == 10:
-                    break
-            if counter == 10:
-                break
-        statistics["top_permissions_requesters"] = top_10_pairs
-
-    creators_histogram_path = os.path.abspath(stats_abs_path + ".creators_productivity.eps")
-    if not os.path.isfile(creators_histogram_path) or "n_creators" not in statistics \
-            or "most_prolific_creators" not in statistics or "avg_apps_per_creator" not in statistics \
-            or "95perc_apps_per_creator" not in statistics or overwrite:
-
-        print("{0} Computing # of creators".format(datetime.datetime.now()))
-        buckets = {}
-        for doc in get_creators(packages):
-            creator = doc.get("creator")
-            buckets[creator] = buckets.get(creator, 0) + 1
-        statistics["n_apps"] = n_apps
-        statistics["n_creators"] = len(buckets.keys())
-
-        print("{0} Computing top 10 prolific creators".format(datetime.datetime.now()))
-        top_10 = heapq.nlargest(10, buckets, key=buckets.get)
-        top_10_pairs = []
-        for developer in top_10:
-            top_10_pairs.append((developer, buckets[developer]))
-        statistics["most_prolific_creators"] = top_10_pairs
-
-        print("{0} Computing creators productivity histogram excluding top 10".format(datetime.datetime.now()))
-        productivity_buckets = {}
-        for key in buckets.keys():
-            if key in top_10:
-                continue
-            productivity_buckets[buckets[key]] = productivity_buckets.get(buckets[key], 0) + 1
-
-        plot_tools.generate_histogram(productivity_buckets,
-                                      "{0}\nNumber of developers distribution per number of apps released\n".format(
-                                          title) +
-                                      "(excluding top 10 most prolific developers)",
-                                      "# apps released", "# developers", creators_histogram_path)
-
-        print("{0} Computing avg and std apps per creator".format(datetime.datetime.now()))
-        statistics["avg_apps_per_creator"] = np.mean(buckets.values())
-        statistics["stdev_apps_per_creator"] = np.std(buckets.values())
-        statistics["95perc_apps_per_creator"] = np.percentile(buckets.values(), 95)
-        statistics["99perc_apps_per_creator"] = np.percentile(buckets.values(), 99)
+                print("{0} Scanning apps for {1} sections".format(datetime.datetime.now(), len(pending)))
+                n_apps = feed(accumulators, get_fields(packages, get_projection_fields(accumulators), jobs))
+            for accumulator, (name, _, report, description, output) in zip(accumulators, pending):
+                print("{0} Computing {1}".format(datetime.datetime.now(), description))
+                section_statistics = OrderedDict()
+                report(accumulator, section_statistics, n_apps, title, output)
+                statistics.update(section_statistics)
+                cache.put_json(name, fingerprint, params, section_statistics)
+        finally:
+            print("{0} Waiting for the plots".format(datetime.datetime.now()))
+            for output, error in plot_tools.stop_render_queue().items():
+                print("{0} Plot {1} failed:\n{2}".format(datetime.datetime.now(), output, error))
+    cache.write_manifest()
 
     with open(json_path, 'w') as outfile:
         json.dump(statistics, outfile, indent=2)
-
-
-def extract_keywords(dump_path, packages):
-    print("{0} Gathering descriptions and computing keywords...".format(datetime.datetime.now()))
-    rake = Rake()
-    keywords = {}
-    for doc in get_descriptions(packages):
-        try:
-            if "translatedDescriptionHtml" in doc:
-                html_description = unicode(doc.get("translatedDescriptionHtml"))
-            else:
-                html_description = unicode(doc.get("descriptionHtml"))
-            # remove html elements
-            description = re.sub(r'<.*?>', '', html_description)
-            # substitute non-ascii chars with stop words (e.g. dot)
-            description = re.sub(r'[^\x00-\x7F]+', ' . ', description)
-            rake.extract_keywords_from_text(description)
-            ranking = rake.get_ranked_phrases_with_scores()
-            for pair in ranking:
-                keywords[pair[1]] = keywords.get(pair[1], 0) + pair[0]
-        except AttributeError:
-            continue
-    sorted_keywords = sorted(keywords.items(), key=itemgetter(1))
-    with open(dump_path, 'w') as outfile:
-        json.dump(sorted_keywords, outfile, indent=2)
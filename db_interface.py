@@ -1,118 +1,496 @@
+import atexit
+import functools
+import hashlib
+import os
+import random
+import threading
+import time
+import traceback
+from multiprocessing.pool import ThreadPool
+
 import pymongo
 from pymongo.errors import AutoReconnect
-from retry_decorator import retry
 
-from config import dbconf
+try:
+    from Queue import Full, Queue
+except ImportError:
+    from queue import Full, Queue
 
 COL_PLAYSTORE_SNAPSHOT = "playstore_snapshot"
 COL_PLAYSTORE = "playstore"
+# documents per round trip of the sharded readers
+READ_BATCH_SIZE = 2000
+# _id range shards per reader thread, so that a slow shard doesn't leave the other threads idle
+SHARDS_PER_JOB = 4
+# packages per $in query: larger subsets are read in chunks or joined from a temporary collection
+PACKAGES_CHUNK_SIZE = 1000
+SUBSET_COLLECTION_PREFIX = "tmp_subset_"
+# attempts of an operation failing with AutoReconnect, waiting RETRY_DELAY * 2^attempt (at most MAX_RETRY_DELAY)
+RETRY_TRIES = 8
+RETRY_DELAY = 1.0
+MAX_RETRY_DELAY = 60.0
+# optional dbconf settings, as MongoClient options
+CLIENT_OPTIONS = {"pool_size": "maxPoolSize", "read_preference": "readPreference", "compressors": "compressors"}
+
+# created on first use, so that the commands which don't need the db never connect to it
+client = None
+# read from config on first use too, so that importing this module doesn't parse (or warn about) dbconfig.json
+dbconf = None
+# names of the temporary collections of the large packages subsets created by this process, by packages hash
+subset_collections = {}
+
+
+def get_dbconf():
+    global dbconf
+    if dbconf is None:
+        import config
+        dbconf = config.dbconf
+    if dbconf is None:
+        raise RuntimeError("Missing database configuration")
+    return dbconf
+
+
+def create_client():
+    """
+    Client of the remote db: dbconf may set the connection pool size (pool_size), the read preference
+    (read_preference, e.g. "secondaryPreferred") and the wire compression (compressors, e.g. "zstd,snappy")
+    """
+    dbconf = get_dbconf()
+    options = {}
+    for setting, option in CLIENT_OPTIONS.items():
+        value = getattr(dbconf, setting, None)
+        if value is not None:
+            options[option] = value
+    return pymongo.MongoClient(dbconf.address, int(dbconf.port), username=dbconf.user, password=dbconf.password,
+                               connect=False, **options)
+
+
+def get_db():
+    global client
+    if client is None:
+        client = create_client()
+    return client[get_dbconf().name]
+
 
-# remote db location
-client = pymongo.MongoClient(dbconf.address, int(dbconf.port), username=dbconf.user, password=dbconf.password)
-db = client[dbconf.name]
-playstore_snapshot = db[COL_PLAYSTORE_SNAPSHOT]
-playstore_detailed = db[COL_PLAYSTORE]
+def get_playstore_snapshot():
+    return get_db()[COL_PLAYSTORE_SNAPSHOT]
 
 
-@retry(pymongo.errors.AutoReconnect, tries=5, timeout_secs=1)
+def get_playstore_detailed():
+    return get_db()[COL_PLAYSTORE]
+
+
+def reconnect():
+    """
+    Drops the connection; MongoClient is not fork-safe, so worker processes must call this before using the db
+    """
+    global client
+    client = None
+
+
+def wait_before_retry(attempt):
+    """
+    Exponential backoff, with jitter so that the reader threads don't reconnect all at once
+    """
+    delay = min(RETRY_DELAY * 2 ** attempt, MAX_RETRY_DELAY)
+    time.sleep(delay * random.uniform(0.5, 1.0))
+
+
+def retry_on_disconnect(function):
+    """
+    Runs again the decorated function (after wait_before_retry) when the connection to the db is lost. Only
+    the call is retried: the functions returning cursors or generators must resume their reads themselves
+    (see find_apps)
+    """
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        for attempt in range(RETRY_TRIES):
+            try:
+                return function(*args, **kwargs)
+            except AutoReconnect:
+                if attempt + 1 == RETRY_TRIES:
+                    raise
+                wait_before_retry(attempt)
+    return wrapper
+
+
+@retry_on_disconnect
 def get_apikey_unverified():
-    document = playstore_snapshot.find_one({"verified": None})
+    document = get_playstore_snapshot().find_one({"verified": None})
     return document
 
 
-@retry(pymongo.errors.AutoReconnect, tries=5, timeout_secs=1)
-def get_all(packages):
-    if packages:
-        docs = playstore_snapshot.find({"docid": {"$in": packages}})
-    else:
-        docs = playstore_snapshot.find()
-    return docs
+def get_fields(packages, fields, jobs=1):
+    """
+    The given fields of the apps; with jobs > 1 they are read by jobs threads, in no particular order
+    """
+    projection = {"_id": 0}
+    for field in fields:
+        projection[field] = 1
+    return read_apps(get_playstore_snapshot(), packages, projection, jobs)
 
 
-@retry(pymongo.errors.AutoReconnect, tries=5, timeout_secs=1)
-def get_creators(packages):
-    if packages:
-        docs = playstore_snapshot.find({"docid": {"$in": packages}}, {"_id": 0, "creator": 1})
-    else:
-        docs = playstore_snapshot.find({}, {"_id": 0, "creator": 1})
-    return docs
+def get_similar_apps(batch_size=10000, jobs=1):
+    return read_apps(get_playstore_snapshot(), None, {"_id": 0, "docid": 1, "similarTo": 1}, jobs, batch_size)
 
 
-@retry(pymongo.errors.AutoReconnect, tries=5, timeout_secs=1)
-def get_apps_downloads(packages):
-    if packages:
-        docs = playstore_snapshot.find({"docid": {"$in": packages}}, {"_id": 0, "details.appDetails.numDownloads": 1})
-    else:
-        docs = playstore_snapshot.find({}, {"_id": 0, "details.appDetails.numDownloads": 1})
-    return docs
+def get_descriptions(packages, id_range=None):
+    """
+    id_range, if given, is a condition on _id (e.g. {"$gte": first_id, "$lt": next_first_id}). As before, the
+    translated descriptions are only read for all the apps
+    """
+    projection = {"_id": 0, "docid": 1, "descriptionHtml": 1}
+    if not packages:
+        projection["translatedDescriptionHtml"] = 1
+    return read_apps(get_playstore_detailed(), packages, projection, query={"_id": id_range} if id_range else None)
 
 
-@retry(pymongo.errors.AutoReconnect, tries=5, timeout_secs=1)
-def get_apps_files(packages):
-    if packages:
-        docs = playstore_snapshot.find({"docid": {"$in": packages}},
-                                       {"_id": 0, "details.appDetails.file": 1, "docid": 1})
-    else:
-        docs = playstore_snapshot.find({}, {"_id": 0, "details.appDetails.file": 1, "docid": 1})
-    return docs
+def get_descriptions_id_ranges(packages, n_ranges):
+    """
+    Splits the descriptions into (at most) n_ranges _id ranges containing about the same number of documents
+    """
+    return get_id_ranges(get_playstore_detailed(), packages, n_ranges)
 
 
-@retry(pymongo.errors.AutoReconnect, tries=5, timeout_secs=1)
-def get_apps_upload_date(packages):
-    if packages:
-        docs = playstore_snapshot.find({"docid": {"$in": packages}}, {"_id": 0, "details.appDetails.uploadDate": 1})
-    else:
-        docs = playstore_snapshot.find({}, {"_id": 0, "details.appDetails.uploadDate": 1})
-    return docs
+def get_packages_chunks(packages, chunk_size=PACKAGES_CHUNK_SIZE):
+    return [packages[start:start + chunk_size] for start in range(0, len(packages), chunk_size)]
 
 
-@retry(pymongo.errors.AutoReconnect, tries=5, timeout_secs=1)
-def get_apps_bayesian_ratings(packages):
+def get_packages_query(packages, query=None):
+    """
+    Query selecting the apps of packages (all the apps if packages is empty), at most PACKAGES_CHUNK_SIZE
+    """
+    packages_query = dict(query or {})
     if packages:
-        docs = playstore_snapshot.find({"docid": {"$in": packages}},
-                                       {"_id": 0, "aggregateRating.bayesianMeanRating": 1, "docid": 1})
-    else:
-        docs = playstore_snapshot.find({}, {"_id": 0, "aggregateRating.bayesianMeanRating": 1, "docid": 1})
-    return docs
+        packages_query["docid"] = {"$in": list(packages)}
+    return packages_query
 
 
-@retry(pymongo.errors.AutoReconnect, tries=5, timeout_secs=1)
-def get_apps_star_ratings(packages):
-    if packages:
-        docs = playstore_snapshot.find({"docid": {"$in": packages}},
-                                       {"_id": 0, "aggregateRating.starRating": 1, "docid": 1})
-    else:
-        docs = playstore_snapshot.find({}, {"_id": 0, "aggregateRating.starRating": 1, "docid": 1})
-    return docs
+def create_subset_collection(packages):
+    """
+    Temporary collection of the packages, indexed by docid, dropped when the process exits. All the queries
+    on the same subset share it (also in the worker processes forked afterwards); its name includes the id of
+    the process creating it, so that concurrent runs on the same packages never drop each other's collection.
+    """
+    packages_hash = get_packages_hash(packages)
+    if packages_hash not in subset_collections:
+        name = "{0}{1}_{2}".format(SUBSET_COLLECTION_PREFIX, packages_hash, os.getpid())
+        # filled under another name and then renamed, so that it is never seen half filled
+        db = get_db()
+        staging = db[name + "_staging"]
+        staging.drop()
+        for chunk in get_packages_chunks(sorted(set(packages))):
+            staging.insert_many([{"docid": package} for package in chunk], ordered=False)
+        staging.create_index("docid", unique=True)
+        staging.rename(name, dropTarget=True)
+        subset_collections[packages_hash] = name
+        atexit.register(drop_subset_collection, packages_hash)
+    return get_db()[subset_collections[packages_hash]]
 
 
-@retry(pymongo.errors.AutoReconnect, tries=5, timeout_secs=1)
-def get_permissions(packages):
-    if packages:
-        docs = playstore_snapshot.find({"docid": {"$in": packages}}, {"_id": 0, "details.appDetails.permission": 1})
-    else:
-        docs = playstore_snapshot.find({}, {"_id": 0, "details.appDetails.permission": 1})
-    return docs
+def drop_subset_collection(packages_hash):
+    name = subset_collections.pop(packages_hash, None)
+    # no client, no collection created through it: don't connect (or fail without a configuration) just to exit
+    if name is None or client is None:
+        return
+    try:
+        get_db().drop_collection(name)
+    except pymongo.errors.PyMongoError:
+        pass
+
+
+def aggregate_subset(collection, packages, pipeline):
+    """
+    Runs the pipeline over the apps of packages (all the apps if packages is empty). Large subsets are not
+    matched with a huge $in: the pipeline starts from their temporary collection, joined with the apps.
+    """
+    if not packages:
+        return collection.aggregate(pipeline, allowDiskUse=True)
+    if len(packages) <= PACKAGES_CHUNK_SIZE:
+        return collection.aggregate([{"$match": get_packages_query(packages)}] + pipeline, allowDiskUse=True)
+    join = [{"$lookup": {"from": collection.name, "localField": "docid", "foreignField": "docid", "as": "app"}},
+            {"$unwind": "$app"},
+            {"$replaceRoot": {"newRoot": "$app"}}]
+    return create_subset_collection(packages).aggregate(join + pipeline, allowDiskUse=True)
+
+
+@retry_on_disconnect
+def get_id_ranges(collection, packages, n_ranges, samples_per_range=20):
+    """
+    Splits the apps of packages (all the apps if packages is empty) into (at most) n_ranges _id ranges
+    (conditions on _id, e.g. {"$gte": first_id, "$lt": next_first_id}) containing about the same number of
+    documents. The split points are the quantiles of a random sample of the _ids. Returns [] if there are
+    no apps.
+    """
+    pipeline = [{"$sample": {"size": n_ranges * samples_per_range}}, {"$project": {"_id": 1}}]
+    ids = sorted(doc["_id"] for doc in aggregate_subset(collection, packages, pipeline))
+    if not ids:
+        return []
+    split_points = []
+    for i in range(1, n_ranges):
+        split_point = ids[i * len(ids) // n_ranges]
+        if split_point != ids[0] and (not split_points or split_point != split_points[-1]):
+            split_points.append(split_point)
+    bounds = [None] + split_points + [None]
+    id_ranges = []
+    for lower, upper in zip(bounds[:-1], bounds[1:]):
+        id_range = {}
+        if lower is not None:
+            id_range["$gte"] = lower
+        if upper is not None:
+            id_range["$lt"] = upper
+        id_ranges.append(id_range)
+    return id_ranges
+
+
+def get_shard_queries(collection, packages, n_shards, query=None):
+    """
+    Queries splitting the apps of packages (all the apps if packages is empty) into shards: chunks of the
+    packages if they are too many for a single $in, otherwise _id ranges
+    """
+    if packages and len(packages) > PACKAGES_CHUNK_SIZE:
+        return [get_packages_query(chunk, query) for chunk in get_packages_chunks(packages)]
+    if query and "_id" in query:
+        # already a shard
+        return [get_packages_query(packages, query)]
+    shard_queries = []
+    for id_range in get_id_ranges(collection, packages, n_shards):
+        shard_query = get_packages_query(packages, query)
+        if id_range:
+            shard_query["_id"] = id_range
+        shard_queries.append(shard_query)
+    return shard_queries
+
+
+class ShardDone(object):
+    """
+    Marks the end of the documents of a shard (error is the traceback if the shard could not be read)
+    """
+
+    def __init__(self, query, error=None):
+        self.query = query
+        self.error = error
+
+
+def put_until_stopped(queue, item, stop):
+    while not stop.is_set():
+        try:
+            queue.put(item, timeout=0.1)
+            return True
+        except Full:
+            pass
+    return False
+
 
+def find_resumable(collection, query, projection=None, batch_size=READ_BATCH_SIZE):
+    """
+    Documents matching the query (a full scan or an _id range), in _id order: when the connection is lost the
+    scan goes on (after wait_before_retry) from the last _id read, instead of starting over. The _id is read
+    also when the projection excludes it, and then removed.
+    """
+    hide_id = projection is not None and not projection.get("_id", 1)
+    if hide_id:
+        projection = dict(projection)
+        del projection["_id"]
+    last_id = None
+    attempt = 0
+    while True:
+        resumed_query = query if last_id is None else {"$and": [query, {"_id": {"$gt": last_id}}]}
+        try:
+            for doc in collection.find(resumed_query, projection, batch_size=batch_size).sort("_id", pymongo.ASCENDING):
+                attempt = 0
+                last_id = doc["_id"]
+                if hide_id:
+                    del doc["_id"]
+                yield doc
+            return
+        except AutoReconnect:
+            if attempt + 1 == RETRY_TRIES:
+                raise
+            wait_before_retry(attempt)
+            attempt += 1
 
-@retry(pymongo.errors.AutoReconnect, tries=5, timeout_secs=1)
-def get_descriptions(packages):
+
+@retry_on_disconnect
+def find_chunk(collection, query, projection=None, batch_size=READ_BATCH_SIZE):
+    """
+    Documents matching a query on a chunk of packages (at most PACKAGES_CHUNK_SIZE apps), read at once: when
+    the connection is lost the whole query is run again. They are not sorted by _id, so that the docid index
+    is used without an in-memory sort.
+    """
+    return list(collection.find(query, projection, batch_size=batch_size))
+
+
+def find_apps(collection, query, projection=None, batch_size=READ_BATCH_SIZE):
+    """
+    Documents matching the query, read with find_chunk if it selects a chunk of packages, otherwise with
+    find_resumable
+    """
+    if "docid" in query:
+        return iter(find_chunk(collection, query, projection, batch_size))
+    return find_resumable(collection, query, projection, batch_size)
+
+
+def read_shard(collection, query, projection, batch_size, queue, stop):
+    """
+    Puts the documents of the shard in the queue, in lists of batch_size documents
+    """
+    try:
+        batch = []
+        for doc in find_apps(collection, query, projection, batch_size):
+            batch.append(doc)
+            if len(batch) == batch_size:
+                if not put_until_stopped(queue, batch, stop):
+                    return
+                batch = []
+        if batch and not put_until_stopped(queue, batch, stop):
+            return
+        put_until_stopped(queue, ShardDone(query), stop)
+    except Exception:
+        put_until_stopped(queue, ShardDone(query, traceback.format_exc()), stop)
+
+
+def read_shards(collection, shard_queries, projection, jobs, batch_size=READ_BATCH_SIZE):
+    """
+    Lists of the documents matching the shard queries, read concurrently by jobs threads (each with its own
+    connection of the pool). At most 2 * jobs lists are buffered, so the readers wait when the caller is
+    slower.
+    """
+    queue = Queue(2 * jobs)
+    stop = threading.Event()
+    pool = ThreadPool(jobs)
+    try:
+        for query in shard_queries:
+            pool.apply_async(read_shard, (collection, query, projection, batch_size, queue, stop))
+        pool.close()
+        n_done = 0
+        while n_done < len(shard_queries):
+            item = queue.get()
+            if isinstance(item, ShardDone):
+                if item.error:
+                    raise RuntimeError("Reading the shard {0} failed:\n{1}".format(item.query, item.error))
+                n_done += 1
+            else:
+                yield item
+    finally:
+        # also when the caller stops early: the readers give up their pending batches
+        stop.set()
+        pool.terminate()
+        pool.join()
+
+
+def read_apps(collection, packages, projection=None, jobs=1, batch_size=READ_BATCH_SIZE, query=None):
+    """
+    Documents of the apps of packages (all the apps if packages is empty) matching the optional query.
+    With jobs > 1, or too many packages for a single $in, they are read by jobs threads from the shards of
+    get_shard_queries, in no particular order. When the connection is lost the scans resume from where they were,
+    the packages chunks are read again (see find_apps).
+    """
+    if jobs <= 1 and len(packages or []) <= PACKAGES_CHUNK_SIZE:
+        return find_apps(collection, get_packages_query(packages, query), projection, batch_size)
+    return iterate_batches(read_shards(collection, get_shard_queries(collection, packages, jobs * SHARDS_PER_JOB,
+                                                                     query),
+                                       projection, max(jobs, 1), batch_size))
+
+
+def iterate_batches(batches):
+    for batch in batches:
+        for doc in batch:
+            yield doc
+
+
+@retry_on_disconnect
+def count_apps(packages):
+    playstore_snapshot = get_playstore_snapshot()
     if packages:
-        docs = playstore_detailed.find({"docid": {"$in": packages}}, {"_id": 0, "descriptionHtml": 1})
-    else:
-        docs = playstore_detailed.find({}, {"_id": 0, "descriptionHtml": 1, "translatedDescriptionHtml": 1})
-    return docs
+        return sum(playstore_snapshot.count_documents(get_packages_query(chunk))
+                   for chunk in get_packages_chunks(packages))
+    # from the collection metadata, as Collection.count() without a query
+    return playstore_snapshot.estimated_document_count()
+
+
+@retry_on_disconnect
+def aggregate_apps(packages, pipeline):
+    return aggregate_subset(get_playstore_snapshot(), packages, pipeline)
+
+
+def get_field_frequency(packages, field):
+    return aggregate_apps(packages, [{"$group": {"_id": "$" + field, "count": {"$sum": 1}}}])
+
 
+def get_creators_top(packages, limit):
+    return aggregate_apps(packages, [{"$group": {"_id": "$creator", "count": {"$sum": 1}}},
+                                     {"$sort": {"count": -1}},
+                                     {"$limit": limit}])
 
-@retry(pymongo.errors.AutoReconnect, tries=5, timeout_secs=1)
-def get_package_by_permissions_size(size):
-    docs = playstore_snapshot.find({"details.appDetails.permission": {"$size": size}}, {"docid": 1})
-    return docs
 
+def get_creators_productivity(packages):
+    return aggregate_apps(packages, [{"$group": {"_id": "$creator", "count": {"$sum": 1}}},
+                                     {"$group": {"_id": "$count", "creators": {"$sum": 1}}}])
 
-@retry(pymongo.errors.AutoReconnect, tries=5, timeout_secs=1)
-def get_edge_number():
-    result = playstore_snapshot.aggregate([{'$group': {'_id': None, 'total': {'$sum': {'$size': '$similarTo'}}}}])
-    command_result = result.next()
-    print(command_result)
-    return int(command_result.get('total'))
+
+def get_permissions_frequency(packages):
+    return aggregate_apps(packages, [{"$project": {"_id": 0, "permission": "$details.appDetails.permission"}},
+                                     {"$unwind": "$permission"},
+                                     {"$project": {"permission": {"$toUpper": "$permission"}}},
+                                     {"$match": {"permission": {"$regex": r"^ANDROID\.PERMISSION"}}},
+                                     {"$group": {"_id": "$permission", "count": {"$sum": 1}}}])
+
+
+ANDROID_PERMISSIONS_EXPRESSION = {
+    "$filter": {"input": {"$ifNull": ["$details.appDetails.permission", []]},
+                "as": "permission",
+                "cond": {"$eq": [{"$substrCP": [{"$toUpper": "$$permission"}, 0, 18]}, "ANDROID.PERMISSION"]}}}
+
+
+def get_permissions_size_frequency(packages):
+    n_permissions = {"$size": ANDROID_PERMISSIONS_EXPRESSION}
+    return aggregate_apps(packages, [{"$project": {"_id": 0, "n_permissions": n_permissions}},
+                                     {"$group": {"_id": "$n_permissions", "count": {"$sum": 1}}}])
+
+
+def get_top_values(packages, expression, limit, direction, excluded=(None,)):
+    return aggregate_apps(packages, [{"$project": {"_id": 0, "docid": 1, "value": expression}},
+                                     {"$match": {"value": {"$nin": list(excluded)}}},
+                                     {"$sort": {"value": direction}},
+                                     {"$limit": limit}])
+
+
+def get_permissions_top_requesters(packages, limit, materialized_counts=False):
+    """
+    With materialized_counts, the apps are sorted (through its index) on the count of android permissions
+    stored by --prepare-db, which is stale if the apps changed afterwards
+    """
+    if materialized_counts and not packages:
+        cursor = get_playstore_snapshot().find({}, {"_id": 0, "docid": 1, "permissionCount": 1})
+        return [{"docid": doc.get("docid"), "value": doc.get("permissionCount")}
+                for doc in cursor.sort("permissionCount", pymongo.DESCENDING).limit(limit)]
+    return get_top_values(packages, {"$size": ANDROID_PERMISSIONS_EXPRESSION}, limit, -1)
+
+
+def get_android_permissions(packages):
+    return get_values(packages, {"permissions": ANDROID_PERMISSIONS_EXPRESSION})
+
+
+def get_values(packages, expressions):
+    projection = {"_id": 0}
+    projection.update(expressions)
+    return aggregate_apps(packages, [{"$project": projection}])
+
+
+def get_packages_hash(packages):
+    return hashlib.sha1("\n".join(sorted(packages)).encode("utf-8")).hexdigest()
+
+
+@retry_on_disconnect
+def get_collection_fingerprint(packages):
+    """
+    Identifies the content of the collection (and of the packages subset) by documents count and max _id
+    """
+    playstore_snapshot = get_playstore_snapshot()
+    last = list(playstore_snapshot.find({}, {"_id": 1}).sort("_id", pymongo.DESCENDING).limit(1))
+    fingerprint = {"collection": COL_PLAYSTORE_SNAPSHOT, "count": playstore_snapshot.estimated_document_count(),
+                   "max_id": str(last[0]["_id"]) if last else None, "packages": None}
+    if packages:
+        fingerprint["packages"] = get_packages_hash(packages)
+    return fingerprint
@@ -0,0 +1,138 @@
+import datetime
+
+import pymongo
+from pymongo import UpdateOne
+
+from db_accumulators import get_app_details, is_android_permission
+from db_interface import COL_PLAYSTORE, COL_PLAYSTORE_SNAPSHOT, get_db, get_packages_query, get_playstore_detailed, \
+    get_playstore_snapshot, read_apps
+
+# (collection, index keys) of the analysis queries
+INDEXES = [
+    (COL_PLAYSTORE_SNAPSHOT, [("docid", pymongo.ASCENDING)]),
+    # get_apikey_unverified
+    (COL_PLAYSTORE_SNAPSHOT, [("verified", pymongo.ASCENDING)]),
+    (COL_PLAYSTORE_SNAPSHOT, [("permissionCount", pymongo.ASCENDING)]),
+    (COL_PLAYSTORE, [("docid", pymongo.ASCENDING)]),
+]
+UPDATE_BATCH_SIZE = 1000
+
+
+def create_indexes():
+    """
+    Creates the missing INDEXES (in background, so that the collections stay usable)
+    """
+    for collection_name, keys in INDEXES:
+        name = get_db()[collection_name].create_index(keys, background=True)
+        print("{0} Index {1}.{2} ready".format(datetime.datetime.now(), collection_name, name))
+
+
+def get_permission_count(doc):
+    # the android permissions, as ANDROID_PERMISSIONS_EXPRESSION
+    permissions = get_app_details(doc).get("permission") or []
+    return sum(1 for permission in permissions if is_android_permission(permission.upper()))
+
+
+def materialize_counts(jobs=1, batch_size=UPDATE_BATCH_SIZE):
+    """
+    Stores the number of android permissions of every app in permissionCount, so that --materialized-counts
+    can sort the apps on it through its index instead of computing $size. Only the apps whose count is
+    missing or stale are updated, with unordered bulk writes; returns the number of updates.
+    """
+    collection = get_playstore_snapshot()
+    projection = {"details.appDetails.permission": 1, "permissionCount": 1}
+    requests = []
+    n_docs = 0
+    n_updated = 0
+    for doc in read_apps(collection, None, projection, jobs):
+        permission_count = get_permission_count(doc)
+        if doc.get("permissionCount") != permission_count:
+            requests.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"permissionCount": permission_count}}))
+        if len(requests) == batch_size:
+            n_updated += collection.bulk_write(requests, ordered=False).modified_count
+            requests = []
+        n_docs += 1
+        if n_docs % 100000 == 0:
+            print("{0} {1} apps read, {2} updated".format(datetime.datetime.now(), n_docs, n_updated))
+    if requests:
+        n_updated += collection.bulk_write(requests, ordered=False).modified_count
+    print("{0} {1} apps read, {2} updated".format(datetime.datetime.now(), n_docs, n_updated))
+    return n_updated
+
+
+def get_plan_stages(explain):
+    """
+    Stages of the winning plans in an explain output (of a find or of an aggregation)
+    """
+    stages = []
+    if isinstance(explain, dict):
+        for key, value in explain.items():
+            if key in ("rejectedPlans", "allPlansExecution", "executionStats"):
+                continue
+            if key == "stage":
+                stages.append(value)
+            else:
+                stages.extend(get_plan_stages(value))
+    elif isinstance(explain, list):
+        for value in explain:
+            stages.extend(get_plan_stages(value))
+    return stages
+
+
+def explain_aggregate(collection, pipeline):
+    return collection.database.command("aggregate", collection.name, pipeline=pipeline, explain=True)
+
+
+def get_query_plan_checks():
+    """
+    (description, explain function) of the selective queries run by the analyzers (as find_apps); the full
+    scans of the statistics are collection scans by design, so they are not checked
+    """
+    snapshot = get_playstore_snapshot()
+    detailed = get_playstore_detailed()
+    sample = list(snapshot.find({}, {"_id": 1, "docid": 1}).limit(10))
+    packages = [doc["docid"] for doc in sample if doc.get("docid")] or ["none"]
+    checks = [
+        ("apps of --packages", lambda: snapshot.find(get_packages_query(packages)).explain()),
+        ("aggregation over --packages", lambda: explain_aggregate(snapshot, [
+            {"$match": get_packages_query(packages)}, {"$group": {"_id": "$creator", "count": {"$sum": 1}}}])),
+        ("descriptions of --packages", lambda: detailed.find(get_packages_query(packages)).explain()),
+        ("unverified api key", lambda: snapshot.find({"verified": None}).limit(1).explain()),
+        ("materialized top permission requesters",
+         lambda: snapshot.find({}, {"docid": 1}).sort("permissionCount", pymongo.DESCENDING).limit(10).explain()),
+        ("latest app (collection fingerprint)",
+         lambda: snapshot.find({}, {"_id": 1}).sort("_id", pymongo.DESCENDING).limit(1).explain()),
+    ]
+    if sample:
+        first_id = sample[0]["_id"]
+        checks.append(("_id range shard",
+                       lambda: snapshot.find({"_id": {"$gte": first_id}}).sort("_id", 1).explain()))
+    return checks
+
+
+def check_query_plans():
+    """
+    Prints the winning plan stages of every analyzer query; returns the descriptions of the ones scanning
+    the whole collection (COLLSCAN)
+    """
+    collection_scans = []
+    for description, explain in get_query_plan_checks():
+        stages = get_plan_stages(explain())
+        if "COLLSCAN" in stages:
+            collection_scans.append(description)
+        print("{0} {1:<40} {2:<9} {3}".format(datetime.datetime.now(), description,
+                                                "COLLSCAN" if "COLLSCAN" in stages else "OK", " <- ".join(stages)))
+    return collection_scans
+
+
+def prepare_db(jobs=1):
+    """
+    Creates the indexes, materializes the permissions count and checks the analyzer query plans;
+    returns the queries still scanning the whole collection
+    """
+    print("{0} Creating indexes".format(datetime.datetime.now()))
+    create_indexes()
+    print("{0} Materializing permissionCount".format(datetime.datetime.now()))
+    materialize_counts(jobs)
+    print("{0} Checking query plans".format(datetime.datetime.now()))
+    return check_query_plans()
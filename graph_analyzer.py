@@ -1,26 +1,39 @@
+import copy
 import datetime
 import json
 import os
 from collections import OrderedDict
 from operator import itemgetter
 
-import snap
+import numpy as np
 
-from plot_tools import plot_subgraph_colored, get_labels_subset
+from betweenness import compute_approximate_betweenness
+from csr_graph import CSRGraph, StringTable, build_csr, get_base_path, has_csr_graph, load_csr_graph
+from graph_distributions import get_component_sizes_distribution, get_components, get_core_numbers, \
+    get_distribution, get_kcore_distributions
+from package_index import InMemoryPackageIndex, has_package_index, load_package_index, save_package_index
+from pagerank import compute_pagerank
+from topk import top_k, top_k_indices
+from plot_tools import generate_distribution, plot_subgraph_colored, get_labels_subset
+from result_cache import ResultCache
+from task_scheduler import Task, select_tasks, run_tasks
+
+# snap is imported only by the functions reading the snap graph, so that the analyses of the CSR graph run
+# without snap.py
 
 
 def get_top_nodes_from_hashtable(hashtable, limit=20):
-    top_nodes = []
-    for node in hashtable:
-        value = hashtable[node]
-        if not top_nodes or value >= min(top_nodes, key=itemgetter(1))[1]:
-            if len(top_nodes) == limit:
-                top_nodes.remove(min(top_nodes, key=itemgetter(1)))
-            top_nodes.append((node, value))
-    return top_nodes
+    """
+    Returns the (node, value) pairs with the highest values of a snap hashtable or of an array indexed by node id;
+    among the nodes tied with the last one, the ones iterated last are kept
+    """
+    if isinstance(hashtable, np.ndarray):
+        return [(int(node), float(hashtable[node])) for node in top_k_indices(hashtable, limit, keep_last=True)]
+    return top_k(((node, hashtable[node]) for node in hashtable), limit, keep_last=True)
 
 
 def get_subgraph(graph, nodes_ids):
+    import snap
     node_ids_vector = snap.TIntV()
     for node_id in nodes_ids:
         if node_id not in node_ids_vector:
@@ -36,134 +49,373 @@ def snap_hashtable_to_dict(snap_ht, keys):
     return d
 
 
-def compute_graph_statistics(graph_path, overwrite, compute_betweenness=False):
-    graph_abs_path = os.path.abspath(graph_path)
-    graph_name = os.path.basename(graph_abs_path).replace(".graph", "")
-    fin = snap.TFIn(graph_abs_path)
-    graph = snap.TNEANet.Load(fin)
-
+def load_snap_graph(graph_path):
+    import snap
+    fin = snap.TFIn(os.path.abspath(graph_path))
+    return snap.TNEANet.Load(fin)
+
+
+def get_package_index(graph_path, graph=None):
+    """
+    Returns the package <=> node id index of the graph: the memory mapped on-disk index when available
+    (built on the fly from the CSR string table for graphs saved without it), otherwise an in-memory one
+    rebuilt from the snap graph attributes
+    """
+    if has_package_index(graph_path):
+        return load_package_index(graph_path)
+    if has_csr_graph(graph_path):
+        save_package_index(graph_path, list(load_csr_graph(graph_path).packages))
+        return load_package_index(graph_path)
+    if graph is None:
+        graph = load_snap_graph(graph_path)
     # rebuild the id => pkg dictionary
     id_pkg_dict = {}
     for node in graph.Nodes():
         id_pkg_dict[node.GetId()] = graph.GetStrAttrDatN(node.GetId(), "pkg")
-    directory = os.path.dirname(os.path.abspath(graph_path))
-    json_path = os.path.join(directory, graph_name + "_statistics.json")
-    if os.path.isfile(json_path):
-        with open(json_path, "r") as f:
-            statistics = json.load(f, object_pairs_hook=OrderedDict)
+    return InMemoryPackageIndex(id_pkg_dict)
+
+
+def get_graph_cache(graph_path, max_size=None):
+    return ResultCache(get_base_path(graph_path) + "_cache", max_size)
+
+
+def save_ranks(directory, ranks, csr_graph):
+    """
+    Saves the ranks together with the packages of their node ids, so that they can be remapped to the node ids
+    of another build of the graph
+    """
+    np.save(os.path.join(directory, "ranks.npy"), ranks)
+    np.save(os.path.join(directory, "pkg_blob.npy"), csr_graph.packages.blob)
+    np.save(os.path.join(directory, "pkg_offsets.npy"), csr_graph.packages.offsets)
+
+
+def get_warm_start_ranks(cache, fingerprint, csr_graph):
+    """
+    Ranks of the latest cached PageRank, indexed by the node ids of csr_graph (NaN for the nodes it didn't rank),
+    or None if there is none. The node ids follow the order in which the apps were read from the DB, which
+    changes from build to build: the ranks of another graph are remapped by package name.
+    """
+    latest_path = cache.get_latest("pageranks")
+    if latest_path is None:
+        return None
+    ranks = np.load(os.path.join(latest_path, "ranks.npy"))
+    if cache.get_metadata(latest_path)["fingerprint"] == fingerprint:
+        return ranks
+    if not os.path.isfile(os.path.join(latest_path, "pkg_blob.npy")):
+        return None
+    previous_packages = StringTable(np.load(os.path.join(latest_path, "pkg_blob.npy")),
+                                    np.load(os.path.join(latest_path, "pkg_offsets.npy")))
+    pkg_id_dict = dict((package, node_id) for node_id, package in enumerate(csr_graph.packages))
+    initial_ranks = np.full(csr_graph.n_nodes, np.nan)
+    for previous_id, package in enumerate(previous_packages):
+        node_id = pkg_id_dict.get(package)
+        if node_id is not None:
+            initial_ranks[node_id] = ranks[previous_id]
+    return initial_ranks
+
+
+def get_pageranks(graph_path, overwrite, damping=0.85, tolerance=1e-6, personalization=None, graph=None):
+    """
+    Returns the PageRank of each node (an array indexed by node id, or a snap hashtable) and the
+    (iterations, residual) pair of the computation (None if the ranks were loaded from disk or computed
+    by snap). The native engine over the CSR graph is used when available: its results are cached by
+    graph fingerprint and parameters, and a new computation is warm-started from the latest cached ranks.
+    Raises ValueError if none of the personalization packages is in the graph.
+    """
+    base_path = get_base_path(graph_path)
+    if has_csr_graph(graph_path):
+        cache = get_graph_cache(graph_path)
+        fingerprint = cache.get_file_fingerprint(graph_path)
+        params = {"damping": damping, "tolerance": tolerance,
+                  "personalization": sorted(personalization) if personalization else None}
+        entry_path = None if overwrite else cache.get("pageranks", fingerprint, params)
+        if entry_path:
+            return np.load(os.path.join(entry_path, "ranks.npy"), mmap_mode='r'), None
+        csr_graph = load_csr_graph(graph_path)
+        personalized_nodes = None
+        if personalization:
+            personalized_nodes = get_package_index(graph_path).get_ids(personalization)
+            if not personalized_nodes:
+                raise ValueError("None of the personalization packages is in the graph")
+            if len(personalized_nodes) < len(personalization):
+                print("{0} {1} personalization packages are not in the graph".format(
+                    datetime.datetime.now(), len(personalization) - len(personalized_nodes)))
+        initial_ranks = get_warm_start_ranks(cache, fingerprint, csr_graph)
+        ranks, iterations, residual = compute_pagerank(csr_graph, damping, tolerance,
+                                                       personalized_nodes=personalized_nodes,
+                                                       initial_ranks=initial_ranks)
+        print("{0} PageRank: {1} iterations, residual {2}".format(datetime.datetime.now(), iterations, residual))
+        cache.put("pageranks", fingerprint, params, lambda directory: save_ranks(directory, ranks, csr_graph))
+        return ranks, (iterations, residual)
+
+    import snap
+    data_file = base_path + "_pageranks"
+    prank_hashtable = snap.TIntFltH()
+    if not os.path.isfile(data_file) or overwrite:
+        if graph is None:
+            graph = load_snap_graph(graph_path)
+        # Convergence difference: 1e-4, MaxIter: 100
+        snap.GetPageRank(graph, prank_hashtable, damping)
+        fout = snap.TFOut(data_file)
+        prank_hashtable.Save(fout)
     else:
-        statistics = OrderedDict()
+        fin = snap.TFIn(data_file)
+        prank_hashtable.Load(fin)
+    return prank_hashtable, None
+
+
+def get_csr_graph_from_snap(graph):
+    """
+    CSR copy of a snap graph, for the graphs built before the CSR representation was saved
+    """
+    sources = []
+    destinations = []
+    for edge in graph.Edges():
+        sources.append(edge.GetSrcNId())
+        destinations.append(edge.GetDstNId())
+    indptr, indices = build_csr(graph.GetMxNId(), np.array(sources, dtype=np.int64), destinations)
+    return CSRGraph(indptr, indices, None)
+
+
+# graphs loaded by the current process, shared with the worker processes forked afterwards
+loaded_graphs = {}
+loaded_csr_graphs = {}
+loaded_package_indexes = {}
+
+
+class GraphContext(object):
+    """
+    What the statistics tasks need to know about the analyzed graph. It is sent to the worker processes,
+    so the graph itself is kept out of it: get_graph(), get_csr_graph() and get_package_index() load the snap
+    graph, the CSR graph and the package index at most once per process, and only when they are called.
+    """
+
+    def __init__(self, graph_path, overwrite, statistics, damping=0.85, tolerance=1e-6, personalization=None,
+                 betweenness_samples=1000, jobs=1):
+        self.graph_path = os.path.abspath(graph_path)
+        self.graph_name = os.path.basename(self.graph_path).replace(".graph", "")
+        self.directory = os.path.dirname(self.graph_path)
+        self.overwrite = overwrite
+        self.force = overwrite
+        self.statistics = statistics
+        self.damping = damping
+        self.tolerance = tolerance
+        self.personalization = personalization
+        self.betweenness_samples = betweenness_samples
+        self.jobs = jobs
+
+    def get_graph(self):
+        if self.graph_path not in loaded_graphs:
+            loaded_graphs[self.graph_path] = load_snap_graph(self.graph_path)
+        return loaded_graphs[self.graph_path]
+
+    def get_package_index(self):
+        if self.graph_path not in loaded_package_indexes:
+            graph = None
+            if not has_package_index(self.graph_path) and not has_csr_graph(self.graph_path):
+                # the index can only be rebuilt from the snap graph attributes
+                graph = self.get_graph()
+            loaded_package_indexes[self.graph_path] = get_package_index(self.graph_path, graph)
+        return loaded_package_indexes[self.graph_path]
+
+    def get_csr_graph(self):
+        if self.graph_path not in loaded_csr_graphs:
+            if has_csr_graph(self.graph_path):
+                loaded_csr_graphs[self.graph_path] = load_csr_graph(self.graph_path)
+            else:
+                loaded_csr_graphs[self.graph_path] = get_csr_graph_from_snap(self.get_graph())
+        return loaded_csr_graphs[self.graph_path]
+
+    def get_subgraph_edges(self, node_ids):
+        """
+        (source, destination) edges of the subgraph induced on node_ids, read from the CSR graph when it was
+        saved, so that the snap graph is not loaded just to plot a few nodes
+        """
+        if has_csr_graph(self.graph_path):
+            return self.get_csr_graph().get_subgraph_edges(node_ids)
+        subgraph = get_subgraph(self.get_graph(), node_ids)
+        return [(edge.GetSrcNId(), edge.GetDstNId()) for edge in subgraph.Edges()]
+
+    def get_path(self, suffix):
+        """
+        Path of an output file of the graph, e.g. get_path("_indegree.npy")
+        """
+        return os.path.join(self.directory, self.graph_name + suffix)
+
+    def is_missing(self, *keys):
+        return self.overwrite or any(key not in self.statistics for key in keys)
+
+    def with_overwrite(self, overwrite):
+        context = copy.copy(self)
+        context.overwrite = overwrite
+        return context
+
+
+def get_task_params(task, context):
+    params = {"args": list(task.args)}
+    if task.name == "pagerank":
+        params.update({"damping": context.damping, "tolerance": context.tolerance,
+                       "personalization": sorted(context.personalization) if context.personalization else None})
+    elif task.name == "betweenness":
+        params["samples"] = context.betweenness_samples
+    return params
+
+
+def get_top_n_labeled(package_index, top_n):
+    top_n_labeled = []
+    for pair in top_n:
+        top_n_labeled.append((package_index.get_package(pair[0]), pair[1]))
+    return list(reversed(top_n_labeled))
 
-    # snap.py doesn't suport absolute paths for some operations. Let's cd to the directory
-    os.chdir(directory)
 
-    # general statistics
-    output = os.path.join(directory, graph_name + "_main_statistics.txt")
-    if not os.path.isfile(output) or overwrite:
+def general_statistics_task(context):
+    import snap
+    output = context.get_path("_main_statistics.txt")
+    if not os.path.isfile(output) or context.overwrite:
         print("{0} Computing general statistics".format(datetime.datetime.now()))
-        snap.PrintInfo(graph, "Play Store Graph -- main statistics", output, False)
+        snap.PrintInfo(context.get_graph(), "Play Store Graph -- main statistics", output, False)
+    return {}
+
 
+def max_degree_task(context):
+    import snap
+    statistics = OrderedDict()
+    graph = context.get_graph()
     # info about the nodes with the max in degree
-    if "max_in_degree" not in statistics or overwrite:
+    if context.is_missing("max_in_degree"):
         print("{0} Computing max indegree".format(datetime.datetime.now()))
         max_in_deg_id = snap.GetMxInDegNId(graph)
         iterator = graph.GetNI(max_in_deg_id)
-        max_in_deg = iterator.GetInDeg()
-        max_in_deg_pkg = graph.GetStrAttrDatN(max_in_deg_id, "pkg")
-        statistics["max_in_degree"] = max_in_deg
+        statistics["max_in_degree"] = iterator.GetInDeg()
         statistics["max_in_degree_id"] = max_in_deg_id
-        statistics["max_in_degree_pkg"] = max_in_deg_pkg
+        statistics["max_in_degree_pkg"] = graph.GetStrAttrDatN(max_in_deg_id, "pkg")
 
     # info about the nodes with the max out degree
-    if "max_out_degree" not in statistics or overwrite:
+    if context.is_missing("max_out_degree"):
         print("{0} Computing max outdegree".format(datetime.datetime.now()))
         max_out_deg_id = snap.GetMxOutDegNId(graph)
         iterator = graph.GetNI(max_out_deg_id)
-        max_out_deg = iterator.GetOutDeg()
-        max_out_deg_pkg = graph.GetStrAttrDatN(max_out_deg_id, "pkg")
-        statistics["max_out_degree"] = max_out_deg
+        statistics["max_out_degree"] = iterator.GetOutDeg()
         statistics["max_out_degree_id"] = max_out_deg_id
-        statistics["max_out_degree_pkg"] = max_out_deg_pkg
+        statistics["max_out_degree_pkg"] = graph.GetStrAttrDatN(max_out_deg_id, "pkg")
+    return statistics
 
-    # pagerank statistics
-    output = graph_name + "_topNpagerank.eps"
-    if not os.path.isfile(output) or "top_n_pagerank" not in statistics or overwrite:
+
+def pagerank_task(context):
+    statistics = OrderedDict()
+    output = context.get_path("_topNpagerank.eps")
+    if not os.path.isfile(output) or context.is_missing("top_n_pagerank"):
         print("{0} Computing top 20 nodes with highest pagerank".format(datetime.datetime.now()))
-        data_file = graph_name + "_pageranks"
-        prank_hashtable = snap.TIntFltH()
-        if not os.path.isfile(data_file) or overwrite:
-            # Damping Factor: 0.85, Convergence difference: 1e-4, MaxIter: 100
-            snap.GetPageRank(graph, prank_hashtable, 0.85)
-            fout = snap.TFOut(data_file)
-            prank_hashtable.Save(fout)
-        else:
-            fin = snap.TFIn(data_file)
-            prank_hashtable.Load(fin)
+        # native PageRank results are cached by graph fingerprint: recompute them only when forced
+        overwrite = context.force if has_csr_graph(context.graph_path) else context.overwrite
+        prank_hashtable, convergence = get_pageranks(context.graph_path, overwrite, context.damping,
+                                                     context.tolerance, context.personalization)
+        if convergence:
+            statistics["pagerank_iterations"], statistics["pagerank_residual"] = convergence
 
         top_n = get_top_nodes_from_hashtable(prank_hashtable)
         top_n.sort(key=itemgetter(1))
-        if "top_n_pagerank" not in statistics or overwrite:
-            top_n_labeled = []
-            for pair in top_n:
-                top_n_labeled.append((id_pkg_dict[pair[0]], pair[1]))
-            statistics["top_n_pagerank"] = list(reversed(top_n_labeled))
+        package_index = context.get_package_index()
+        if context.is_missing("top_n_pagerank"):
+            statistics["top_n_pagerank"] = get_top_n_labeled(package_index, top_n)
 
-        if not os.path.isfile(output) or overwrite:
+        if not os.path.isfile(output) or context.overwrite:
             # let's build a subgraph induced on the top 20 pagerank nodes
-            subgraph = get_subgraph(graph, [x[0] for x in top_n])
-            labels_dict = get_labels_subset(id_pkg_dict, subgraph)
+            edges = context.get_subgraph_edges([x[0] for x in top_n])
+            labels_dict = get_labels_subset(package_index, edges)
             values = snap_hashtable_to_dict(prank_hashtable, [x[0] for x in top_n])
-            plot_subgraph_colored(subgraph, labels_dict, values, "PageRank",
+            plot_subgraph_colored(edges, labels_dict, values, "PageRank",
                                   "Play Store Graph - top 20 PageRank nodes", output, "autumn_r")
-
-    # betweeness statistics
-    output = graph_name + "_topNbetweenness.eps"
-    if compute_betweenness and (not os.path.isfile(output) or "betweenness" not in statistics or overwrite):
+    return statistics
+
+
+def get_betweenness(graph_path, overwrite, n_samples, workers=1):
+    """
+    Approximate betweenness (estimates and standard errors, arrays indexed by node id) from n_samples pivots,
+    cached by graph fingerprint and number of samples
+    """
+    cache = get_graph_cache(graph_path)
+    fingerprint = cache.get_file_fingerprint(graph_path)
+    params = {"samples": n_samples}
+    entry_path = None if overwrite else cache.get("betweenness", fingerprint, params)
+    if entry_path is None:
+        estimates, standard_errors = compute_approximate_betweenness(graph_path, n_samples, workers, seed=0)
+
+        def write(directory):
+            np.save(os.path.join(directory, "estimates.npy"), estimates)
+            np.save(os.path.join(directory, "standard_errors.npy"), standard_errors)
+
+        entry_path = cache.put("betweenness", fingerprint, params, write)
+    return np.load(os.path.join(entry_path, "estimates.npy"), mmap_mode='r'), \
+        np.load(os.path.join(entry_path, "standard_errors.npy"), mmap_mode='r')
+
+
+def betweenness_task(context):
+    statistics = OrderedDict()
+    output = context.get_path("_topNbetweenness.eps")
+    if not os.path.isfile(output) or context.is_missing("top_n_betweenness"):
         print("{0} Computing top 20 nodes with highest betweenness".format(datetime.datetime.now()))
-        data_file1 = graph_name + "_node_betweenness"
-        data_file2 = graph_name + "_edge_betweenness"
-        node_betwenness_hashtable = snap.TIntFltH()
-        edge_betwenness_hashtable = snap.TIntPrFltH()
-        if not os.path.isfile(data_file1) or not os.path.isfile(data_file2) or overwrite:
-            snap.GetBetweennessCentr(graph, node_betwenness_hashtable, edge_betwenness_hashtable, 0.85, True)
-            fout = snap.TFOut(data_file1)
-            node_betwenness_hashtable.Save(fout)
-            fout = snap.TFOut(data_file2)
-            edge_betwenness_hashtable.Save(fout)
-
+        standard_errors = None
+        if has_csr_graph(context.graph_path):
+            node_betwenness_hashtable, standard_errors = get_betweenness(context.graph_path, context.force,
+                                                                         context.betweenness_samples, context.jobs)
         else:
-            fin = snap.TFIn(data_file1)
-            node_betwenness_hashtable.Load(fin)
-            fin = snap.TFIn(data_file2)
-            edge_betwenness_hashtable.Load(fin)  # unused, as now
+            import snap
+            data_file1 = context.get_path("_node_betweenness")
+            data_file2 = context.get_path("_edge_betweenness")
+            node_betwenness_hashtable = snap.TIntFltH()
+            edge_betwenness_hashtable = snap.TIntPrFltH()
+            if not os.path.isfile(data_file1) or not os.path.isfile(data_file2) or context.overwrite:
+                graph = context.get_graph()
+                # NodeFrac: fraction of the nodes used as BFS sources
+                node_fraction = min(1.0, float(context.betweenness_samples) / graph.GetNodes())
+                snap.GetBetweennessCentr(graph, node_betwenness_hashtable, edge_betwenness_hashtable,
+                                         node_fraction, True)
+                fout = snap.TFOut(data_file1)
+                node_betwenness_hashtable.Save(fout)
+                fout = snap.TFOut(data_file2)
+                edge_betwenness_hashtable.Save(fout)
+
+            else:
+                fin = snap.TFIn(data_file1)
+                node_betwenness_hashtable.Load(fin)
+                fin = snap.TFIn(data_file2)
+                edge_betwenness_hashtable.Load(fin)  # unused, as now
 
         top_n = get_top_nodes_from_hashtable(node_betwenness_hashtable)
         top_n.sort(key=itemgetter(1))
-        if "top_n_betweenness" not in statistics or overwrite:
-            top_n_labeled = []
-            for pair in top_n:
-                top_n_labeled.append((id_pkg_dict[pair[0]], pair[1]))
-            statistics["top_n_betweenness"] = list(reversed(top_n_labeled))
-
-        if not os.path.isfile(output) or overwrite:
+        package_index = context.get_package_index()
+        if context.is_missing("top_n_betweenness"):
+            statistics["top_n_betweenness"] = get_top_n_labeled(package_index, top_n)
+            statistics["betweenness_samples"] = context.betweenness_samples
+            if standard_errors is not None:
+                statistics["top_n_betweenness_stderr"] = get_top_n_labeled(
+                    package_index, [(pair[0], float(standard_errors[pair[0]])) for pair in top_n])
+
+        if not os.path.isfile(output) or context.overwrite:
             # let's build a subgraph induced on the top 20 betweenness nodes
-            subgraph = get_subgraph(graph, [x[0] for x in top_n])
-            labels_dict = get_labels_subset(id_pkg_dict, subgraph)
+            edges = context.get_subgraph_edges([x[0] for x in top_n])
+            labels_dict = get_labels_subset(package_index, edges)
             values = snap_hashtable_to_dict(node_betwenness_hashtable, [x[0] for x in top_n])
-            plot_subgraph_colored(subgraph, labels_dict, values, "Betweenness",
+            plot_subgraph_colored(edges, labels_dict, values, "Betweenness",
                                   "Play Store Graph - top 20 Betweenness nodes", output)
+    return statistics
 
-    # HITS statistics
-    output_hub = graph_name + "_topNhitshubs.eps"
-    output_auth = graph_name + "_topNhitsauth.eps"
-    if not os.path.isfile(output_hub) or not os.path.isfile(output_auth) or "top_n_hits_hubs" not in statistics \
-            or "top_n_hits_authorities" not in statistics or overwrite:
+
+def hits_task(context):
+    import snap
+    statistics = OrderedDict()
+    output_hub = context.get_path("_topNhitshubs.eps")
+    output_auth = context.get_path("_topNhitsauth.eps")
+    if not os.path.isfile(output_hub) or not os.path.isfile(output_auth) \
+            or context.is_missing("top_n_hits_hubs", "top_n_hits_authorities"):
         print("{0} Computing top 20 HITS hubs and auths".format(datetime.datetime.now()))
-        data_file1 = graph_name + "_hits_hubs"
-        data_file2 = graph_name + "_hits_auth"
+        graph = context.get_graph()
+        data_file1 = context.get_path("_hits_hubs")
+        data_file2 = context.get_path("_hits_auth")
         hubs_hashtable = snap.TIntFltH()
         auth_hashtable = snap.TIntFltH()
-        if not os.path.isfile(data_file1) or not os.path.isfile(data_file2) or overwrite:
+        if not os.path.isfile(data_file1) or not os.path.isfile(data_file2) or context.overwrite:
             # MaxIter = 20
             snap.GetHits(graph, hubs_hashtable, auth_hashtable, 20)
             fout = snap.TFOut(data_file1)
@@ -177,23 +429,18 @@ def compute_graph_statistics(graph_path, overwrite, compute_betweenness=False):
             fin = snap.TFIn(data_file2)
             auth_hashtable.Load(fin)
 
+        package_index = context.get_package_index()
         top_n_hubs = get_top_nodes_from_hashtable(hubs_hashtable)
         top_n_hubs.sort(key=itemgetter(1))
-        if "top_n_hits_hubs" not in statistics or overwrite:
-            top_n_labeled = []
-            for pair in top_n_hubs:
-                top_n_labeled.append((id_pkg_dict[pair[0]], pair[1]))
-            statistics["top_n_hits_hubs"] = list(reversed(top_n_labeled))
+        if context.is_missing("top_n_hits_hubs"):
+            statistics["top_n_hits_hubs"] = get_top_n_labeled(package_index, top_n_hubs)
 
         top_n_auth = get_top_nodes_from_hashtable(auth_hashtable)
         top_n_auth.sort(key=itemgetter(1))
-        if "top_n_hits_authorities" not in statistics or overwrite:
-            top_n_labeled = []
-            for pair in top_n_auth:
-                top_n_labeled.append((id_pkg_dict[pair[0]], pair[1]))
-            statistics["top_n_hits_authorities"] = list(reversed(top_n_labeled))
+        if context.is_missing("top_n_hits_authorities"):
+            statistics["top_n_hits_authorities"] = get_top_n_labeled(package_index, top_n_auth)
 
-        if not os.path.isfile(output_hub) or not os.path.isfile(output_auth) or overwrite:
+        if not os.path.isfile(output_hub) or not os.path.isfile(output_auth) or context.overwrite:
             nodes_subset = set()
             for pair in top_n_hubs:
                 nodes_subset.add(pair[0])
@@ -202,107 +449,209 @@ def compute_graph_statistics(graph_path, overwrite, compute_betweenness=False):
 
             # let's build a subgraph induced on the top N HITS auths and hubs nodes
             subgraph = get_subgraph(graph, nodes_subset)
-            labels_dict = get_labels_subset(id_pkg_dict, subgraph)
+            edges = [(edge.GetSrcNId(), edge.GetDstNId()) for edge in subgraph.Edges()]
+            labels_dict = get_labels_subset(package_index, edges)
             values = snap_hashtable_to_dict(hubs_hashtable, nodes_subset)
             values2 = snap_hashtable_to_dict(auth_hashtable, nodes_subset)
-            plot_subgraph_colored(subgraph, labels_dict, values, "HITS - Hub Index",
+            plot_subgraph_colored(edges, labels_dict, values, "HITS - Hub Index",
                                   "Play Store Graph - top 20 HITS hubs + top 20 HITS authorities", output_hub, "bwr")
-            plot_subgraph_colored(subgraph, labels_dict, values2, "HITS - Authority Index",
+            plot_subgraph_colored(edges, labels_dict, values2, "HITS - Authority Index",
                                   "Play Store Graph - top 20 HITS hubs + top 20 HITS authorities", output_auth,
                                   "bwr_r")
+    return statistics
+
+
+def is_snap_plot_missing(directory, prefix, output, overwrite):
+    for extension in (".plt", ".tab", ".png"):
+        if not os.path.isfile(os.path.join(directory, prefix + "." + output + extension)):
+            return True
+    return overwrite
+
+
+def snap_plot_task(context, name, prefix, description, plot_function, title, *args):
+    """
+    Plots one of the snap distributions, saved as <prefix>.<graph name>_<name>.{plt,tab,png}
+    """
+    import snap
+    output = context.graph_name + "_" + name
+    if is_snap_plot_missing(context.directory, prefix, output, context.overwrite):
+        print("{0} Computing {1}".format(datetime.datetime.now(), description))
+        # snap.py writes the plots to the current directory: it doesn't support absolute paths
+        current_directory = os.getcwd()
+        os.chdir(context.directory)
+        try:
+            getattr(snap, plot_function)(context.get_graph(), output, title, *args)
+        finally:
+            os.chdir(current_directory)
+    return {}
+
+
+def is_distribution_missing(context, name):
+    for extension in (".npy", ".eps"):
+        if not os.path.isfile(context.get_path("_" + name + extension)):
+            return True
+    return context.overwrite
+
+
+def save_distribution(context, name, distribution, title, x_label, y_label, x_log=True, y_log=True):
+    """
+    Saves a distribution as a (value, count) rows table, <graph name>_<name>.npy, and plots it
+    """
+    x, y = distribution
+    np.save(context.get_path("_" + name + ".npy"), np.column_stack((x, y)))
+    generate_distribution(x, y, title, x_label, y_label, context.get_path("_" + name + ".eps"), x_log, y_log)
+
+
+def degree_distribution_task(context, name, direction, title):
+    if is_distribution_missing(context, name):
+        print("{0} Computing {1}-degree distribution".format(datetime.datetime.now(), direction))
+        csr_graph = context.get_csr_graph()
+        degrees = csr_graph.get_in_degrees() if direction == "in" else csr_graph.get_out_degrees()
+        save_distribution(context, name, get_distribution(degrees), title, "{0}-degree".format(direction.title()),
+                          "Number of nodes")
+    return {}
+
+
+def components_task(context, name, strong, title):
+    statistics = OrderedDict()
+    if is_distribution_missing(context, name) or context.is_missing(name + "_count", "largest_" + name + "_size"):
+        print("{0} Computing {1} distribution".format(datetime.datetime.now(), name))
+        labels = get_components(context.get_csr_graph(), strong)
+        sizes, counts = get_component_sizes_distribution(labels)
+        statistics[name + "_count"] = int(counts.sum())
+        statistics["largest_" + name + "_size"] = int(sizes[-1]) if len(sizes) else 0
+        save_distribution(context, name, (sizes, counts), title, "Size of the component", "Number of components")
+    return statistics
+
+
+def get_graph_core_numbers(context):
+    """
+    Core numbers of the nodes, cached by graph fingerprint
+    """
+    cache = get_graph_cache(context.graph_path)
+    fingerprint = cache.get_file_fingerprint(context.graph_path)
+    entry_path = None if context.force else cache.get("core_numbers", fingerprint)
+    if entry_path is None:
+        core_numbers = get_core_numbers(context.get_csr_graph())
+        entry_path = cache.put("core_numbers", fingerprint, None,
+                               lambda directory: np.save(os.path.join(directory, "core_numbers.npy"), core_numbers))
+    return np.load(os.path.join(entry_path, "core_numbers.npy"))
+
+
+def kcore_task(context, name, title):
+    statistics = OrderedDict()
+    if is_distribution_missing(context, name) or context.is_missing("max_core_number"):
+        print("{0} Computing {1} distribution".format(datetime.datetime.now(), name.replace("_", " ")))
+        core_numbers = get_graph_core_numbers(context)
+        nodes_distribution, edges_distribution = get_kcore_distributions(context.get_csr_graph(), core_numbers)
+        statistics["max_core_number"] = int(core_numbers.max()) if len(core_numbers) else 0
+        if name == "kcore_nodes":
+            save_distribution(context, name, nodes_distribution, title, "k", "Number of nodes in the k-core",
+                              x_log=False)
+        else:
+            save_distribution(context, name, edges_distribution, title, "k", "Number of edges in the k-core",
+                              x_log=False)
+    return statistics
+
+
+# the snap_graph and csr_graph inputs tell which representation of the graph a task reads, so that the snap graph
+# is loaded only when a selected task needs it
+GRAPH_STATISTICS_TASKS = [
+    Task("general", general_statistics_task, inputs=["snap_graph"], outputs=["main_statistics"]),
+    Task("max_degree", max_degree_task, inputs=["snap_graph"], outputs=["max_in_degree", "max_out_degree"]),
+    Task("pagerank", pagerank_task, inputs=["csr_graph"], outputs=["pageranks", "top_n_pagerank"]),
+    # in the scheduler process, so that its pivots are spread over a pool of jobs processes
+    Task("betweenness", betweenness_task, inputs=["csr_graph"], outputs=["node_betweenness", "top_n_betweenness"],
+         in_parent=True),
+    Task("hits", hits_task, inputs=["snap_graph"], outputs=["hits_hubs", "hits_auth", "top_n_hits"]),
+    Task("indegree", degree_distribution_task, inputs=["csr_graph"], outputs=["indegree_distribution"],
+         args=("indegree", "in", "Play Store Graph - in-degree Distribution")),
+    Task("outdegree", degree_distribution_task, inputs=["csr_graph"], outputs=["outdegree_distribution"],
+         args=("outdegree", "out", "Play Store Graph - out-degree Distribution")),
+    Task("scc", components_task, inputs=["csr_graph"], outputs=["scc_distribution"],
+         args=("scc", True, "Play Store Graph - strongly connected components distribution")),
+    Task("wcc", components_task, inputs=["csr_graph"], outputs=["wcc_distribution"],
+         args=("wcc", False, "Play Store Graph - weakly connected components distribution")),
+    Task("clustering", snap_plot_task, inputs=["snap_graph"], outputs=["cf_distribution"],
+         args=("cf", "ccf", "cf distribution", "PlotClustCf",
+               "Play Store Graph - clustering coefficient distribution")),
+    Task("hops", snap_plot_task, inputs=["snap_graph"], outputs=["hops_distribution"],
+         args=("hops", "hop", "shortest path distribution", "PlotHops",
+               "Play Store Graph - Cumulative Shortest Paths (hops) distribution", True)),
+    # kcore_edges reuses the core numbers cached by kcore_nodes
+    Task("kcore_nodes", kcore_task, inputs=["csr_graph"], outputs=["kcore_nodes_distribution", "core_numbers"],
+         args=("kcore_nodes", "Play Store Graph - K-Core nodes distribution")),
+    Task("kcore_edges", kcore_task, inputs=["csr_graph", "core_numbers"], outputs=["kcore_edges_distribution"],
+         args=("kcore_edges", "Play Store Graph - K-Core edges distribution")),
+]
+
+
+def compute_graph_statistics(graph_path, overwrite, damping=0.85, tolerance=1e-6, personalization=None,
+                             betweenness_samples=1000, jobs=1, only=None, skip=None, cache_size=None,
+                             invalidate=None):
+    graph_abs_path = os.path.abspath(graph_path)
+    graph_name = os.path.basename(graph_abs_path).replace(".graph", "")
+    directory = os.path.dirname(graph_abs_path)
+    json_path = os.path.join(directory, graph_name + "_statistics.json")
+    if os.path.isfile(json_path):
+        with open(json_path, "r") as f:
+            statistics = json.load(f, object_pairs_hook=OrderedDict)
+    else:
+        statistics = OrderedDict()
 
-    # indegree histogram
-    output = graph_name + "_indegree"
-    if not os.path.isfile("inDeg." + output + ".plt") or not os.path.isfile(
-                            "inDeg." + output + ".tab") or not os.path.isfile("inDeg." + output + ".png") or overwrite:
-        print("{0} Computing indegree distribution".format(datetime.datetime.now()))
-        snap.PlotInDegDistr(graph, output, "Play Store Graph - in-degree Distribution")
-
-    # outdegree histogram
-    output = graph_name + "_outdegree"
-    if not os.path.isfile("outDeg." + output + ".plt") or not os.path.isfile(
-                            "outDeg." + output + ".tab") or not os.path.isfile(
-                        "outDeg." + output + ".png") or overwrite:
-        print("{0} Computing outdegree distribution".format(datetime.datetime.now()))
-        snap.PlotOutDegDistr(graph, output, "Play Store Graph - out-degree Distribution")
-
-    # strongly connected components print
-    output = graph_name + "_scc"
-    if not os.path.isfile("scc." + output + ".plt") or not os.path.isfile(
-                            "scc." + output + ".tab") or not os.path.isfile("scc." + output + ".png") or overwrite:
-        print("{0} Computing scc distribution".format(datetime.datetime.now()))
-        snap.PlotSccDistr(graph, output, "Play Store Graph - strongly connected components distribution")
-
-    # weakly connected components print
-    output = graph_name + "_wcc"
-    if not os.path.isfile("wcc." + output + ".plt") or not os.path.isfile(
-                            "wcc." + output + ".tab") or not os.path.isfile("wcc." + output + ".png") or overwrite:
-        print("{0} Computing wcc distribution".format(datetime.datetime.now()))
-        snap.PlotWccDistr(graph, output, "Play Store Graph - weakly connected components distribution")
-
-    # clustering coefficient distribution
-    output = graph_name + "_cf"
-    if not os.path.isfile("ccf." + output + ".plt") or not os.path.isfile(
-                            "ccf." + output + ".tab") or not os.path.isfile("ccf." + output + ".png") or overwrite:
-        print("{0} Computing cf distribution".format(datetime.datetime.now()))
-        snap.PlotClustCf(graph, output, "Play Store Graph - clustering coefficient distribution")
-
-    # shortest path distribution
-    output = graph_name + "_hops"
-    if not os.path.isfile("hop." + output + ".plt") or not os.path.isfile(
-                            "hop." + output + ".tab") or not os.path.isfile("hop." + output + ".png") or overwrite:
-        print("{0} Computing shortest path distribution".format(datetime.datetime.now()))
-        snap.PlotHops(graph, output, "Play Store Graph - Cumulative Shortest Paths (hops) distribution", True)
-
-    # k-core edges distribution
-    output = graph_name + "_kcore_edges"
-    if not os.path.isfile("coreEdges." + output + ".plt") or not os.path.isfile(
-                            "coreEdges." + output + ".tab") or not os.path.isfile(
-                        "coreEdges." + output + ".png") or overwrite:
-        print("{0} Computing k-core edges distribution".format(datetime.datetime.now()))
-        snap.PlotKCoreEdges(graph, output, "Play Store Graph - K-Core edges distribution")
-
-    # k-core nodes distribution
-    output = graph_name + "_kcore_nodes"
-    if not os.path.isfile("coreNodes." + output + ".plt") or not os.path.isfile(
-                            "coreNodes." + output + ".tab") or not os.path.isfile(
-                        "coreNodes." + output + ".png") or overwrite:
-        print("{0} Computing k-core nodes distribution".format(datetime.datetime.now()))
-        snap.PlotKCoreNodes(graph, output, "Play Store Graph - K-Core nodes distribution")
+    tasks = select_tasks(GRAPH_STATISTICS_TASKS, only, skip)
+
+    cache = get_graph_cache(graph_abs_path, cache_size)
+    if invalidate:
+        print("{0} Invalidated {1} cache entries".format(datetime.datetime.now(), cache.invalidate(invalidate)))
+    fingerprint = cache.get_file_fingerprint(graph_abs_path)
+    context = GraphContext(graph_abs_path, overwrite, statistics, damping, tolerance, personalization,
+                           betweenness_samples, jobs)
+    # a task whose result was not cached for this graph and parameters is stale: recompute all its outputs
+    task_contexts = {}
+    for task in tasks:
+        stale = overwrite or cache.get(task.name, fingerprint, get_task_params(task, context)) is None
+        task_contexts[task.name] = context.with_overwrite(stale)
+
+    # load the graphs needed by the tasks before forking, so that the workers share their (copy-on-write) pages
+    if any("snap_graph" in task.inputs for task in tasks):
+        context.get_graph()
+    if any("csr_graph" in task.inputs for task in tasks):
+        context.get_csr_graph()
+    # and build the missing on-disk package index once, instead of in every worker needing it
+    if tasks and has_csr_graph(graph_abs_path) and not has_package_index(graph_abs_path):
+        context.get_package_index()
+    results = run_tasks(tasks, task_contexts, jobs)
+
+    print("{0} Tasks timing:".format(datetime.datetime.now()))
+    for task in tasks:
+        result, elapsed, error = results[task.name]
+        print("  {0:<12} {1:>10.1f}s {2}".format(task.name, elapsed, "FAILED" if error else ""))
+        if result:
+            statistics.update(result)
+        if not error and task_contexts[task.name].overwrite:
+            cache.put_json(task.name, fingerprint, get_task_params(task, context), result or {})
+    cache.write_manifest()
 
     with open(json_path, 'w') as outfile:
         json.dump(statistics, outfile, indent=2)
 
 
-def get_top_packages(graph_path, n):
+def get_top_packages(graph_path, n, damping=0.85, tolerance=1e-6, personalization=None, packages=None):
+    """
+    Top n packages by PageRank; if packages is given, only the ones among them are ranked
+    """
     graph_abs_path = os.path.abspath(graph_path)
-    graph_name = os.path.basename(graph_abs_path).replace(".graph", "")
-    fin = snap.TFIn(graph_abs_path)
-    graph = snap.TNEANet.Load(fin)
-    # rebuild the id => pkg dictionary
-    id_pkg_dict = {}
-    for node in graph.Nodes():
-        id_pkg_dict[node.GetId()] = graph.GetStrAttrDatN(node.GetId(), "pkg")
-    directory = os.path.dirname(os.path.abspath(graph_path))
-
-    # snap.py doesn't suport absolute paths for some operations. Let's cd to the directory
-    os.chdir(directory)
+    package_index = get_package_index(graph_abs_path)
+    prank_hashtable, _ = get_pageranks(graph_abs_path, False, damping, tolerance, personalization)
 
-    # print("{0} Computing top {0} nodes with highest pagerank".format(n, datetime.datetime.now()))
-    data_file = graph_name + "_pageranks"
-    prank_hashtable = snap.TIntFltH()
-    if not os.path.isfile(data_file):
-        # Damping Factor: 0.85, Convergence difference: 1e-4, MaxIter: 100
-        snap.GetPageRank(graph, prank_hashtable, 0.85)
-        fout = snap.TFOut(data_file)
-        prank_hashtable.Save(fout)
+    if packages:
+        top_n = top_k(((node_id, prank_hashtable[node_id]) for node_id in package_index.get_ids(packages)), n,
+                      keep_last=True)
     else:
-        fin = snap.TFIn(data_file)
-        prank_hashtable.Load(fin)
-
-    top_n = get_top_nodes_from_hashtable(prank_hashtable, n)
+        top_n = get_top_nodes_from_hashtable(prank_hashtable, n)
     top_n.sort(key=itemgetter(1))
     top_packages = []
     for pair in top_n:
-        top_packages.append(id_pkg_dict[pair[0]])
+        top_packages.append(package_index.get_package(pair[0]))
     return top_packages
@@ -1,54 +1,83 @@
 import datetime
-import json
 import os
 import time
+from array import array
+from itertools import islice
 
-import snap
+try:
+    from itertools import izip
+except ImportError:
+    izip = zip
 
-from db_interface import get_edge_number, get_all
+import numpy as np
 
-id_pkg_dict = {}
+from csr_graph import PackageInterner, save_csr_graph
+from db_interface import get_similar_apps
+from package_index import save_package_index
+from stats_tools import to_array
 
+BATCH_SIZE = 10000
 
-def get_id_from_package(graph, package):
-    node_id = id_pkg_dict.get(package, -1)
-    if node_id == -1:
-        node_id = graph.AddNode(-1)
-        id_pkg_dict[package] = node_id
+
+def read_similarity_edges(batch_size=BATCH_SIZE, jobs=1):
+    """
+    Streams the similarity relationships from the DB (read by jobs threads); returns the interned packages and
+    the edges as two parallel int32 arrays (source ids, destination ids)
+    """
+    interner = PackageInterner()
+    sources = array('i')
+    destinations = array('i')
+    docs = get_similar_apps(batch_size, jobs)
+    n_docs = 0
+    while True:
+        batch = list(islice(docs, batch_size))
+        if not batch:
+            break
+        for doc in batch:
+            node_id = interner.get_id(doc.get('docid'))
+            similar_packages = doc.get('similarTo') or []
+            sources.extend([node_id] * len(similar_packages))
+            destinations.extend([interner.get_id(p) for p in similar_packages])
+        n_docs += len(batch)
+        print("{0} {1} apps read, {2} nodes, {3} edges".format(datetime.datetime.now(), n_docs, len(interner),
+                                                              len(sources)))
+    # to_array, since np.frombuffer fails on the empty arrays of an empty collection
+    return interner, to_array(sources, np.int32), to_array(destinations, np.int32)
+
+
+def build_snap_graph(packages, sources, destinations):
+    # imported here, so that reading the edges doesn't need snap.py
+    import snap
+    graph = snap.TNEANet.New(len(packages), len(sources))
+    for node_id, package in enumerate(packages):
+        graph.AddNode(node_id)
         graph.AddStrAttrDatN(node_id, package, "pkg")
-    return node_id
+    # converted to python ints a batch at a time, never the whole edge arrays at once
+    for start in range(0, len(sources), BATCH_SIZE):
+        end = start + BATCH_SIZE
+        for source, destination in izip(sources[start:end].tolist(), destinations[start:end].tolist()):
+            graph.AddEdge(source, destination)
+    return graph
 
 
-def create_play_store_graph(output_graph_path):
+def create_play_store_graph(output_graph_path, jobs=1):
+    import snap
     start = time.time()
-    docs = get_all()
-    n = docs.count()
-    print("# Nodes: {0}".format(n))
-    m = get_edge_number()
-    print("# Edges: {0}".format(m))
-    graph = snap.TNEANet.New(n, m)
-    i = 0
-    for doc in docs:
-        if i % 10000 == 0:
-            print("{0} {1:.2f}% completed".format(datetime.datetime.now(), float(i) / n * 100.0))
-        package = doc.get('docid')
-        node_id = get_id_from_package(graph, package)
-        similar_packages = doc.get('similarTo')
-        for p in similar_packages:
-            target_id = get_id_from_package(graph, p)
-            graph.AddEdge(node_id, target_id)
-        i += 1
+    interner, sources, destinations = read_similarity_edges(jobs=jobs)
+    print("# Nodes: {0}".format(len(interner)))
+    print("# Edges: {0}".format(len(sources)))
+    graph = build_snap_graph(interner.packages, sources, destinations)
     end = time.time()
     print("Saving to binary")
     graph_path = os.path.abspath(output_graph_path + ".graph")
     fout = snap.TFOut(graph_path)
     graph.Save(fout)
     fout.Flush()
+    print("Saving CSR representation")
+    save_csr_graph(graph_path, interner.packages, sources, destinations)
     print("Saving Edge List")
     edgelist_path = os.path.abspath(output_graph_path + ".edgelist.txt")
     snap.SaveEdgeList(graph, edgelist_path, "Google Play Store snapshot graph, period 10/08/2017 - 07/09/2017")
-    print("Saving dictionary")
-    dict_path = os.path.abspath(output_graph_path + ".pkg_to_id_dict.json")
-    with open(dict_path, 'w') as f:
-        f.write(json.dumps(id_pkg_dict, indent=4))
+    print("Saving packages index")
+    save_package_index(graph_path, interner.packages)
     print("Total time: {0}".format(end - start))
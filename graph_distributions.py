@@ -0,0 +1,114 @@
+from array import array
+
+import numpy as np
+import scipy.sparse
+from scipy.sparse.csgraph import connected_components
+
+
+def get_distribution(values):
+    """
+    (values, counts) of the distinct values of a non-negative integer array, in increasing order of value
+    """
+    counts = np.bincount(np.asarray(values))
+    distinct = np.flatnonzero(counts)
+    return distinct, counts[distinct]
+
+
+def get_adjacency_matrix(csr_graph):
+    """
+    0/1 adjacency matrix of the graph, the multi-edges collapsed into a single entry (the strongly connected
+    components of scipy don't terminate on matrices with duplicate entries)
+    """
+    data = np.ones(csr_graph.n_edges, dtype=np.int8)
+    # copied, since the CSR graph arrays are usually read-only memory maps
+    matrix = scipy.sparse.csr_matrix((data, np.array(csr_graph.indices), np.array(csr_graph.indptr)),
+                                     shape=(csr_graph.n_nodes, csr_graph.n_nodes))
+    matrix.sum_duplicates()
+    matrix.data[:] = 1
+    return matrix
+
+
+def get_components(csr_graph, strong):
+    """
+    Component label of every node, for the strongly (or weakly) connected components of the graph
+    """
+    _, labels = connected_components(get_adjacency_matrix(csr_graph), directed=True,
+                                     connection="strong" if strong else "weak")
+    return labels
+
+
+def get_component_sizes_distribution(labels):
+    """
+    (component sizes, number of components of that size)
+    """
+    return get_distribution(np.bincount(labels))
+
+
+def get_undirected_adjacency(csr_graph):
+    """
+    (indptr, indices) of the undirected simple graph underlying the directed graph (no loops, no multi-edges)
+    """
+    matrix = get_adjacency_matrix(csr_graph)
+    matrix = (matrix + matrix.T).tocsr()
+    matrix = matrix - scipy.sparse.diags(matrix.diagonal(), format="csr")
+    matrix.eliminate_zeros()
+    matrix.sort_indices()
+    return matrix.indptr, matrix.indices
+
+
+def get_core_numbers(csr_graph):
+    """
+    Core number of every node of the undirected graph underlying the directed graph: the largest k such that
+    the node belongs to the k-core. Bucket queue decomposition (Batagelj and Zaversnik), linear in the edges.
+    """
+    indptr, indices = get_undirected_adjacency(csr_graph)
+    n_nodes = len(indptr) - 1
+    degrees = np.diff(indptr)
+    if n_nodes == 0:
+        return degrees
+    # the nodes sorted by degree, bin_starts[d] is the position of the first node of degree d
+    bin_starts = np.zeros(degrees.max() + 2, dtype=np.int64)
+    bin_starts[1:] = np.cumsum(np.bincount(degrees))
+    nodes_order = np.argsort(degrees, kind="mergesort")
+    positions = np.empty(n_nodes, dtype=np.int64)
+    positions[nodes_order] = np.arange(n_nodes)
+    # python sequences are way faster than numpy arrays when accessed one element at a time
+    degrees = degrees.tolist()
+    bin_starts = bin_starts.tolist()
+    nodes_order = nodes_order.tolist()
+    positions = positions.tolist()
+    indptr = indptr.tolist()
+    indices = array('i', indices.astype(np.int32).tobytes())
+    for i in range(n_nodes):
+        node = nodes_order[i]
+        node_degree = degrees[node]
+        for neighbor in indices[indptr[node]:indptr[node + 1]]:
+            neighbor_degree = degrees[neighbor]
+            if neighbor_degree > node_degree:
+                # move the neighbor to the start of its bin, then shrink the bin past it
+                position = positions[neighbor]
+                first_position = bin_starts[neighbor_degree]
+                first = nodes_order[first_position]
+                if first != neighbor:
+                    nodes_order[position], nodes_order[first_position] = first, neighbor
+                    positions[neighbor], positions[first] = first_position, position
+                bin_starts[neighbor_degree] += 1
+                degrees[neighbor] = neighbor_degree - 1
+    return np.array(degrees, dtype=np.int64)
+
+
+def get_kcore_distributions(csr_graph, core_numbers):
+    """
+    (k, number of nodes in the k-core) and (k, number of edges in the k-core) for k = 1, ..., max core number,
+    the edges being the ones of the undirected graph underlying the directed graph
+    """
+    max_core = int(core_numbers.max()) if len(core_numbers) else 0
+    ks = np.arange(1, max_core + 1)
+    # the nodes (edges) of the k-core are the ones with (both endpoints with) core number >= k
+    nodes_counts = np.cumsum(np.bincount(core_numbers, minlength=max_core + 1)[::-1])[::-1][1:]
+    indptr, indices = get_undirected_adjacency(csr_graph)
+    sources = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    upper = sources < indices
+    edge_cores = np.minimum(core_numbers[sources[upper]], core_numbers[indices[upper]])
+    edges_counts = np.cumsum(np.bincount(edge_cores, minlength=max_core + 1)[::-1])[::-1][1:]
+    return (ks, nodes_counts), (ks, edges_counts)
@@ -0,0 +1,91 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+LAYOUT_CACHE_DIRECTORY = ".layout_cache"
+
+# layouts computed by this process, keyed by get_layout_key
+computed_layouts = {}
+
+
+def get_layout_key(nodes, edges):
+    """
+    Identifies a subgraph by its (sorted) nodes and edges
+    """
+    key = [sorted(nodes), sorted(sorted(edge) for edge in edges)]
+    return hashlib.sha1(json.dumps(key).encode("utf-8")).hexdigest()
+
+
+def spring_layout(nodes, edges, k=0.4, max_iterations=1000, threshold=1e-4, seed=0):
+    """
+    Fruchterman-Reingold force-directed layout: at every step all the pairwise repulsive and attractive forces
+    are computed at once with array operations, and the nodes move along the net force by at most the current
+    temperature. Stops when the average net force on the nodes falls below threshold, i.e. the layout is in
+    equilibrium (or after max_iterations).
+    Returns the {node: (x, y)} positions, rescaled in [-1, 1].
+    """
+    nodes = list(nodes)
+    n_nodes = len(nodes)
+    if n_nodes == 0:
+        return {}
+    if n_nodes == 1:
+        return {nodes[0]: (0.0, 0.0)}
+    index = dict((node, i) for i, node in enumerate(nodes))
+    adjacency = np.zeros((n_nodes, n_nodes))
+    for source, destination in edges:
+        # the direction of the edges doesn't matter for the layout
+        adjacency[index[source], index[destination]] = 1.0
+        adjacency[index[destination], index[source]] = 1.0
+
+    positions = np.random.RandomState(seed).rand(n_nodes, 2)
+    temperature = 0.1
+    cooling = temperature / (max_iterations + 1)
+    for _ in range(max_iterations):
+        delta = positions[:, np.newaxis, :] - positions[np.newaxis, :, :]
+        distance = np.maximum(np.sqrt((delta ** 2).sum(axis=-1)), 0.01)
+        # repulsion k^2 / d between every pair, attraction d^2 / k along the edges
+        forces = k * k / distance ** 2 - adjacency * distance / k
+        displacement = (delta * forces[:, :, np.newaxis]).sum(axis=1)
+        length = np.sqrt((displacement ** 2).sum(axis=-1))
+        if length.mean() < threshold:
+            break
+        step = np.minimum(length, temperature) / np.maximum(length, 0.01)
+        positions += displacement * step[:, np.newaxis]
+        temperature -= cooling
+
+    positions -= positions.mean(axis=0)
+    scale = np.abs(positions).max()
+    if scale > 0:
+        positions /= scale
+    return dict((node, (float(x), float(y))) for node, (x, y) in zip(nodes, positions))
+
+
+def get_layout(nodes, edges, cache_directory=None):
+    """
+    spring_layout of the subgraph, reusing the positions computed for the same subgraph by this process or,
+    if cache_directory is given, saved there by a previous run
+    """
+    key = get_layout_key(nodes, edges)
+    layout = computed_layouts.get(key)
+    if layout is not None:
+        return layout
+    cache_path = None
+    if cache_directory is not None:
+        cache_path = os.path.join(cache_directory, key + ".json")
+        if os.path.isfile(cache_path):
+            with open(cache_path, "r") as f:
+                layout = dict((node, tuple(position)) for node, position in json.load(f))
+    if layout is None:
+        layout = spring_layout(nodes, edges)
+        if cache_path is not None:
+            if not os.path.isdir(cache_directory):
+                os.makedirs(cache_directory)
+            # written to a temporary file, so that parallel renderers never read a partial layout
+            temp_path = "{0}.{1}.tmp".format(cache_path, os.getpid())
+            with open(temp_path, "w") as f:
+                json.dump([[node, position] for node, position in layout.items()], f)
+            os.rename(temp_path, cache_path)
+    computed_layouts[key] = layout
+    return layout
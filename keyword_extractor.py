@@ -0,0 +1,179 @@
+import datetime
+import json
+import multiprocessing
+import re
+from collections import Counter
+from operator import itemgetter
+
+from rake_nltk import Rake
+
+import db_interface
+from keyword_index import KeywordIndex, get_description_hash
+from topk import top_k
+
+HTML_TAG = re.compile(r'<.*?>')
+NON_ASCII = re.compile(r'[^\x00-\x7F]+')
+
+
+def get_description_text(doc):
+    if "translatedDescriptionHtml" in doc:
+        html_description = unicode(doc.get("translatedDescriptionHtml"))
+    else:
+        html_description = unicode(doc.get("descriptionHtml"))
+    # remove html elements
+    description = HTML_TAG.sub('', html_description)
+    # substitute non-ascii chars with stop words (e.g. dot)
+    return NON_ASCII.sub(' . ', description)
+
+
+def add_keywords(rake, keywords, description):
+    rake.extract_keywords_from_text(description)
+    for score, phrase in rake.get_ranked_phrases_with_scores():
+        keywords[phrase] += score
+
+
+def extract_range_keywords(args):
+    """
+    Sum of the RAKE scores of every phrase in the descriptions of the given _id range
+    """
+    packages, id_range = args
+    rake = Rake()
+    keywords = Counter()
+    for doc in db_interface.get_descriptions(packages, id_range):
+        try:
+            add_keywords(rake, keywords, get_description_text(doc))
+        except AttributeError:
+            continue
+    return keywords
+
+
+def write_keywords(dump_path, keywords):
+    """
+    Writes the (keyword, score) pairs as a JSON list one pair at a time, without building the whole document
+    """
+    with open(dump_path, 'w') as outfile:
+        outfile.write("[")
+        separator = "\n"
+        for pair in keywords:
+            outfile.write(separator + "  " + json.dumps(pair))
+            separator = ",\n"
+        outfile.write("\n]\n")
+
+
+def extract_keywords(dump_path, packages, jobs=1, top_n=None):
+    """
+    Computes the keywords of the app descriptions with RAKE, summing the scores of each phrase over all the
+    descriptions, and dumps them sorted by ascending score (only the top_n ones, if given).
+    The descriptions are split into _id ranges, processed by a pool of jobs processes.
+    """
+    print("{0} Gathering descriptions and computing keywords...".format(datetime.datetime.now()))
+    # more ranges than workers, so that a slow range doesn't leave the other workers idle
+    id_ranges = db_interface.get_descriptions_id_ranges(packages, jobs * 4 if jobs > 1 else 1)
+    shards = [(packages, id_range) for id_range in id_ranges]
+    keywords = Counter()
+    if jobs > 1:
+        pool = multiprocessing.Pool(jobs, initializer=db_interface.reconnect)
+        try:
+            for i, partial in enumerate(pool.imap_unordered(extract_range_keywords, shards)):
+                keywords.update(partial)
+                print("{0} Processed {1}/{2} description ranges".format(datetime.datetime.now(), i + 1,
+                                                                         len(shards)))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for shard in shards:
+            keywords.update(extract_range_keywords(shard))
+
+    print("{0} Writing {1} keywords".format(datetime.datetime.now(), top_n or len(keywords)))
+    if top_n:
+        sorted_keywords = reversed(top_k(keywords.items(), top_n))
+    else:
+        sorted_keywords = sorted(keywords.items(), key=itemgetter(1))
+    write_keywords(dump_path, sorted_keywords)
+
+
+def get_range_changes(args):
+    """
+    Docids of the apps in the _id range, plus (docid, description hash, RAKE ranking) for the apps whose
+    description is not in the index or changed since it was indexed
+    """
+    index_path, id_range = args
+    index = KeywordIndex(index_path, create=False)
+    rake = Rake()
+    docids = []
+    changes = []
+    try:
+        for doc in db_interface.get_descriptions(None, id_range):
+            docid = doc.get("docid")
+            if docid is None:
+                continue
+            try:
+                description = get_description_text(doc)
+            except AttributeError:
+                continue
+            docids.append(docid)
+            description_hash = get_description_hash(description)
+            if index.get_description_hash(docid) != description_hash:
+                rake.extract_keywords_from_text(description)
+                changes.append((docid, description_hash, rake.get_ranked_phrases_with_scores()))
+    finally:
+        index.close()
+    return docids, changes
+
+
+def update_keyword_index(index, jobs=1):
+    """
+    Brings the index up to date with the DB: only the new and changed descriptions are processed, and the
+    apps no longer in the DB are removed
+    """
+    id_ranges = db_interface.get_descriptions_id_ranges(None, jobs * 4 if jobs > 1 else 1)
+    shards = [(index.path, id_range) for id_range in id_ranges]
+    pool = None
+    if jobs > 1:
+        pool = multiprocessing.Pool(jobs, initializer=db_interface.reconnect)
+        partials = pool.imap_unordered(get_range_changes, shards)
+    else:
+        partials = (get_range_changes(shard) for shard in shards)
+    seen = set()
+    n_changed = 0
+    try:
+        for i, (docids, changes) in enumerate(partials):
+            seen.update(docids)
+            for docid, description_hash, ranking in changes:
+                index.set_app(docid, description_hash, ranking)
+            index.commit()
+            n_changed += len(changes)
+            print("{0} Processed {1}/{2} description ranges".format(datetime.datetime.now(), i + 1, len(shards)))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    removed = index.get_docids() - seen
+    for docid in removed:
+        index.remove_app(docid)
+    index.commit()
+    print("{0} Keyword index updated: {1} apps changed, {2} removed, {3} unchanged".format(
+        datetime.datetime.now(), n_changed, len(removed), len(seen) - n_changed))
+
+
+def extract_indexed_keywords(dump_path, index_path, packages, jobs=1, top_n=None):
+    """
+    Same as extract_keywords, using the keyword index at index_path: without packages the index is updated
+    and the keywords of all the apps are dumped; with packages the keywords of the subset are computed from
+    the index alone, without reading the DB
+    """
+    index = KeywordIndex(index_path)
+    try:
+        if packages:
+            missing = index.count_missing(packages)
+            if missing:
+                print("{0} {1} packages are not in the keyword index".format(datetime.datetime.now(), missing))
+            top_keywords = index.get_subset_top_keywords(packages, top_n)
+        else:
+            update_keyword_index(index, jobs)
+            top_keywords = index.get_top_keywords(top_n)
+    finally:
+        index.close()
+    print("{0} Writing {1} keywords".format(datetime.datetime.now(), len(top_keywords)))
+    write_keywords(dump_path, reversed(top_keywords))
@@ -0,0 +1,100 @@
+import hashlib
+import sqlite3
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS apps (docid TEXT PRIMARY KEY, description_hash TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS phrases (docid TEXT NOT NULL, phrase TEXT NOT NULL, score REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS phrases_docid ON phrases (docid)",
+    "CREATE TABLE IF NOT EXISTS totals (phrase TEXT PRIMARY KEY, score REAL NOT NULL)",
+]
+# totals left by subtracting all the contributions of a phrase are rounding errors
+ZERO_SCORE = 1e-9
+
+
+def get_description_hash(description):
+    return hashlib.sha1(description.encode("utf-8")).hexdigest()
+
+
+class KeywordIndex(object):
+    """
+    sqlite index of the RAKE phrases of every app description: the per-app phrase scores, the hash of the
+    description they were computed from (to detect the changed descriptions) and the sum of the scores of
+    every phrase over all the apps, kept up to date on every change
+    """
+
+    def __init__(self, path, create=True):
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=60)
+        if create:
+            # readers (e.g. the extraction workers) are not blocked while the index is written
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            for statement in SCHEMA:
+                self.connection.execute(statement)
+            self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def get_description_hash(self, docid):
+        row = self.connection.execute("SELECT description_hash FROM apps WHERE docid = ?", (docid,)).fetchone()
+        return row[0] if row else None
+
+    def get_docids(self):
+        return set(row[0] for row in self.connection.execute("SELECT docid FROM apps"))
+
+    def remove_app(self, docid):
+        """
+        Removes the phrases of the app, subtracting their scores from the totals
+        """
+        self.connection.execute("UPDATE totals SET score = score - "
+                                "(SELECT SUM(score) FROM phrases WHERE phrases.docid = ? AND phrases.phrase = "
+                                "totals.phrase) WHERE phrase IN (SELECT phrase FROM phrases WHERE docid = ?)",
+                                (docid, docid))
+        self.connection.execute("DELETE FROM phrases WHERE docid = ?", (docid,))
+        self.connection.execute("DELETE FROM apps WHERE docid = ?", (docid,))
+
+    def set_app(self, docid, description_hash, ranking):
+        """
+        Replaces the phrases of the app with ranking, a list of (score, phrase) pairs
+        """
+        self.remove_app(docid)
+        self.connection.execute("INSERT INTO apps (docid, description_hash) VALUES (?, ?)",
+                                (docid, description_hash))
+        self.connection.executemany("INSERT INTO phrases (docid, phrase, score) VALUES (?, ?, ?)",
+                                    ((docid, phrase, score) for score, phrase in ranking))
+        for score, phrase in ranking:
+            self.connection.execute("INSERT OR IGNORE INTO totals (phrase, score) VALUES (?, 0)", (phrase,))
+            self.connection.execute("UPDATE totals SET score = score + ? WHERE phrase = ?", (score, phrase))
+
+    def commit(self):
+        self.connection.execute("DELETE FROM totals WHERE score < ?", (ZERO_SCORE,))
+        self.connection.commit()
+
+    def get_top_keywords(self, n=None):
+        """
+        (phrase, total score) pairs sorted by descending score, over all the indexed apps
+        """
+        query = "SELECT phrase, score FROM totals ORDER BY score DESC"
+        if n:
+            return self.connection.execute(query + " LIMIT ?", (n,)).fetchall()
+        return self.connection.execute(query).fetchall()
+
+    def get_subset_top_keywords(self, packages, n=None):
+        """
+        Same as get_top_keywords, summing only the scores of the given packages
+        """
+        self.connection.execute("CREATE TEMP TABLE IF NOT EXISTS subset (docid TEXT PRIMARY KEY)")
+        self.connection.execute("DELETE FROM subset")
+        self.connection.executemany("INSERT OR IGNORE INTO subset (docid) VALUES (?)",
+                                    ((package,) for package in packages))
+        query = "SELECT phrase, SUM(score) AS total FROM phrases WHERE docid IN (SELECT docid FROM subset) " \
+                "GROUP BY phrase ORDER BY total DESC"
+        if n:
+            return self.connection.execute(query + " LIMIT ?", (n,)).fetchall()
+        return self.connection.execute(query).fetchall()
+
+    def count_missing(self, packages):
+        """
+        Number of the given packages that are not in the index
+        """
+        return sum(1 for package in set(packages) if self.get_description_hash(package) is None)
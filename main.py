@@ -1,8 +1,14 @@
 import argparse
+import sys
 
-from db_analyzer import compute_db_statistics, extract_keywords
-from graph_analyzer import compute_graph_statistics, get_top_packages
+from db_analyzer import compute_db_statistics
+from db_preparation import prepare_db
+from graph_analyzer import compute_graph_statistics, get_top_packages, GRAPH_STATISTICS_TASKS
 from graph_builder import create_play_store_graph
+from keyword_extractor import extract_keywords, extract_indexed_keywords
+from package_index import read_packages_file
+from plot_tools import render_plot_specs
+from snapshot import export_snapshot
 
 
 def main():
@@ -15,40 +21,114 @@ def main():
     parser.add_argument('--overwrite', action="store_true", dest='overwrite',
                         default=False, help='Overwrite the already computed files')
     parser.add_argument('--packages', action="store", type=str, nargs='+', dest='packages',
-                        help='Consider only the submitted packages')
+                        help='Consider only the submitted packages (for --get-top-packages, they are looked up '
+                             'in the graph packages index)')
+    parser.add_argument('--packages-file', action="store", dest='packages_file',
+                        help='Consider only the packages listed in the file (separated by newlines or spaces, e.g. '
+                             'the output of --get-top-packages), in addition to the --packages ones. Large lists '
+                             'are queried in chunks, or joined from a temporary collection')
+    parser.add_argument('--cache-size', action="store", type=int, dest='cache_size_mb',
+                        help='Maximum size (MB) of the results cache; least recently used results are evicted')
+    parser.add_argument('--invalidate', action="store", type=str, nargs='+', dest='invalidate', metavar='SECTION',
+                        help='Discard the cached results of the given sections, so that they are recomputed')
     group0 = parser.add_argument_group()
     group0.add_argument('--compute-statistics', action="store", dest='input_graph_path',
                         help='Analyzes the graph and computes several statistics. Specify the '
                              'path of the .graph file to analyze.')
+    group0.add_argument('--jobs', action="store", type=int, dest='jobs', default=1,
+                        help='Number of processes used to run the independent graph analyses, to extract the '
+                             'keywords or to render the plots, and of threads reading the apps from the DB '
+                             '(default: 1)')
+    group0.add_argument('--only', action="store", type=str, nargs='+', dest='only', metavar='SECTION',
+                        help='Compute only the given graph statistics sections ({0})'.format(
+                            ", ".join(task.name for task in GRAPH_STATISTICS_TASKS)))
+    group0.add_argument('--betweenness-samples', action="store", type=int, dest='betweenness_samples',
+                        default=1000,
+                        help='Number of sampled source nodes used to approximate the betweenness centrality '
+                             '(default: 1000)')
+    group0.add_argument('--skip', action="store", type=str, nargs='+', dest='skip', metavar='SECTION',
+                        help='Do not compute the given graph statistics sections')
     group1 = parser.add_argument_group()
     group1.add_argument('--compute-db-statistics', action="store", dest='output_stats_path',
                         help='Compute several Play Store statistics directly using the data on the DB. '
                              'OUTPUT_STATS_PATH should NOT specify the file extension (multiple files are created)')
     group1.add_argument('--title', action="store", dest='title',
                         help='Main title for the plotted graphs')
+    group1.add_argument('--server-side', action="store_true", dest='server_side', default=False,
+                        help='Compute the DB statistics using aggregation pipelines executed by the DB server; '
+                             'only the values needed for percentiles are transferred')
+    group1.add_argument('--snapshot', action="store", dest='snapshot_path',
+                        help='Compute the DB statistics from a snapshot created with --export-snapshot, '
+                             'without connecting to the DB')
+    group1.add_argument('--materialized-counts', action="store_true", dest='materialized_counts', default=False,
+                        help='With --server-side, read the permissions counts stored by --prepare-db instead of '
+                             'computing them (they are stale if the apps changed after --prepare-db)')
+    group1.add_argument('--approximate', action="store_true", dest='approximate', default=False,
+                        help='Compute approximate DB statistics (with their error bounds) using sketches of '
+                             'constant size instead of all the values; not compatible with --server-side and '
+                             '--snapshot')
+    group1.add_argument('--export-snapshot', action="store", dest='export_snapshot_path',
+                        help='Export the apps fields used by the DB statistics to a local columnar snapshot '
+                             '(NPZ file)')
+    group1.add_argument('--prepare-db', action="store_true", dest='prepare_db', default=False,
+                        help='Create the indexes and the permissions count field used by the analyzers, then check '
+                             'that their queries don\'t scan whole collections (run again after each crawl)')
     group2 = parser.add_argument_group()
     group2.add_argument('--extract-keywords', action="store", dest='keywords_dump_path',
                         help='Extract keywords from app descriptions and dumps them to a text file')
+    group2.add_argument('--top-keywords', action="store", type=int, dest='top_keywords',
+                        help='Dump only the given number of keywords with the highest score')
+    group2.add_argument('--keyword-index', action="store", dest='keyword_index_path',
+                        help='sqlite keyword index of the app descriptions: it is updated processing only the new '
+                             'and changed descriptions, and the keywords of --packages are computed from it '
+                             'without reading the DB')
+    group5 = parser.add_argument_group()
+    group5.add_argument('--render-plots', action="store", type=str, nargs='+', dest='plot_specs',
+                        metavar='PLOT_SPEC',
+                        help='Render again the plots saved as .plot.json specs, without recomputing the statistics')
+    group5.add_argument('--plot-format', action="store", dest='plot_format',
+                        help='Format (file extension) of the re-rendered plots, e.g. png or svg (default: the '
+                             'original one)')
     group3 = parser.add_argument_group()
     group3.add_argument('--get-top-packages', action="store", nargs=2, dest="top_packages",
                         metavar=('N_PACKAGES', 'GRAPH_PATH'),
                         help='Returns a list of the top N_PACKAGES based on PageRank')
+    group4 = parser.add_argument_group()
+    group4.add_argument('--damping', action="store", type=float, dest='damping', default=0.85,
+                        help='PageRank damping factor (default: 0.85)')
+    group4.add_argument('--tolerance', action="store", type=float, dest='tolerance', default=1e-6,
+                        help='PageRank convergence threshold on the L1 residual, used by the native engine '
+                             '(default: 1e-6)')
+    group4.add_argument('--personalization', action="store", type=str, nargs='+', dest='personalization',
+                        help='Packages the PageRank random jumps are restricted to (personalized PageRank)')
 
     results = parser.parse_args()
+    if results.packages_file:
+        packages = results.packages or []
+        listed = set(packages)
+        results.packages = packages + [package for package in read_packages_file(results.packages_file)
+                                       if package not in listed]
+    cache_size = None
+    if results.cache_size_mb:
+        cache_size = results.cache_size_mb * 1024 * 1024
     if results.output_graph_path:
-        create_play_store_graph(results.output_graph_path)
+        create_play_store_graph(results.output_graph_path, results.jobs)
         return
 
     if results.input_graph_path:
         graph_path = results.input_graph_path
         overwrite = results.overwrite
-        compute_graph_statistics(graph_path, overwrite)
+        compute_graph_statistics(graph_path, overwrite, damping=results.damping, tolerance=results.tolerance,
+                                 personalization=results.personalization, jobs=results.jobs, only=results.only,
+                                 skip=results.skip, cache_size=cache_size, invalidate=results.invalidate,
+                                 betweenness_samples=results.betweenness_samples)
         return
 
     if results.top_packages:
         n = int(results.top_packages[0])
         graph_path = results.top_packages[1]
-        packages = get_top_packages(graph_path, n)
+        packages = get_top_packages(graph_path, n, results.damping, results.tolerance, results.personalization,
+                                    results.packages)
         output_string = ""
         for pkg in packages:
             output_string += pkg
@@ -56,6 +136,22 @@ def main():
         print(output_string)
         return
 
+    if results.plot_specs:
+        for output, error in render_plot_specs(results.plot_specs, results.jobs, results.plot_format).items():
+            print("Plot {0} failed:\n{1}".format(output, error))
+        return
+
+    if results.prepare_db:
+        collection_scans = prepare_db(results.jobs)
+        if collection_scans:
+            print("Queries scanning whole collections: {0}".format(", ".join(collection_scans)))
+            sys.exit(1)
+        return
+
+    if results.export_snapshot_path:
+        export_snapshot(results.export_snapshot_path, results.packages, jobs=results.jobs)
+        return
+
     if results.output_stats_path:
         packages = None
         title = "Play Store"
@@ -63,7 +159,9 @@ def main():
             packages = results.packages
         if results.title:
             title = results.title
-        compute_db_statistics(results.output_stats_path, packages, title, results.overwrite)
+        compute_db_statistics(results.output_stats_path, packages, title, results.overwrite, results.server_side,
+                              cache_size, results.invalidate, results.snapshot_path, results.jobs,
+                              results.approximate, results.materialized_counts)
         return
 
     if results.keywords_dump_path:
@@ -71,7 +169,11 @@ def main():
         packages = None
         if results.packages:
             packages = results.packages
-        extract_keywords(keywords_path, packages)
+        if results.keyword_index_path:
+            extract_indexed_keywords(keywords_path, results.keyword_index_path, packages, results.jobs,
+                                     results.top_keywords)
+        else:
+            extract_keywords(keywords_path, packages, results.jobs, results.top_keywords)
         return
 
     parser.print_help()
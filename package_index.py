@@ -0,0 +1,137 @@
+import os
+
+import numpy as np
+
+from csr_graph import get_base_path, build_string_table, StringTable, PKG_BLOB_SUFFIX, PKG_OFFSETS_SUFFIX
+
+SORTED_BLOB_SUFFIX = ".pkg_sorted_blob.npy"
+SORTED_OFFSETS_SUFFIX = ".pkg_sorted_offsets.npy"
+SORTED_IDS_SUFFIX = ".pkg_sorted_ids.npy"
+
+
+class PackageIndex(object):
+    """
+    package <=> node id mapping backed by memory mapped arrays: the packages table is ordered by node id
+    (id => package is a lookup), while the sorted table and the parallel node ids array answer
+    package => id with a binary search
+    """
+
+    def __init__(self, packages, sorted_blob, sorted_offsets, sorted_ids):
+        self.packages = packages
+        self.sorted_blob = sorted_blob
+        self.sorted_offsets = sorted_offsets
+        self.sorted_ids = sorted_ids
+
+    def __len__(self):
+        return len(self.packages)
+
+    def get_package(self, node_id):
+        return self.packages[node_id]
+
+    def get_sorted_key(self, position):
+        return self.sorted_blob[self.sorted_offsets[position]:self.sorted_offsets[position + 1]].tobytes()
+
+    def get_id(self, package):
+        """
+        Node id of the package, None if the package is not in the graph
+        """
+        key = package.encode("utf-8")
+        low, high = 0, len(self.sorted_ids)
+        while low < high:
+            middle = (low + high) // 2
+            if self.get_sorted_key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self.sorted_ids) and self.get_sorted_key(low) == key:
+            return int(self.sorted_ids[low])
+        return None
+
+    def get_ids(self, packages):
+        """
+        Node ids of the packages found in the graph, in the same order
+        """
+        ids = []
+        for package in packages:
+            node_id = self.get_id(package)
+            if node_id is not None:
+                ids.append(node_id)
+        return ids
+
+
+class InMemoryPackageIndex(object):
+    """
+    Same interface of PackageIndex, over a node id => package dict (for graphs without the on-disk index)
+    """
+
+    def __init__(self, id_pkg_dict):
+        self.id_pkg_dict = id_pkg_dict
+        self.pkg_id_dict = dict((package, node_id) for node_id, package in id_pkg_dict.items())
+
+    def __len__(self):
+        return len(self.id_pkg_dict)
+
+    def get_package(self, node_id):
+        return self.id_pkg_dict[node_id]
+
+    def get_id(self, package):
+        return self.pkg_id_dict.get(package)
+
+    def get_ids(self, packages):
+        return [self.pkg_id_dict[package] for package in packages if package in self.pkg_id_dict]
+
+
+def save_array(path, array):
+    # written to a temporary file, so that a process loading the index never reads a partial array
+    temp_path = "{0}.{1}.tmp".format(path, os.getpid())
+    with open(temp_path, "wb") as f:
+        np.save(f, array)
+    os.rename(temp_path, path)
+
+
+def save_package_index(graph_path, packages):
+    """
+    Writes the sorted table of the packages (node i is labeled with packages[i]); the table ordered by node id
+    is the one saved with the CSR graph. The ids are written last, since has_package_index checks them too
+    """
+    base_path = get_base_path(graph_path)
+    encoded = [package.encode("utf-8") for package in packages]
+    sorted_ids = np.array(sorted(range(len(encoded)), key=encoded.__getitem__), dtype=np.int32)
+    blob, offsets = build_string_table([packages[node_id] for node_id in sorted_ids])
+    save_array(base_path + SORTED_BLOB_SUFFIX, blob)
+    save_array(base_path + SORTED_OFFSETS_SUFFIX, offsets)
+    save_array(base_path + SORTED_IDS_SUFFIX, sorted_ids)
+
+
+def load_package_index(graph_path, mmap_mode='r'):
+    base_path = get_base_path(graph_path)
+    packages = StringTable(np.load(base_path + PKG_BLOB_SUFFIX, mmap_mode=mmap_mode),
+                           np.load(base_path + PKG_OFFSETS_SUFFIX, mmap_mode=mmap_mode))
+    return PackageIndex(packages, np.load(base_path + SORTED_BLOB_SUFFIX, mmap_mode=mmap_mode),
+                        np.load(base_path + SORTED_OFFSETS_SUFFIX, mmap_mode=mmap_mode),
+                        np.load(base_path + SORTED_IDS_SUFFIX, mmap_mode=mmap_mode))
+
+
+def has_package_index(graph_path):
+    base_path = get_base_path(graph_path)
+    for suffix in (PKG_BLOB_SUFFIX, PKG_OFFSETS_SUFFIX, SORTED_BLOB_SUFFIX, SORTED_OFFSETS_SUFFIX,
+                   SORTED_IDS_SUFFIX):
+        if not os.path.isfile(base_path + suffix):
+            return False
+    return True
+
+
+def read_packages_file(path):
+    """
+    Packages listed in a text file, separated by newlines or spaces (e.g. the output of --get-top-packages);
+    duplicates are dropped, the order is kept
+    """
+    packages = []
+    seen = set()
+    with open(path, "r") as f:
+        for line in f:
+            for package in line.split():
+                if package not in seen:
+                    seen.add(package)
+                    packages.append(package)
+    return packages
@@ -0,0 +1,55 @@
+import numpy as np
+import scipy.sparse
+
+
+def get_transposed_transition_matrix(csr_graph):
+    """
+    Returns M^T, where M is the row-stochastic transition matrix of the graph (dangling rows are left empty)
+    """
+    out_degrees = csr_graph.get_out_degrees()
+    weights = np.repeat(1.0 / np.maximum(out_degrees, 1), out_degrees)
+    matrix = scipy.sparse.csr_matrix((weights, np.asarray(csr_graph.indices), np.asarray(csr_graph.indptr)),
+                                     shape=(csr_graph.n_nodes, csr_graph.n_nodes))
+    return matrix.T.tocsr()
+
+
+def get_personalization_vector(n_nodes, personalized_nodes=None):
+    if personalized_nodes is None:
+        return np.full(n_nodes, 1.0 / n_nodes)
+    if not len(personalized_nodes):
+        raise ValueError("Empty personalization: the random jumps would have nowhere to go")
+    vector = np.zeros(n_nodes)
+    vector[list(personalized_nodes)] = 1.0
+    return vector / vector.sum()
+
+
+def compute_pagerank(csr_graph, damping=0.85, tolerance=1e-6, max_iterations=100, personalized_nodes=None,
+                     initial_ranks=None):
+    """
+    Power iteration PageRank over the CSR adjacency. The random jumps (and the rank of dangling nodes) are
+    distributed according to the personalization vector, uniform unless personalized_nodes is given.
+    initial_ranks can be a previously computed rank vector indexed by node id (warm start); its NaN nodes (e.g.
+    added by a new crawl) start from the uniform rank.
+    Returns the rank vector, the number of iterations performed and the final L1 residual
+    """
+    n_nodes = csr_graph.n_nodes
+    transition_t = get_transposed_transition_matrix(csr_graph)
+    dangling = csr_graph.get_out_degrees() == 0
+    personalization = get_personalization_vector(n_nodes, personalized_nodes)
+
+    ranks = np.full(n_nodes, 1.0 / n_nodes)
+    if initial_ranks is not None:
+        known = ~np.isnan(initial_ranks)
+        ranks[known] = initial_ranks[known]
+    ranks /= ranks.sum()
+
+    residual = float("inf")
+    iteration = 0
+    while iteration < max_iterations and residual >= tolerance:
+        dangling_rank = ranks[dangling].sum()
+        new_ranks = damping * (transition_t.dot(ranks) + dangling_rank * personalization) + \
+            (1.0 - damping) * personalization
+        residual = np.abs(new_ranks - ranks).sum()
+        ranks = new_ranks
+        iteration += 1
+    return ranks, iteration, residual
@@ -0,0 +1,82 @@
+import numpy as np
+
+CHUNK_SIZE = 100000
+
+
+def get_binary(matrix):
+    """
+    0/1 copy of a sparse matrix (duplicate entries are merged)
+    """
+    binary = matrix.tocsr(copy=True)
+    binary.sum_duplicates()
+    binary.data = np.ones(len(binary.data), dtype=np.int64)
+    return binary
+
+
+def get_cooccurrence(matrix, chunk_size=CHUNK_SIZE):
+    """
+    Dense items x items matrix of a sparse rows x items matrix: [i, j] is the number of rows containing
+    both i and j, the diagonal is the number of rows containing i. The product is computed chunk_size rows
+    at a time, so the memory needed doesn't depend on the number of rows.
+    """
+    n_items = matrix.shape[1]
+    cooccurrence = np.zeros((n_items, n_items), dtype=np.int64)
+    for start in range(0, matrix.shape[0], chunk_size):
+        chunk = get_binary(matrix[start:start + chunk_size])
+        cooccurrence += (chunk.T * chunk).toarray()
+    return cooccurrence
+
+
+def get_lift(cooccurrence, n_rows):
+    """
+    lift[i, j] = P(i, j) / (P(i) P(j)); 0 where i or j never occur
+    """
+    supports = np.diag(cooccurrence).astype(np.float64)
+    expected = np.outer(supports, supports)
+    lift = np.zeros(cooccurrence.shape)
+    nonzero = expected > 0
+    lift[nonzero] = cooccurrence[nonzero] * float(n_rows) / expected[nonzero]
+    return lift
+
+
+def get_frequent_sets(matrix, cooccurrence, min_count, max_size=3, chunk_size=CHUNK_SIZE):
+    """
+    Item sets (2 <= size <= max_size, at most 3) contained in at least min_count rows, as (item ids, count)
+    pairs (Apriori: a set is counted only if all its subsets are frequent). Sets of 3 items are counted with
+    one sparse product per frequent item i, over the rows containing i.
+    """
+    frequent_items = np.flatnonzero(np.diag(cooccurrence) >= min_count)
+    frequent_pairs = np.triu(cooccurrence >= min_count, 1)
+    frequent_sets = [((int(i), int(j)), int(cooccurrence[i, j])) for i, j in zip(*np.nonzero(frequent_pairs))]
+    if max_size < 3:
+        return frequent_sets
+
+    columns = get_binary(matrix).tocsc()
+    for i in frequent_items:
+        # (i, j, k) with i < j < k, counted once from its smallest item
+        candidates = frequent_pairs[i] & (np.arange(matrix.shape[1]) > i)
+        if np.count_nonzero(candidates) < 2:
+            continue
+        rows = columns.indices[columns.indptr[i]:columns.indptr[i + 1]]
+        counts = np.zeros(cooccurrence.shape, dtype=np.int64)
+        for start in range(0, len(rows), chunk_size):
+            chunk = get_binary(matrix[rows[start:start + chunk_size]])
+            counts += (chunk.T * chunk).toarray()
+        triples = np.triu(counts >= min_count, 1) & frequent_pairs & np.outer(candidates, candidates)
+        for j, k in zip(*np.nonzero(triples)):
+            frequent_sets.append(((int(i), int(j), int(k)), int(counts[j, k])))
+    return frequent_sets
+
+
+def get_top_pairs(scores, limit, mask=None):
+    """
+    (i, j, score) of the limit pairs i < j with the highest positive score, optionally only where mask is true
+    """
+    upper = np.triu(scores > 0, 1)
+    if mask is not None:
+        upper &= mask
+    pairs = np.nonzero(upper)
+    values = scores[pairs]
+    order = np.argsort(values, kind="mergesort")[::-1][:limit]
+    return [(int(pairs[0][n]), int(pairs[1][n]), values[n]) for n in order]
+
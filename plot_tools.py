@@ -1,32 +1,54 @@
+import json
+import multiprocessing
+import os
+import traceback
+
+import matplotlib
+
+# headless rendering, also in worker processes without a display
+matplotlib.use("Agg")
+
 import matplotlib.dates as mdates
 import matplotlib.pyplot as plt
 import networkx as nx
 import numpy as np
 from matplotlib.colors import Normalize
 
-import snap
+import date_tools
+from graph_layout import LAYOUT_CACHE_DIRECTORY, get_layout
 
+PLOT_SPEC_SUFFIX = ".plot.json"
 
-def snap_graph_to_networkx(snap_graph):
-    if isinstance(snap_graph, snap.TUNGraph):
-        nx_graph = nx.Graph()
-    else:
-        nx_graph = nx.DiGraph()
-    for edge in snap_graph.Edges():
-        nx_graph.add_edge(edge.GetSrcNId(), edge.GetDstNId())
-    return nx_graph
+# RenderQueue receiving the plots submitted by the generate_* functions; when None they are rendered immediately
+render_queue = None
 
 
-def get_labels_subset(id_pkg_dict, subgraph):
+def get_labels_subset(package_index, edges):
     labels_dict = {}
-    for edge in subgraph.Edges():
-        labels_dict[edge.GetSrcNId()] = ellipsize_text(id_pkg_dict[edge.GetSrcNId()], 18)
-        labels_dict[edge.GetDstNId()] = ellipsize_text(id_pkg_dict[edge.GetDstNId()], 18)
+    for source, destination in edges:
+        labels_dict[source] = ellipsize_text(package_index.get_package(source), 18)
+        labels_dict[destination] = ellipsize_text(package_index.get_package(destination), 18)
     return labels_dict
 
 
-def plot_subgraph_colored(snap_graph, labels_dict, values_dict, value_label, title, output, cmap="autumn_r"):
-    nx_graph = snap_graph_to_networkx(snap_graph)
+def plot_subgraph_colored(edges, labels_dict, values_dict, value_label, title, output, cmap="autumn_r",
+                          directed=True):
+    """
+    edges is the list of (source, destination) node ids of the subgraph
+    """
+    submit_plot({"kind": "subgraph_colored", "output": output, "title": title, "value_label": value_label,
+                 "cmap": cmap, "directed": directed,
+                 "edges": [[int(source), int(destination)] for source, destination in edges],
+                 "labels": [[node_id, label] for node_id, label in labels_dict.items()],
+                 "values": [[node_id, float(value)] for node_id, value in values_dict.items()]})
+
+
+def render_subgraph_colored(spec):
+    nx_graph = nx.DiGraph() if spec["directed"] else nx.Graph()
+    nx_graph.add_edges_from(tuple(edge) for edge in spec["edges"])
+    labels_dict = dict((node_id, label) for node_id, label in spec["labels"])
+    values_dict = dict((node_id, value) for node_id, value in spec["values"])
+    cmap = spec["cmap"]
 
     # functions used for color interpolation
     min_val = None
@@ -37,9 +59,10 @@ def plot_subgraph_colored(snap_graph, labels_dict, values_dict, value_label, tit
 
     fig = plt.figure()
     ax = fig.add_subplot(111)
-    ax.set_title(title)
+    ax.set_title(spec["title"])
     ax.axis('off')
-    pos = nx.spring_layout(nx_graph, k=0.4, iterations=10000)
+    pos = get_layout(list(nx_graph.nodes()), spec["edges"],
+                     os.path.join(os.path.dirname(os.path.abspath(spec["output"])), LAYOUT_CACHE_DIRECTORY))
     nx.draw_networkx(nx_graph, pos=pos, linewidths=0.1, alpha=0.8, width=0.1, edge_color="grey", font_size=4,
                      font_weight='bold', font_color="green",
                      node_color=[values_dict[nodeid] for nodeid in nx_graph.nodes()], cmap=cmap,
@@ -47,12 +70,12 @@ def plot_subgraph_colored(snap_graph, labels_dict, values_dict, value_label, tit
 
     sm = plt.cm.ScalarMappable(cmap=cmap, norm=Normalize(vmin=min_val, vmax=max_val))
     sm._A = []
-    cb = plt.colorbar(sm, orientation='horizontal', aspect=100)
-    cb.set_label(value_label)
+    cb = fig.colorbar(sm, ax=ax, orientation='horizontal', aspect=100)
+    cb.set_label(spec["value_label"])
 
     plt.tight_layout()
 
-    fig.savefig(output)
+    return fig
 
 
 def ellipsize_text(text, max_length):
@@ -64,6 +87,8 @@ def ellipsize_text(text, max_length):
 
 
 def plot_subgraph(graph, nodes, output, title):
+    # imported here, so that the other plots don't need snap.py
+    import snap
     node_ids_vector = snap.TIntV()
     labels = snap.TIntStrH()
     for pair in nodes:
@@ -76,6 +101,12 @@ def plot_subgraph(graph, nodes, output, title):
 
 
 def generate_histogram(buckets, title, x_label, y_label, output):
+    submit_plot({"kind": "histogram", "output": output, "title": title, "x_label": x_label, "y_label": y_label,
+                 "buckets": [[int(key), int(value)] for key, value in buckets.items()]})
+
+
+def render_histogram(spec):
+    buckets = dict((key, value) for key, value in spec["buckets"])
     fig = plt.figure()
     ax = fig.add_subplot(111)
     indexes = np.arange(min(buckets.keys()) - 1, max(buckets.keys()) + 2)  # the x locations for the groups
@@ -89,18 +120,24 @@ def generate_histogram(buckets, title, x_label, y_label, output):
     # axes and labels
     ax.set_xlim(indexes[0] - 1, indexes[-1] + 1)
     ax.set_ylim(min(buckets.values()) - width, max(buckets.values()) + width)
-    ax.set_xlabel(x_label)
-    ax.set_ylabel(y_label)
-    ax.set_title(title, fontsize=10)
+    ax.set_xlabel(spec["x_label"])
+    ax.set_ylabel(spec["y_label"])
+    ax.set_title(spec["title"], fontsize=10)
     # x_tick_marks = [str(i) for i in range(1, 6)]
     # ax.set_xticks(ind + width)
     # xtickNames = ax.set_xticklabels(xTickMarks)
     # plt.setp(xtickNames, rotation=45, fontsize=10)
 
-    fig.savefig(output)
+    return fig
 
 
 def generate_histrogram_strings(buckets, title, x_label, y_label, output):
+    submit_plot({"kind": "histogram_strings", "output": output, "title": title, "x_label": x_label,
+                 "y_label": y_label, "buckets": [[key, int(value)] for key, value in buckets.items()]})
+
+
+def render_histogram_strings(spec):
+    buckets = dict((key, value) for key, value in spec["buckets"])
     fig = plt.figure()
     ax = fig.add_subplot(111)
     sorted_keys = sorted(buckets.keys(), key=lambda item: int(''.join(x for x in item if x.isdigit())))
@@ -114,9 +151,9 @@ def generate_histrogram_strings(buckets, title, x_label, y_label, output):
 
     # axes and labels
     ax.set_ylim(0.5, max(buckets.values()) + 1)
-    ax.set_xlabel(x_label)
-    ax.set_ylabel(y_label)
-    ax.set_title(title)
+    ax.set_xlabel(spec["x_label"])
+    ax.set_ylabel(spec["y_label"])
+    ax.set_title(spec["title"])
 
     ax.xaxis.set_major_locator(plt.FixedLocator(indexes))
     ax.xaxis.set_major_formatter(plt.FixedFormatter(sorted_keys))
@@ -126,65 +163,277 @@ def generate_histrogram_strings(buckets, title, x_label, y_label, output):
 
     plt.tight_layout()
 
-    fig.savefig(output)
+    return fig
+
+
+def get_binned_spec(kind, data, bins, title, x_label, y_label, output, weights=None):
+    """
+    Spec of a histogram of the data (optionally weighted): only the bin edges and counts are kept, not the data
+    """
+    counts, edges = np.histogram(data, bins=bins, weights=weights)
+    return {"kind": kind, "output": output, "title": title, "x_label": x_label, "y_label": y_label,
+            "counts": counts.tolist(), "edges": edges.tolist()}
+
+
+def plot_binned(ax, spec):
+    # one point per bin, weighted by its count, draws the same bars of ax.hist over the data
+    ax.hist(spec["edges"][:-1], bins=spec["edges"], weights=spec["counts"])
+
 
+def generate_histogram_from_data(data, bins, title, x_label, y_label, output, weights=None):
+    submit_plot(get_binned_spec("histogram_from_data", data, bins, title, x_label, y_label, output, weights))
 
-def generate_histogram_from_data(data, bins, title, x_label, y_label, output):
+
+def render_histogram_from_data(spec):
     fig = plt.figure()
     ax = fig.add_subplot(111)
     ax.set_yscale('log')
     ax.grid(zorder=0, axis="both")
-    ax.hist(data, bins=bins)
+    plot_binned(ax, spec)
 
     # axes and labels
-    ax.set_xlabel(x_label)
-    ax.set_ylabel(y_label)
+    ax.set_xlabel(spec["x_label"])
+    ax.set_ylabel(spec["y_label"])
     labels = ax.get_xticklabels()
     for tick in labels:
         tick.set_rotation(90)
         tick.set_ha = 'left'
-    ax.set_title(title)
+    ax.set_title(spec["title"])
 
     plt.tight_layout()
 
-    fig.savefig(output)
+    return fig
+
 
+def generate_histogram_from_data_log(data, bins, title, x_label, y_label, output, weights=None):
+    spec = get_binned_spec("histogram_from_data_log", data, bins, title, x_label, y_label, output, weights)
+    spec["max_value"] = float(np.max(data))
+    submit_plot(spec)
 
-def generate_histogram_from_data_log(data, bins, title, x_label, y_label, output):
+
+def render_histogram_from_data_log(spec):
     fig = plt.figure()
     ax = fig.add_subplot(111)
     ax.set_yscale('log')
     ax.set_xscale('log')
     ax.grid(zorder=0, axis="both")
-    ax.hist(data, bins=bins)
+    plot_binned(ax, spec)
 
     # axes and labels
-    ax.set_ylim(0.5, max(data) + 1)
-    ax.set_xlabel(x_label)
-    ax.set_ylabel(y_label)
-    ax.set_title(title)
+    ax.set_ylim(0.5, spec["max_value"] + 1)
+    ax.set_xlabel(spec["x_label"])
+    ax.set_ylabel(spec["y_label"])
+    ax.set_title(spec["title"])
 
     plt.tight_layout()
 
-    fig.savefig(output)
+    return fig
 
 
 def generate_histogram_from_timestamps(timestamps, title, x_label, y_label, output):
+    """
+    timestamps are Unix timestamps or Play Store dates (e.g. "21 Aug 2017")
+    """
+    timestamps = np.asarray(timestamps)
+    if timestamps.dtype.kind in "SU":
+        timestamps = date_tools.play_store_timestamps_to_unix_timestamps(timestamps)
     mpl_data = mdates.epoch2num(timestamps)
-    bins = int((max(timestamps) - min(timestamps)) / (24 * 60 * 60 * 30) + 1)
+    bins = int((timestamps.max() - timestamps.min()) / (24 * 60 * 60 * 30) + 1)
+    submit_plot(get_binned_spec("histogram_from_timestamps", mpl_data, bins, title, x_label, y_label, output))
+
+
+def render_histogram_from_timestamps(spec):
     fig = plt.figure()
     ax = fig.add_subplot(111)
     ax.set_yscale('log')
     ax.grid(zorder=0, axis="both")
-    ax.hist(mpl_data, bins=bins)
+    plot_binned(ax, spec)
 
     # axes and labels
-    ax.set_xlabel(x_label)
-    ax.set_ylabel(y_label)
-    ax.set_title(title)
+    ax.set_xlabel(spec["x_label"])
+    ax.set_ylabel(spec["y_label"])
+    ax.set_title(spec["title"])
     ax.xaxis.set_major_locator(mdates.YearLocator())
     ax.xaxis.set_major_formatter(mdates.DateFormatter('%b.%y'))
 
     plt.tight_layout()
 
-    fig.savefig(output)
+    return fig
+
+
+def generate_heatmap(values, labels, title, value_label, output, cmap="viridis"):
+    submit_plot({"kind": "heatmap", "output": output, "title": title, "value_label": value_label, "cmap": cmap,
+                 "values": np.asarray(values, dtype=np.float64).tolist(), "labels": list(labels)})
+
+
+def render_heatmap(spec):
+    labels = spec["labels"]
+    fig = plt.figure(figsize=(10, 9))
+    ax = fig.add_subplot(111)
+    image = ax.imshow(np.array(spec["values"]), cmap=spec["cmap"], interpolation="nearest")
+
+    # axes and labels
+    ax.set_xticks(np.arange(len(labels)))
+    ax.set_yticks(np.arange(len(labels)))
+    ax.set_xticklabels(labels, rotation=90, fontsize=6)
+    ax.set_yticklabels(labels, fontsize=6)
+    ax.set_title(spec["title"], fontsize=10)
+    cb = fig.colorbar(image)
+    cb.set_label(spec["value_label"])
+
+    plt.tight_layout()
+
+    return fig
+
+
+def generate_distribution(x, y, title, x_label, y_label, output, x_log=True, y_log=True):
+    """
+    Scatter plot of a distribution, e.g. the number of nodes (y) with each degree (x)
+    """
+    submit_plot({"kind": "distribution", "output": output, "title": title, "x_label": x_label, "y_label": y_label,
+                 "x": np.asarray(x).tolist(), "y": np.asarray(y).tolist(), "x_log": x_log, "y_log": y_log})
+
+
+def render_distribution(spec):
+    x = np.array(spec["x"], dtype=np.float64)
+    y = np.array(spec["y"], dtype=np.float64)
+    # the non positive values can't be drawn on a log scale
+    shown = np.ones(len(x), dtype=bool)
+    if spec["x_log"]:
+        shown &= x > 0
+    if spec["y_log"]:
+        shown &= y > 0
+    fig = plt.figure()
+    ax = fig.add_subplot(111)
+    if spec["x_log"]:
+        ax.set_xscale('log')
+    if spec["y_log"]:
+        ax.set_yscale('log')
+    ax.grid(zorder=0, axis="both")
+    ax.plot(x[shown], y[shown], linestyle="none", marker="o", markersize=3, color="blue")
+
+    # axes and labels
+    ax.set_xlabel(spec["x_label"])
+    ax.set_ylabel(spec["y_label"])
+    ax.set_title(spec["title"], fontsize=10)
+
+    plt.tight_layout()
+
+    return fig
+
+
+RENDERERS = {
+    "subgraph_colored": render_subgraph_colored,
+    "histogram": render_histogram,
+    "histogram_strings": render_histogram_strings,
+    "histogram_from_data": render_histogram_from_data,
+    "histogram_from_data_log": render_histogram_from_data_log,
+    "histogram_from_timestamps": render_histogram_from_timestamps,
+    "heatmap": render_heatmap,
+    "distribution": render_distribution,
+}
+
+
+def get_output_path(spec, plot_format=None):
+    if plot_format is None:
+        return spec["output"]
+    return os.path.splitext(spec["output"])[0] + "." + plot_format
+
+
+def render_plot(spec, plot_format=None):
+    """
+    Renders the plot described by the spec to its output file (or to the same path with the extension of
+    plot_format, e.g. "png") and releases the figure; returns the output path
+    """
+    output = get_output_path(spec, plot_format)
+    fig = RENDERERS[spec["kind"]](spec)
+    try:
+        fig.savefig(output)
+    finally:
+        plt.close(fig)
+    return output
+
+
+def run_render_plot(spec, plot_format=None):
+    try:
+        return render_plot(spec, plot_format), None
+    except Exception:
+        return get_output_path(spec, plot_format), traceback.format_exc()
+
+
+def save_plot_spec(spec):
+    """
+    Saves the spec next to the plot, so that the plot can be rendered again without recomputing its data
+    """
+    with open(spec["output"] + PLOT_SPEC_SUFFIX, "w") as f:
+        json.dump(spec, f)
+
+
+def load_plot_spec(spec_path):
+    with open(spec_path, "r") as f:
+        return json.load(f)
+
+
+def submit_plot(spec):
+    save_plot_spec(spec)
+    if render_queue is None:
+        render_plot(spec)
+    else:
+        render_queue.submit(spec)
+
+
+class RenderQueue(object):
+    """
+    Renders the submitted plot specs in a pool of jobs processes (in the current process if jobs is 1), while
+    the caller keeps computing; close() waits for all the plots
+    """
+
+    def __init__(self, jobs=1, plot_format=None):
+        self.plot_format = plot_format
+        self.pool = multiprocessing.Pool(jobs) if jobs > 1 else None
+        self.results = []
+
+    def submit(self, spec):
+        if self.pool is None:
+            self.results.append(run_render_plot(spec, self.plot_format))
+        else:
+            self.results.append(self.pool.apply_async(run_render_plot, (spec, self.plot_format)))
+
+    def close(self):
+        """
+        Waits for the pending plots; returns the {output path: error} of the failed ones
+        """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+        errors = {}
+        for result in self.results:
+            output, error = result if isinstance(result, tuple) else result.get()
+            if error:
+                errors[output] = error
+        return errors
+
+
+def start_render_queue(jobs=1, plot_format=None):
+    global render_queue
+    render_queue = RenderQueue(jobs, plot_format)
+    return render_queue
+
+
+def stop_render_queue():
+    """
+    Waits for the plots of the active render queue; returns the errors of the failed ones
+    """
+    global render_queue
+    queue, render_queue = render_queue, None
+    return queue.close() if queue is not None else {}
+
+
+def render_plot_specs(spec_paths, jobs=1, plot_format=None):
+    """
+    Renders again the plots saved as specs (e.g. in another format)
+    """
+    queue = RenderQueue(jobs, plot_format)
+    for spec_path in spec_paths:
+        queue.submit(load_plot_spec(spec_path))
+    return queue.close()
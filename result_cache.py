@@ -0,0 +1,204 @@
+import datetime
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from collections import OrderedDict
+
+ENTRY_METADATA = "entry.json"
+MANIFEST = "manifest.json"
+# directory of the digests of the input files, one json file per path
+FILE_FINGERPRINTS = "file_fingerprints"
+
+
+def hash_object(obj):
+    return hashlib.sha1(json.dumps(obj, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def write_json_file(path, obj):
+    """
+    Writes the json file to a temporary file and renames it, so that the processes sharing the cache never read
+    a partially written file (the last writer wins)
+    """
+    temp_path = "{0}.tmp.{1}".format(path, uuid.uuid4().hex)
+    try:
+        with open(temp_path, "w") as f:
+            json.dump(obj, f, indent=2)
+        os.rename(temp_path, path)
+    finally:
+        if os.path.isfile(temp_path):
+            os.remove(temp_path)
+
+
+def get_directory_size(directory):
+    size = 0
+    for root, _, files in os.walk(directory):
+        for filename in files:
+            size += os.path.getsize(os.path.join(root, filename))
+    return size
+
+
+class ResultCache(object):
+    """
+    Directory of computed results, keyed by the fingerprint of the input they were computed from plus the
+    parameters of the algorithm. Every entry is a subdirectory containing the result files and an entry.json
+    with its metadata, so that entries can be written concurrently by different processes; manifest.json
+    summarizes all the entries. When max_size (bytes) is set, the least recently used entries are evicted.
+    """
+
+    def __init__(self, directory, max_size=None):
+        self.directory = os.path.abspath(directory)
+        self.max_size = max_size
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+    @staticmethod
+    def get_key(name, fingerprint, params=None):
+        return hash_object([name, fingerprint, params])
+
+    def get_entry_path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, name, fingerprint, params=None):
+        """
+        Returns the directory of the entry, or None if the result was never computed for this input
+        """
+        entry_path = self.get_entry_path(self.get_key(name, fingerprint, params))
+        metadata_path = os.path.join(entry_path, ENTRY_METADATA)
+        if not os.path.isfile(metadata_path):
+            return None
+        # the modification time of the metadata file is the last access time used by the LRU eviction
+        os.utime(metadata_path, None)
+        return entry_path
+
+    def put(self, name, fingerprint, params, write):
+        """
+        Creates the entry calling write(directory), which must save the result files in the given directory;
+        returns the directory of the entry
+        """
+        key = self.get_key(name, fingerprint, params)
+        entry_path = self.get_entry_path(key)
+        temp_path = entry_path + ".tmp." + uuid.uuid4().hex
+        os.makedirs(temp_path)
+        try:
+            write(temp_path)
+            metadata = {"name": name, "fingerprint": fingerprint, "params": params,
+                        "created": str(datetime.datetime.now())}
+            with open(os.path.join(temp_path, ENTRY_METADATA), "w") as f:
+                json.dump(metadata, f, indent=2)
+            if os.path.isdir(entry_path):
+                shutil.rmtree(entry_path)
+            os.rename(temp_path, entry_path)
+        finally:
+            if os.path.isdir(temp_path):
+                shutil.rmtree(temp_path)
+        return entry_path
+
+    def get_json(self, name, fingerprint, params=None):
+        entry_path = self.get(name, fingerprint, params)
+        if entry_path is None:
+            return None
+        with open(os.path.join(entry_path, "result.json"), "r") as f:
+            return json.load(f, object_pairs_hook=OrderedDict)
+
+    def put_json(self, name, fingerprint, params, result):
+        def write(directory):
+            with open(os.path.join(directory, "result.json"), "w") as f:
+                json.dump(result, f, indent=2)
+
+        return self.put(name, fingerprint, params, write)
+
+    def get_entries(self):
+        entries = []
+        for key in os.listdir(self.directory):
+            if ".tmp." in key:
+                continue
+            metadata_path = os.path.join(self.directory, key, ENTRY_METADATA)
+            if not os.path.isfile(metadata_path):
+                continue
+            with open(metadata_path, "r") as f:
+                metadata = json.load(f)
+            metadata["key"] = key
+            metadata["last_access"] = os.path.getmtime(metadata_path)
+            metadata["size"] = get_directory_size(os.path.join(self.directory, key))
+            entries.append(metadata)
+        return entries
+
+    def get_metadata(self, entry_path):
+        """
+        Metadata of the entry in entry_path (name, fingerprint, params, created)
+        """
+        with open(os.path.join(entry_path, ENTRY_METADATA), "r") as f:
+            return json.load(f)
+
+    def get_latest(self, name):
+        """
+        Directory of the most recently used entry with the given name, whatever its input and parameters
+        (e.g. to warm-start a computation from a previous result)
+        """
+        entries = [entry for entry in self.get_entries() if entry["name"] == name]
+        if not entries:
+            return None
+        return self.get_entry_path(max(entries, key=lambda entry: entry["last_access"])["key"])
+
+    def invalidate(self, names=None):
+        """
+        Removes the entries with the given names (all the entries if names is None); returns how many were removed
+        """
+        removed = 0
+        for entry in self.get_entries():
+            if names is None or entry["name"] in names:
+                shutil.rmtree(self.get_entry_path(entry["key"]))
+                removed += 1
+        return removed
+
+    def evict(self):
+        entries = sorted(self.get_entries(), key=lambda entry: entry["last_access"])
+        total_size = sum(entry["size"] for entry in entries)
+        while self.max_size is not None and entries and total_size > self.max_size:
+            entry = entries.pop(0)
+            shutil.rmtree(self.get_entry_path(entry["key"]))
+            total_size -= entry["size"]
+        return entries
+
+    def write_manifest(self):
+        """
+        Applies the size cap and writes manifest.json, describing the remaining entries
+        """
+        entries = self.evict()
+        manifest = {"updated": str(datetime.datetime.now()), "max_size": self.max_size,
+                    "size": sum(entry["size"] for entry in entries),
+                    "entries": dict((entry.pop("key"), entry) for entry in entries)}
+        write_json_file(os.path.join(self.directory, MANIFEST), manifest)
+
+    def get_file_fingerprint(self, path):
+        """
+        sha1 of the file content; the digest is remembered (with the size and modification time of the file) to
+        avoid hashing big files on every run. Every path has its own digest file, so that the processes sharing
+        the cache (e.g. the scheduler workers) never overwrite each other's digests.
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        fingerprints_directory = os.path.join(self.directory, FILE_FINGERPRINTS)
+        fingerprint_path = os.path.join(fingerprints_directory, hash_object(path) + ".json")
+        if os.path.isfile(fingerprint_path):
+            with open(fingerprint_path, "r") as f:
+                known = json.load(f)
+            if known["path"] == path and known["size"] == stat.st_size and known["mtime"] == stat.st_mtime:
+                return known["sha1"]
+        sha1 = hashlib.sha1()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                sha1.update(chunk)
+        if not os.path.isdir(fingerprints_directory):
+            try:
+                os.makedirs(fingerprints_directory)
+            except OSError:
+                # created meanwhile by another process
+                if not os.path.isdir(fingerprints_directory):
+                    raise
+        write_json_file(fingerprint_path, {"path": path, "size": stat.st_size, "mtime": stat.st_mtime,
+                                           "sha1": sha1.hexdigest(), "computed": time.time()})
+        return sha1.hexdigest()
@@ -0,0 +1,225 @@
+import hashlib
+import math
+import random
+import struct
+
+import numpy as np
+
+from topk import top_k
+
+
+def hash64(item):
+    """
+    64 bit hash of a string (or of the string representation of any other item), stable across processes
+    """
+    if not isinstance(item, bytes):
+        item = u"{0}".format(item).encode("utf-8")
+    return struct.unpack("<Q", hashlib.md5(item).digest()[:8])[0]
+
+
+class QuantileSketch(object):
+    """
+    KLL sketch of a stream of numbers: the quantiles are estimated from at most a few times k retained values,
+    whatever the length of the stream. The count, mean, variance, min and max are tracked exactly.
+    Two sketches of different streams can be merged into the sketch of the concatenated streams, with the same
+    rank error.
+    """
+
+    def __init__(self, k=200, seed=0):
+        self.k = k
+        self.random = random.Random(seed)
+        # compactors[h] holds values of weight 2^h
+        self.compactors = [[]]
+        self.size = 0
+        self.max_size = 0
+        self.update_max_size()
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def __len__(self):
+        return self.n
+
+    def get_capacity(self, height):
+        depth = len(self.compactors) - height - 1
+        return int(math.ceil((2.0 / 3.0) ** depth * self.k)) + 1
+
+    def update_max_size(self):
+        self.max_size = sum(self.get_capacity(height) for height in range(len(self.compactors)))
+
+    def add(self, value):
+        value = float(value)
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (value - self.mean)
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        self.compactors[0].append(value)
+        self.size += 1
+        if self.size >= self.max_size:
+            self.compress()
+
+    # the sketch can replace the array of values of the accumulators
+    append = add
+
+    def compress(self):
+        for height in range(len(self.compactors)):
+            if len(self.compactors[height]) >= self.get_capacity(height):
+                if height + 1 == len(self.compactors):
+                    self.compactors.append([])
+                    self.update_max_size()
+                # half of the values (every other one, from a random offset) are promoted with double weight
+                compactor = sorted(self.compactors[height])
+                remainder = [compactor.pop()] if len(compactor) % 2 else []
+                self.compactors[height + 1].extend(compactor[self.random.randint(0, 1)::2])
+                self.compactors[height] = remainder
+                self.size = sum(len(compactor) for compactor in self.compactors)
+                break
+
+    def merge(self, other):
+        if other.n == 0:
+            return
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.m2 += other.m2 + delta * delta * self.n * other.n / n
+        self.mean += delta * other.n / n
+        self.n = n
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        # the values of the same weight are compacted together
+        while len(self.compactors) < len(other.compactors):
+            self.compactors.append([])
+        self.update_max_size()
+        for height, compactor in enumerate(other.compactors):
+            self.compactors[height].extend(compactor)
+        self.size = sum(len(compactor) for compactor in self.compactors)
+        while self.size >= self.max_size:
+            self.compress()
+
+    def get_weighted_values(self):
+        """
+        (values, weights) of the retained values, sorted by value; the weights sum to the length of the stream
+        """
+        values = np.array([value for compactor in self.compactors for value in compactor], dtype=np.float64)
+        weights = np.concatenate([np.full(len(compactor), 2 ** height, dtype=np.int64)
+                                  for height, compactor in enumerate(self.compactors)])
+        order = np.argsort(values, kind="mergesort")
+        return values[order], weights[order]
+
+    def get_percentiles(self, percentiles):
+        values, weights = self.get_weighted_values()
+        if not len(values):
+            return np.full(len(percentiles), np.nan)
+        ranks = np.cumsum(weights)
+        positions = np.searchsorted(ranks, np.asarray(percentiles, dtype=np.float64) / 100.0 * ranks[-1])
+        return values[np.minimum(positions, len(values) - 1)]
+
+    def get_rank_error(self):
+        """
+        Normalized rank error of the estimated quantiles (99% confidence), as measured for KLL sketches
+        """
+        return 2.296 / self.k ** 0.9723
+
+    def describe(self, percentiles=(95, 99)):
+        """
+        Same as stats_tools.describe: mean, standard deviation and (estimated) percentiles of the values
+        """
+        std = math.sqrt(self.m2 / self.n) if self.n else float("nan")
+        return self.mean if self.n else float("nan"), std, self.get_percentiles(percentiles)
+
+
+class HyperLogLog(object):
+    """
+    Estimates the number of distinct items of a stream with 2^precision one byte registers.
+    Sketches with the same precision are merged by keeping the max of every register: the merged sketch is
+    the one of the union of the streams, with the same relative error.
+    """
+
+    def __init__(self, precision=14):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, item):
+        h = hash64(item)
+        index = h >> (64 - self.precision)
+        # position of the leftmost 1 among the remaining bits
+        rank = 64 - self.precision - (h & ((1 << (64 - self.precision)) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError("Can't merge HyperLogLog sketches with different precisions")
+        self.registers = bytearray(np.maximum(np.frombuffer(bytes(self.registers), dtype=np.uint8),
+                                              np.frombuffer(bytes(other.registers), dtype=np.uint8)).tobytes())
+
+    def get_estimate(self):
+        registers = np.frombuffer(bytes(self.registers), dtype=np.uint8)
+        m = float(len(registers))
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.power(2.0, -registers.astype(np.float64)))
+        n_zeros = int(np.count_nonzero(registers == 0))
+        if estimate <= 2.5 * m and n_zeros:
+            # linear counting is more accurate for small cardinalities
+            estimate = m * math.log(m / n_zeros)
+        return int(round(estimate))
+
+    def get_relative_error(self):
+        """
+        Relative standard error of the estimate
+        """
+        return 1.04 / math.sqrt(1 << self.precision)
+
+
+class SpaceSaving(object):
+    """
+    Approximate counts of the most frequent items of a stream, keeping between capacity and 2 * capacity
+    counters: when they are too many, only the capacity largest are kept. The count of an item is an upper
+    bound of its true count, which is at least count - error; the true count of an item without a counter is
+    at most floor. Since the counters are pruned in batches, floor is not bounded by the classic
+    length / capacity of Space-Saving: the errors of the counters and floor are reported instead.
+    Merging two sketches sums their counters; an item counted by one sketch only gets the floor of the other
+    as count and error, and the floors add up, so the bounds hold for the concatenated streams.
+    """
+
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        # largest count discarded so far: upper bound of the true count of the items without a counter
+        self.floor = 0
+
+    def add(self, item, count=1):
+        if item in self.counts:
+            self.counts[item] += count
+        else:
+            self.counts[item] = self.floor + count
+            self.errors[item] = self.floor
+            if len(self.counts) > 2 * self.capacity:
+                self.prune()
+
+    def prune(self):
+        kept = top_k(self.counts.items(), self.capacity)
+        kept_items = set(item for item, _ in kept)
+        for item, count in self.counts.items():
+            if item not in kept_items:
+                self.floor = max(self.floor, count)
+        self.counts = dict(kept)
+        self.errors = dict((item, self.errors[item]) for item in kept_items)
+
+    def merge(self, other):
+        for item in set(self.counts) | set(other.counts):
+            self.counts[item] = self.counts.get(item, self.floor) + other.counts.get(item, other.floor)
+            self.errors[item] = self.errors.get(item, self.floor) + other.errors.get(item, other.floor)
+        self.floor += other.floor
+        if len(self.counts) > 2 * self.capacity:
+            self.prune()
+
+    def get_top(self, limit):
+        """
+        (item, count, max error) of the limit items with the largest counts
+        """
+        return [(item, count, self.errors[item]) for item, count in top_k(self.counts.items(), limit)]
@@ -0,0 +1,177 @@
+import datetime
+import os
+import shutil
+from itertools import islice
+
+import numpy as np
+
+import date_tools
+from csr_graph import PackageInterner, StringTable, build_string_table
+from db_accumulators import get_app_details
+from db_interface import get_fields
+
+CHUNK_SIZE = 10000
+SNAPSHOT_FIELDS = ["docid", "creator", "similarTo", "details.appDetails.numDownloads", "details.appDetails.file.size",
+                   "details.appDetails.uploadDate", "details.appDetails.permission",
+                   "aggregateRating.bayesianMeanRating", "aggregateRating.starRating"]
+# (column, dtype) of the per-app columns; strings are interned, missing values are -1 (ids, sizes) or NaN
+COLUMNS = [("package_ids", np.int32), ("creator_ids", np.int32), ("download_ids", np.int32), ("sizes", np.int64),
+           ("upload_dates", np.float64), ("bayesian_ratings", np.float64), ("star_ratings", np.float64),
+           ("permission_counts", np.int32), ("permission_ids", np.int32), ("similar_counts", np.int32),
+           ("similar_ids", np.int32)]
+TABLES = ["packages", "creators", "downloads", "permissions"]
+
+
+class ColumnWriter(object):
+    """
+    Appends the chunks of a column to a raw binary file, so that the whole column is never in memory
+    """
+
+    def __init__(self, path, dtype):
+        self.path = path
+        self.dtype = dtype
+        self.f = open(path, "wb")
+
+    def append(self, values):
+        np.asarray(values, dtype=self.dtype).tofile(self.f)
+
+    def close(self):
+        self.f.close()
+
+    def load(self):
+        if os.path.getsize(self.path) == 0:
+            return np.zeros(0, dtype=self.dtype)
+        return np.memmap(self.path, dtype=self.dtype, mode="r")
+
+
+def get_optional_id(interner, value):
+    if value is None:
+        return -1
+    return interner.get_id(value)
+
+
+def get_rating(doc, rating_field):
+    rating = (doc.get("aggregateRating") or {}).get(rating_field)
+    # same as the accumulators, 0 means not rated
+    return float(rating) if rating else np.nan
+
+
+def get_size(app_details):
+    files = app_details.get("file")
+    if not files or files[0].get("size") is None:
+        return -1
+    return int(files[0].get("size"))
+
+
+def get_offsets(counts):
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(counts)
+    return offsets
+
+
+def export_snapshot(snapshot_path, packages, chunk_size=CHUNK_SIZE, jobs=1):
+    """
+    Streams the apps fields used by the DB statistics (read by jobs threads) into a columnar NPZ file: one
+    array per field, the permissions and similar apps as (offsets, ids) pairs, and the strings interned
+    into tables
+    """
+    snapshot_path = os.path.abspath(snapshot_path)
+    temp_directory = snapshot_path + ".tmp"
+    if not os.path.isdir(temp_directory):
+        os.makedirs(temp_directory)
+    interners = dict((table, PackageInterner()) for table in TABLES)
+    writers = dict((column, ColumnWriter(os.path.join(temp_directory, column), dtype)) for column, dtype in COLUMNS)
+    try:
+        docs = get_fields(packages, SNAPSHOT_FIELDS, jobs)
+        n_apps = 0
+        while True:
+            chunk = list(islice(docs, chunk_size))
+            if not chunk:
+                break
+            values = dict((column, []) for column, _ in COLUMNS)
+            for doc in chunk:
+                app_details = get_app_details(doc)
+                permissions = app_details.get("permission") or []
+                similar_packages = doc.get("similarTo") or []
+                upload_date = app_details.get("uploadDate")
+                values["package_ids"].append(interners["packages"].get_id(doc.get("docid")))
+                values["creator_ids"].append(get_optional_id(interners["creators"], doc.get("creator")))
+                values["download_ids"].append(get_optional_id(interners["downloads"],
+                                                              app_details.get("numDownloads")))
+                values["sizes"].append(get_size(app_details))
+                values["upload_dates"].append(
+                    date_tools.play_store_timestamp_to_unix_timestamp(upload_date) if upload_date else np.nan)
+                values["bayesian_ratings"].append(get_rating(doc, "bayesianMeanRating"))
+                values["star_ratings"].append(get_rating(doc, "starRating"))
+                values["permission_counts"].append(len(permissions))
+                values["permission_ids"].extend(interners["permissions"].get_id(p) for p in permissions)
+                values["similar_counts"].append(len(similar_packages))
+                values["similar_ids"].extend(interners["packages"].get_id(p) for p in similar_packages)
+            for column, _ in COLUMNS:
+                writers[column].append(values[column])
+            n_apps += len(chunk)
+            print("{0} {1} apps exported".format(datetime.datetime.now(), n_apps))
+        for writer in writers.values():
+            writer.close()
+
+        arrays = {}
+        for column, _ in COLUMNS:
+            arrays[column] = writers[column].load()
+        arrays["permission_offsets"] = get_offsets(arrays.pop("permission_counts"))
+        arrays["similar_offsets"] = get_offsets(arrays.pop("similar_counts"))
+        for table in TABLES:
+            arrays[table + "_blob"], arrays[table + "_offsets"] = build_string_table(interners[table].packages)
+        print("{0} Writing snapshot".format(datetime.datetime.now()))
+        # written to a temporary file, so that an interrupted export doesn't leave a truncated snapshot
+        temp_path = os.path.join(temp_directory, "snapshot.npz")
+        with open(temp_path, "wb") as f:
+            np.savez(f, **arrays)
+        del arrays
+        os.rename(temp_path, snapshot_path)
+    finally:
+        for writer in writers.values():
+            writer.close()
+        shutil.rmtree(temp_directory, ignore_errors=True)
+
+
+class Snapshot(object):
+    """
+    Columns of an exported snapshot; the rows are the apps, in export order
+    """
+
+    def __init__(self, snapshot_path):
+        self.path = os.path.abspath(snapshot_path)
+        npz = np.load(self.path)
+        self.arrays = dict((name, npz[name]) for name in npz.files)
+        npz.close()
+        # package => id in the packages table, built on the first get_rows_mask
+        self.package_table_ids = None
+
+    def __len__(self):
+        return len(self.arrays["package_ids"])
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__["arrays"][name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def get_table(self, table):
+        return StringTable(self.arrays[table + "_blob"], self.arrays[table + "_offsets"])
+
+    def get_list_rows(self, offsets):
+        """
+        Row of every element of a list column (e.g. permission_ids), given the column offsets
+        """
+        return np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+    def get_rows_mask(self, packages):
+        """
+        Boolean mask of the rows of the given packages (all the rows if packages is empty)
+        """
+        if not packages:
+            return np.ones(len(self), dtype=bool)
+        if self.package_table_ids is None:
+            self.package_table_ids = dict((package, i) for i, package in enumerate(self.get_table("packages")))
+        ids = [self.package_table_ids[package] for package in set(packages) if package in self.package_table_ids]
+        return np.isin(self.package_ids, ids)
@@ -0,0 +1,64 @@
+from array import array
+
+import numpy as np
+
+
+def histogram_to_arrays(histogram):
+    values = np.array(sorted(histogram.keys()), dtype=np.float64)
+    counts = np.array([histogram[value] for value in sorted(histogram.keys())], dtype=np.int64)
+    return values, counts
+
+
+def histogram_mean(histogram):
+    values, counts = histogram_to_arrays(histogram)
+    return float(np.sum(values * counts)) / np.sum(counts)
+
+
+def histogram_std(histogram):
+    values, counts = histogram_to_arrays(histogram)
+    mean = float(np.sum(values * counts)) / np.sum(counts)
+    return np.sqrt(float(np.sum(counts * (values - mean) ** 2)) / np.sum(counts))
+
+
+def histogram_percentile(histogram, q):
+    """
+    Same result of np.percentile (linear interpolation) over the data summarized by the
+    {value: count} histogram, without expanding it
+    """
+    values, counts = histogram_to_arrays(histogram)
+    cumulative_counts = np.cumsum(counts)
+    position = (cumulative_counts[-1] - 1) * q / 100.0
+    lower = int(np.floor(position))
+    upper = min(lower + 1, cumulative_counts[-1] - 1)
+    lower_value = values[np.searchsorted(cumulative_counts, lower, side='right')]
+    upper_value = values[np.searchsorted(cumulative_counts, upper, side='right')]
+    return lower_value + (upper_value - lower_value) * (position - lower)
+
+
+def to_array(values, dtype=None):
+    """
+    ndarray over the values: a view, without copies, of typed arrays (array('d')) and ndarrays, unless a
+    conversion to a different dtype is needed
+    """
+    if isinstance(values, array):
+        if not len(values):
+            return np.zeros(0, dtype=dtype or values.typecode)
+        values = np.frombuffer(values, dtype=values.typecode)
+    return np.asarray(values, dtype=dtype)
+
+
+def describe(values, percentiles=(95, 99)):
+    """
+    Mean, standard deviation and the given percentiles of the values; all the percentiles are computed by
+    a single partition of the data
+    """
+    values = to_array(values, np.float64)
+    return np.mean(values), np.std(values), np.percentile(values, percentiles)
+
+
+def count_values(values):
+    """
+    {value: occurrences} histogram of an integer sequence
+    """
+    unique, counts = np.unique(to_array(values), return_counts=True)
+    return dict(zip(unique.tolist(), counts.tolist()))
@@ -0,0 +1,142 @@
+import datetime
+import multiprocessing
+import time
+import traceback
+
+try:
+    from Queue import Empty, Queue
+except ImportError:
+    from queue import Empty, Queue
+
+# seconds between the checks of the tasks failed in the pool
+POLL_INTERVAL = 1.0
+
+
+class Task(object):
+    """
+    A unit of analysis. inputs and outputs are names of the artifacts the task consumes and produces:
+    a task is started only after every selected task producing one of its inputs has completed.
+    function(context, *args) must be a module-level function (so that it can be sent to worker processes)
+    and returns a dict of statistics. The pool workers are daemonic and can't start processes, so a task
+    spreading its work over its own pool must be in_parent: it runs in the scheduler process.
+    """
+
+    def __init__(self, name, function, inputs=(), outputs=(), default=True, args=(), in_parent=False):
+        self.name = name
+        self.function = function
+        self.args = tuple(args)
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.default = default
+        self.in_parent = in_parent
+
+
+def select_tasks(tasks, only=None, skip=None):
+    """
+    Tasks named in only (or, if only is empty, the tasks enabled by default), minus the ones named in skip
+    """
+    names = [task.name for task in tasks]
+    for name in (only or []) + (skip or []):
+        if name not in names:
+            raise ValueError("Unknown task {0}; available tasks: {1}".format(name, ", ".join(names)))
+    selected = []
+    for task in tasks:
+        if (task.name in only if only else task.default) and task.name not in (skip or []):
+            selected.append(task)
+    return selected
+
+
+def run_task(name, function, args, context):
+    start = time.time()
+    try:
+        return name, function(context, *args), time.time() - start, None
+    except Exception:
+        return name, None, time.time() - start, traceback.format_exc()
+
+
+def get_completed(completed, running):
+    """
+    (name, result, elapsed seconds, error) of the next completed task. The pool doesn't call the callback of a
+    task failed outside run_task (e.g. when its result can't be pickled), so the {task name: AsyncResult} of the
+    running tasks are polled for failures while waiting.
+    """
+    while True:
+        try:
+            return completed.get(timeout=POLL_INTERVAL)
+        except Empty:
+            for name, async_result in running.items():
+                if async_result.ready() and not async_result.successful():
+                    try:
+                        async_result.get()
+                    except Exception:
+                        return name, None, 0.0, traceback.format_exc()
+
+
+def get_dependencies(tasks):
+    producers = {}
+    for task in tasks:
+        for output in task.outputs:
+            producers[output] = task.name
+    dependencies = {}
+    for task in tasks:
+        dependencies[task.name] = set(producers[i] for i in task.inputs
+                                      if i in producers and producers[i] != task.name)
+    return dependencies
+
+
+def run_tasks(tasks, context, jobs=1):
+    """
+    Runs the tasks respecting their dependencies, using a pool of jobs processes (in the current process if
+    jobs is 1, or for the in_parent tasks, which run once the ready tasks have been sent to the pool).
+    context is passed to every task, unless it is a {task name: context} dict.
+    Returns a {task name: (result, elapsed seconds, error)} dict; the tasks depending on a failed task are not run.
+    """
+    dependencies = get_dependencies(tasks)
+    pending = list(tasks)
+    results = {}
+    completed = Queue()
+    running = {}
+    pool = None
+    if jobs > 1:
+        pool = multiprocessing.Pool(jobs)
+    n_running = 0
+    try:
+        while pending or n_running:
+            parent_tasks = []
+            for task in list(pending):
+                failed = [d for d in dependencies[task.name] if d in results and results[d][2] is not None]
+                if failed:
+                    pending.remove(task)
+                    results[task.name] = (None, 0.0, "dependency {0} failed".format(failed[0]))
+                    continue
+                if not all(d in results for d in dependencies[task.name]):
+                    continue
+                pending.remove(task)
+                print("{0} Starting task {1}".format(datetime.datetime.now(), task.name))
+                task_context = context[task.name] if isinstance(context, dict) else context
+                if pool is None or task.in_parent:
+                    parent_tasks.append((task, task_context))
+                else:
+                    running[task.name] = pool.apply_async(run_task, (task.name, task.function, task.args,
+                                                                     task_context), callback=completed.put)
+                n_running += 1
+            for task, task_context in parent_tasks:
+                completed.put(run_task(task.name, task.function, task.args, task_context))
+            if not n_running:
+                break
+            name, result, elapsed, error = get_completed(completed, running)
+            running.pop(name, None)
+            n_running -= 1
+            results[name] = (result, elapsed, error)
+            if error:
+                print("{0} Task {1} failed after {2:.1f}s:\n{3}".format(datetime.datetime.now(), name, elapsed,
+                                                                         error))
+            else:
+                print("{0} Task {1} completed in {2:.1f}s".format(datetime.datetime.now(), name, elapsed))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    for task in pending:
+        results[task.name] = (None, 0.0, "circular dependency")
+    return results
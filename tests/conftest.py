@@ -0,0 +1,102 @@
+import os
+import random
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db_interface  # noqa: E402
+from csr_graph import load_csr_graph, save_csr_graph  # noqa: E402
+
+PERMISSIONS = ["android.permission.INTERNET", "android.permission.CAMERA", "Android.Permission.READ_CONTACTS",
+               "android.permission.WAKE_LOCK", "com.vendor.permission.C2D_MESSAGE"]
+DOWNLOADS = ["100+", "1,000+", "10,000+", "1,000,000+"]
+UPLOAD_DATES = ["1 Aug 2017", "3 Sep 2017", "12 Jan 2016", "29 Feb 2016"]
+
+
+class DbConf(object):
+    name = "playstore_graph_analysis_test"
+
+
+def make_apps(n_apps, seed=0):
+    """
+    Play Store snapshot documents with the fields read by the analyzers (some of them missing, as in the crawl)
+    """
+    r = random.Random(seed)
+    apps = []
+    for i in range(n_apps):
+        app_details = {"numDownloads": r.choice(DOWNLOADS), "uploadDate": r.choice(UPLOAD_DATES),
+                       "file": [{"size": r.randint(1000, 10 ** 8)}],
+                       "permission": r.sample(PERMISSIONS, r.randint(0, len(PERMISSIONS)))}
+        if i % 7 == 0:
+            del app_details["permission"]
+        apps.append({"docid": "app{0}".format(i), "creator": "dev{0}".format(r.randint(0, n_apps // 4)),
+                     "similarTo": ["app{0}".format(r.randint(0, n_apps - 1)) for _ in range(r.randint(0, 4))],
+                     "details": {"appDetails": app_details},
+                     "aggregateRating": {"bayesianMeanRating": round(r.uniform(1, 5), 3),
+                                         "starRating": round(r.uniform(1, 5), 3)}})
+    return apps
+
+
+@pytest.fixture
+def db(monkeypatch):
+    """
+    Empty test db, used by db_interface: a local mongod if MONGODB_TEST_URI is set, otherwise mongomock
+    """
+    uri = os.environ.get("MONGODB_TEST_URI")
+    if uri:
+        import pymongo
+        client = pymongo.MongoClient(uri)
+    else:
+        mongomock = pytest.importorskip("mongomock")
+        client = mongomock.MongoClient()
+    client.drop_database(DbConf.name)
+    monkeypatch.setattr(db_interface, "client", client)
+    # the temporary collections of the test db are dropped with it
+    monkeypatch.setattr(db_interface, "subset_collections", {})
+    monkeypatch.setattr(db_interface, "dbconf", DbConf)
+    monkeypatch.setattr(db_interface, "wait_before_retry", lambda attempt: None)
+    yield client[DbConf.name]
+    client.drop_database(DbConf.name)
+
+
+@pytest.fixture
+def apps_db(db):
+    db[db_interface.COL_PLAYSTORE_SNAPSHOT].insert_many(make_apps(120))
+    return db
+
+
+def make_edges(n_nodes, n_edges, seed=0):
+    """
+    Random (sources, destinations) edges with multi-edges, self-loops and dangling nodes (the last 5), as in the
+    similarity graph
+    """
+    r = np.random.RandomState(seed)
+    sources = r.randint(0, n_nodes - 5, n_edges)
+    destinations = r.randint(0, n_nodes, n_edges)
+    sources = np.concatenate([sources, sources[:10], [3, 7]])
+    destinations = np.concatenate([destinations, destinations[:10], [3, 7]])
+    return sources, destinations
+
+
+def save_graph(directory, packages, sources, destinations):
+    """
+    Saves the CSR graph in directory (a py.path), returns the graph path
+    """
+    graph_path = str(directory.join("apps.graph"))
+    save_csr_graph(graph_path, packages, sources, destinations)
+    return graph_path
+
+
+N_NODES = 60
+
+
+@pytest.fixture
+def csr_graph(tmpdir):
+    """
+    CSR graph of make_edges(N_NODES, 200), node i labeled app<i>
+    """
+    sources, destinations = make_edges(N_NODES, 200)
+    return load_csr_graph(save_graph(tmpdir, ["app{0}".format(i) for i in range(N_NODES)], sources, destinations))
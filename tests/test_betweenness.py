@@ -0,0 +1,59 @@
+import json
+import multiprocessing
+
+import networkx as nx
+import numpy as np
+import pytest
+
+import betweenness
+from betweenness import compute_approximate_betweenness
+from conftest import save_graph
+from graph_analyzer import GRAPH_STATISTICS_TASKS, compute_graph_statistics
+
+
+def save_random_graph(directory, n_nodes=40):
+    # a simple graph: networkx counts the shortest paths of a multigraph once per pair of nodes
+    graph = nx.gnp_random_graph(n_nodes, 0.08, seed=2, directed=True)
+    sources, destinations = map(np.array, zip(*graph.edges()))
+    graph_path = save_graph(directory, ["app{0}".format(i) for i in range(n_nodes)], sources, destinations)
+    expected = nx.betweenness_centrality(graph, normalized=False)
+    return graph_path, np.array([expected[node] for node in range(n_nodes)])
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_betweenness_with_every_pivot_matches_networkx(tmpdir, workers):
+    graph_path, expected = save_random_graph(tmpdir)
+    estimates, standard_errors = compute_approximate_betweenness(graph_path, 40, workers=workers, seed=0)
+    assert np.allclose(estimates, expected)
+    assert np.allclose(standard_errors, 0)
+
+
+def test_betweenness_estimates_are_unbiased(tmpdir):
+    graph_path, expected = save_random_graph(tmpdir)
+    estimates = np.mean([compute_approximate_betweenness(graph_path, 10, seed=seed)[0] for seed in range(200)],
+                        axis=0)
+    assert np.abs(estimates - expected).sum() < 0.05 * expected.sum()
+
+
+def test_betweenness_task_spreads_the_pivots_over_a_pool(tmpdir, monkeypatch):
+    graph_path, expected = save_random_graph(tmpdir)
+    # the snap graph is only fingerprinted, the tasks read the CSR graph
+    tmpdir.join("apps.graph").write("")
+    initializers = []
+    pool = multiprocessing.Pool
+
+    def spy_pool(*args, **kwargs):
+        initializers.append(kwargs.get("initializer"))
+        return pool(*args, **kwargs)
+
+    monkeypatch.setattr(multiprocessing, "Pool", spy_pool)
+    compute_graph_statistics(graph_path, False, betweenness_samples=40, jobs=2, only=["betweenness"])
+
+    assert [task.in_parent for task in GRAPH_STATISTICS_TASKS if task.name == "betweenness"] == [True]
+    # the betweenness pool was started by this process, not from a (daemonic) scheduler worker
+    assert betweenness.init_worker in initializers
+    with open(str(tmpdir.join("apps_statistics.json"))) as f:
+        statistics = json.load(f)
+    top_n = statistics["top_n_betweenness"]
+    assert np.allclose([value for _, value in top_n], [expected[int(package[3:])] for package, _ in top_n])
+    assert np.allclose([value for _, value in top_n], np.sort(expected)[::-1][:len(top_n)])
@@ -0,0 +1,39 @@
+import numpy as np
+
+from conftest import N_NODES, make_edges, save_graph
+from csr_graph import StringTable, build_string_table, has_csr_graph, load_csr_graph
+
+
+def get_edges(csr_graph):
+    return sorted(zip(csr_graph.get_sources().tolist(), np.asarray(csr_graph.indices).tolist()))
+
+
+def test_csr_graph_has_every_edge(csr_graph):
+    sources, destinations = make_edges(N_NODES, 200)
+    assert get_edges(csr_graph) == sorted(zip(sources.tolist(), destinations.tolist()))
+    assert csr_graph.n_nodes == N_NODES
+    assert csr_graph.get_out_degrees().tolist() == np.bincount(sources, minlength=N_NODES).tolist()
+    assert csr_graph.get_in_degrees().tolist() == np.bincount(destinations, minlength=N_NODES).tolist()
+    assert sorted(csr_graph.get_out_neighbors(3).tolist()) == sorted(destinations[sources == 3].tolist())
+    assert list(csr_graph.packages)[:3] == ["app0", "app1", "app2"]
+
+
+def test_subgraph_edges(csr_graph):
+    nodes = [3, 7, 11, 20]
+    assert csr_graph.get_subgraph_edges(nodes) == [edge for edge in get_edges(csr_graph)
+                                                   if edge[0] in nodes and edge[1] in nodes]
+
+
+def test_string_table():
+    strings = [u"com.example", u"", u"com.\u00e8xample.app"]
+    table = StringTable(*build_string_table(strings))
+    assert len(table) == 3
+    assert list(table) == strings
+    assert len(StringTable(*build_string_table([]))) == 0
+
+
+def test_empty_graph(tmpdir):
+    graph_path = save_graph(tmpdir, [], np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32))
+    assert has_csr_graph(graph_path)
+    csr_graph = load_csr_graph(graph_path)
+    assert (csr_graph.n_nodes, csr_graph.n_edges) == (0, 0)
@@ -0,0 +1,26 @@
+import calendar
+import datetime
+
+import numpy as np
+
+import date_tools
+from date_tools import play_store_timestamp_to_unix_timestamp, play_store_timestamps_to_unix_timestamps
+
+
+def get_expected(date):
+    return calendar.timegm(datetime.datetime.strptime(date, "%d %b %Y").timetuple())
+
+
+def test_dates_are_parsed_as_utc_midnights():
+    for date in ["1 Aug 2017", "29 Feb 2016", "31 Dec 1999", "01 Jan 2010"]:
+        assert play_store_timestamp_to_unix_timestamp(date) == get_expected(date)
+    assert play_store_timestamp_to_unix_timestamp("2 Jan 1970") == 24 * 3600
+    assert "29 Feb 2016" in date_tools.converted_timestamps
+
+
+def test_batch_conversion():
+    dates = ["3 Sep 2017", "1 Aug 2017", "3 Sep 2017", "12 Jan 2016"]
+    timestamps = play_store_timestamps_to_unix_timestamps(dates)
+    assert timestamps.dtype == np.int64
+    assert timestamps.tolist() == [get_expected(date) for date in dates]
+    assert len(play_store_timestamps_to_unix_timestamps([])) == 0
@@ -0,0 +1,140 @@
+import json
+import os
+from collections import Counter
+
+import numpy as np
+import pytest
+
+import date_tools
+import db_interface
+from db_accumulators import CreatorsAccumulator, DownloadsAccumulator, PermissionsAccumulator, \
+    PermissionSetsAccumulator, RatingAccumulator, SizeAccumulator, UploadDateAccumulator, feed, \
+    get_projection_fields
+from db_analyzer import collect_server_side, compute_db_statistics
+from db_interface import COL_PLAYSTORE_SNAPSHOT, count_apps, get_fields
+
+# the android permissions filter uses $substrCP, which mongomock doesn't implement
+needs_mongod = pytest.mark.skipif(not os.environ.get("MONGODB_TEST_URI"),
+                                  reason="$substrCP needs a real mongod (MONGODB_TEST_URI)")
+
+
+def get_values(pairs):
+    # the order of the items with the same value depends on the scan order
+    return [value for _, value in pairs]
+
+
+def summarize(accumulator):
+    """
+    What the reports read from an accumulator (or from the summary of the server side statistics)
+    """
+    if isinstance(accumulator, DownloadsAccumulator):
+        return accumulator.buckets
+    if isinstance(accumulator, UploadDateAccumulator):
+        return accumulator.dates
+    if isinstance(accumulator, SizeAccumulator):
+        return (sorted(accumulator.top.get_sorted()), sorted(accumulator.bottom.get_sorted()),
+                sorted(accumulator.sizes))
+    if isinstance(accumulator, RatingAccumulator):
+        return get_values(accumulator.top.get_sorted()), sorted(accumulator.ratings)
+    if isinstance(accumulator, PermissionSetsAccumulator):
+        names = accumulator.get_permissions_matrix().permissions
+        cooccurrence = accumulator.get_cooccurrence()
+        return dict(((names[i], names[j]), int(cooccurrence[i, j]))
+                    for i in range(len(names)) for j in range(len(names)))
+    if hasattr(accumulator, "get_permissions_counter"):
+        return (accumulator.get_permissions_counter(), accumulator.get_n_permissions_buckets(),
+                get_values(accumulator.get_top_requesters(10)))
+    if hasattr(accumulator, "get_productivity"):
+        return get_values(accumulator.get_top(10)), accumulator.get_productivity()
+    raise TypeError(accumulator)
+
+
+def compare_server_side(factory, packages=None):
+    scanned = [factory()]
+    n_apps = feed(scanned, get_fields(packages, get_projection_fields(scanned)))
+    aggregated = collect_server_side([factory()], packages)
+    assert count_apps(packages) == n_apps
+    assert summarize(aggregated[0]) == summarize(scanned[0])
+
+
+@pytest.mark.parametrize("factory", [DownloadsAccumulator, UploadDateAccumulator, SizeAccumulator,
+                                     lambda: RatingAccumulator("bayesianMeanRating"),
+                                     lambda: RatingAccumulator("starRating"), CreatorsAccumulator,
+                                     pytest.param(PermissionsAccumulator, marks=needs_mongod),
+                                     pytest.param(PermissionSetsAccumulator, marks=needs_mongod)])
+def test_server_side_statistics_match_the_scan(apps_db, factory):
+    compare_server_side(factory)
+
+
+@pytest.mark.parametrize("chunk_size", [1000, 7])
+def test_server_side_statistics_of_packages_match_the_scan(apps_db, monkeypatch, chunk_size):
+    # with the small chunks, the subset is joined from a temporary collection
+    monkeypatch.setattr(db_interface, "PACKAGES_CHUNK_SIZE", chunk_size)
+    packages = ["app{0}".format(i) for i in range(0, 120, 3)] + ["missing"]
+    for factory in (DownloadsAccumulator, SizeAccumulator, CreatorsAccumulator):
+        compare_server_side(factory, packages)
+
+
+def describe_baseline(values, name, statistics):
+    statistics["avg_" + name] = np.mean(values)
+    statistics["stdev_" + name] = np.std(values)
+    statistics["95perc_" + name] = np.percentile(values, 95)
+    statistics["99perc_" + name] = np.percentile(values, 99)
+
+
+def get_baseline_statistics(apps):
+    """
+    The statistics as computed by the section by section scans that the fused scan replaced
+    """
+    statistics = {"n_apps": len(apps)}
+    app_details = [app["details"]["appDetails"] for app in apps]
+    sizes = [(app["docid"], int(details["file"][0]["size"])) for app, details in zip(apps, app_details)]
+    statistics["biggest_apps"] = sorted(sizes, key=lambda pair: pair[1], reverse=True)[:10]
+    statistics["smallest_apps"] = sorted(sizes, key=lambda pair: pair[1])[:10]
+    describe_baseline([size for _, size in sizes], "app_size", statistics)
+    statistics["avg_app_timestamp"] = np.mean([date_tools.play_store_timestamp_to_unix_timestamp(
+        details["uploadDate"]) for details in app_details])
+    ratings = [(app["docid"], app["aggregateRating"]["bayesianMeanRating"]) for app in apps]
+    statistics["top_bayesian_rated_apps"] = sorted(ratings, key=lambda pair: pair[1], reverse=True)[:10]
+    describe_baseline([rating for _, rating in ratings], "bayesian_rating", statistics)
+    describe_baseline([app["aggregateRating"]["starRating"] for app in apps], "star_rating", statistics)
+
+    requests = [[p.upper() for p in details.get("permission") or [] if p.upper().startswith("ANDROID.PERMISSION")]
+                for details in app_details]
+    permissions_counter = Counter(p for permissions in requests for p in permissions)
+    statistics["n_permissions"] = len(permissions_counter)
+    describe_baseline([len(permissions) for permissions in requests], "permissions_per_app", statistics)
+    most_requested = sorted(permissions_counter.items(), key=lambda pair: pair[1], reverse=True)
+    statistics["most_requested_permissions"] = [(p, float(n) / len(apps) * 100) for p, n in most_requested[:10]]
+    statistics["less_requested_permissions"] = [(p, float(n) / len(apps) * 100)
+                                                for p, n in reversed(most_requested[-10:])]
+    statistics["top_permissions_requesters"] = sorted(
+        ((app["docid"], len(permissions)) for app, permissions in zip(apps, requests)),
+        key=lambda pair: pair[1], reverse=True)[:10]
+
+    creators = Counter(app["creator"] for app in apps)
+    statistics["n_creators"] = len(creators)
+    statistics["most_prolific_creators"] = creators.most_common(10)
+    describe_baseline(list(creators.values()), "apps_per_creator", statistics)
+    return statistics
+
+
+def get_values_if_tied(statistics, key):
+    # the order of the items with the same value depends on the scan order, as the items cut from the top 10
+    pairs = statistics[key]
+    values = [pair[-1] for pair in pairs]
+    return sorted(values) if len(set(values)) < len(values) else [list(pair) for pair in pairs]
+
+
+def test_fused_scan_produces_the_same_statistics(apps_db, tmpdir):
+    stats_path = str(tmpdir.join("stats"))
+    compute_db_statistics(stats_path, None, "Test", True)
+    with open(stats_path + ".db_statistics.json", "r") as f:
+        statistics = json.load(f)
+    apps = list(apps_db[COL_PLAYSTORE_SNAPSHOT].find())
+    expected = get_baseline_statistics(apps)
+    for key, value in expected.items():
+        if isinstance(value, list):
+            assert get_values_if_tied(statistics, key) == get_values_if_tied(expected, key), key
+        else:
+            assert statistics[key] == pytest.approx(value), key
@@ -0,0 +1,139 @@
+import os
+import subprocess
+import sys
+import types
+
+import pytest
+from pymongo.errors import AutoReconnect
+
+import db_interface
+from db_interface import COL_PLAYSTORE, COL_PLAYSTORE_SNAPSHOT, count_apps, create_subset_collection, \
+    drop_subset_collection, find_resumable, get_collection_fingerprint, get_dbconf, get_descriptions, read_apps
+
+
+class FlakyCursor(object):
+    def __init__(self, cursor, collection):
+        self.cursor = cursor
+        self.collection = collection
+
+    def sort(self, *args, **kwargs):
+        self.cursor = self.cursor.sort(*args, **kwargs)
+        return self
+
+    def __iter__(self):
+        for doc in self.cursor:
+            if self.collection.failures and self.collection.n_read == self.collection.fail_after:
+                self.collection.failures -= 1
+                self.collection.n_read = 0
+                raise AutoReconnect("connection lost")
+            self.collection.n_read += 1
+            yield doc
+
+
+class FlakyCollection(object):
+    """
+    Collection whose cursors lose the connection after fail_after documents, failures times
+    """
+
+    def __init__(self, collection, fail_after, failures=1):
+        self.collection = collection
+        self.fail_after = fail_after
+        self.failures = failures
+        self.n_read = 0
+        self.queries = []
+
+    def find(self, query, *args, **kwargs):
+        self.queries.append(query)
+        return FlakyCursor(self.collection.find(query, *args, **kwargs), self)
+
+
+def get_docids(docs):
+    return [doc["docid"] for doc in docs]
+
+
+def test_db_configuration_is_read_on_first_use(monkeypatch):
+    # neither the configuration nor snap are imported by the modules using the db
+    code = "import sys, db_analyzer, graph_analyzer; print(sorted(set(['config', 'snap']) & set(sys.modules)))"
+    output = subprocess.check_output([sys.executable, "-c", code],
+                                     cwd=os.path.dirname(os.path.abspath(db_interface.__file__)))
+    assert output.decode("utf-8").strip().splitlines()[-1] == "[]"
+
+    config = types.ModuleType("config")
+    config.dbconf = None
+    monkeypatch.setitem(sys.modules, "config", config)
+    monkeypatch.setattr(db_interface, "dbconf", None)
+    with pytest.raises(RuntimeError):
+        get_dbconf()
+    config.dbconf = "configuration"
+    assert get_dbconf() == "configuration"
+
+
+def test_find_resumable_goes_on_from_the_last_id(apps_db):
+    collection = FlakyCollection(apps_db[COL_PLAYSTORE_SNAPSHOT], fail_after=50, failures=2)
+    docs = list(find_resumable(collection, {}, {"_id": 0, "docid": 1}))
+    assert get_docids(docs) == get_docids(apps_db[COL_PLAYSTORE_SNAPSHOT].find().sort("_id", 1))
+    assert all("_id" not in doc for doc in docs)
+    # the retries start after the last _id read
+    assert len(collection.queries) == 3
+    assert "$and" in collection.queries[1]
+
+
+def test_packages_chunks_are_read_again(apps_db):
+    collection = FlakyCollection(apps_db[COL_PLAYSTORE_SNAPSHOT], fail_after=5)
+    packages = ["app{0}".format(i) for i in range(20)]
+    docs = list(read_apps(collection, packages, {"_id": 0, "docid": 1}))
+    assert sorted(get_docids(docs)) == sorted(packages)
+    # the chunk query is run again as it is, without sorting on _id
+    assert collection.queries == [{"docid": {"$in": packages}}] * 2
+
+
+def test_translated_descriptions_are_read_for_all_the_apps(db):
+    db[COL_PLAYSTORE].insert_many([{"docid": "app{0}".format(i), "descriptionHtml": "<b>description</b>",
+                                    "translatedDescriptionHtml": "translated", "title": "title"} for i in range(5)])
+    docs = list(get_descriptions(None))
+    assert sorted(get_docids(docs)) == ["app{0}".format(i) for i in range(5)]
+    assert all(sorted(doc) == ["descriptionHtml", "docid", "translatedDescriptionHtml"] for doc in docs)
+    docs = list(get_descriptions(["app1", "app3", "missing"]))
+    assert sorted(get_docids(docs)) == ["app1", "app3"]
+    assert all(sorted(doc) == ["descriptionHtml", "docid"] for doc in docs)
+
+
+def test_counts_and_fingerprint(apps_db):
+    packages = ["app{0}".format(i) for i in range(0, 120, 3)] + ["missing"]
+    assert count_apps(None) == 120
+    assert count_apps(packages) == 40
+    fingerprint = get_collection_fingerprint(packages)
+    assert fingerprint["count"] == 120
+    assert fingerprint == get_collection_fingerprint(list(reversed(packages)))
+    assert fingerprint["packages"] != get_collection_fingerprint(packages[1:])["packages"]
+    apps_db[COL_PLAYSTORE_SNAPSHOT].insert_one({"docid": "new app"})
+    assert get_collection_fingerprint(packages)["count"] == 121
+
+
+def test_sharded_reads_return_every_app_once(apps_db, monkeypatch):
+    monkeypatch.setattr(db_interface, "PACKAGES_CHUNK_SIZE", 9)
+    collection = apps_db[COL_PLAYSTORE_SNAPSHOT]
+    all_docids = sorted(get_docids(collection.find()))
+    assert sorted(get_docids(read_apps(collection, None, {"_id": 0, "docid": 1}, jobs=3, batch_size=7))) == \
+        all_docids
+    packages = all_docids[::2]
+    assert sorted(get_docids(read_apps(collection, packages, {"_id": 0, "docid": 1}, jobs=3, batch_size=7))) == \
+        packages
+
+
+def test_subset_collection_is_private_to_the_process(db):
+    packages = ["app{0}".format(i) for i in range(5)]
+    collection = create_subset_collection(packages)
+    assert collection.name.endswith("_{0}".format(os.getpid()))
+    assert sorted(doc["docid"] for doc in collection.find()) == packages
+    assert create_subset_collection(list(reversed(packages))).name == collection.name
+    drop_subset_collection(db_interface.get_packages_hash(packages))
+    assert collection.name not in db.list_collection_names()
+
+
+def test_dropping_without_a_client_does_nothing(monkeypatch):
+    monkeypatch.setattr(db_interface, "client", None)
+    monkeypatch.setattr(db_interface, "subset_collections", {"hash": "tmp_subset_hash_1"})
+    monkeypatch.setattr(db_interface, "create_client", None)
+    drop_subset_collection("hash")
+    assert db_interface.subset_collections == {}
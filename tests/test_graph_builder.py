@@ -0,0 +1,27 @@
+import pytest
+
+from db_interface import COL_PLAYSTORE_SNAPSHOT
+from graph_builder import build_snap_graph, read_similarity_edges
+
+
+def test_similarity_edges_are_read_in_batches(apps_db):
+    interner, sources, destinations = read_similarity_edges(batch_size=7)
+    edges = sorted(zip((interner.packages[i] for i in sources), (interner.packages[i] for i in destinations)))
+    assert edges == sorted((app["docid"], similar) for app in apps_db[COL_PLAYSTORE_SNAPSHOT].find()
+                           for similar in app["similarTo"])
+    assert len(interner) == len(set(interner.packages))
+
+
+def test_empty_collection_has_no_edges(db):
+    interner, sources, destinations = read_similarity_edges()
+    assert len(interner) == 0
+    assert len(sources) == len(destinations) == 0
+
+
+def test_snap_graph_has_every_edge(apps_db):
+    pytest.importorskip("snap")
+    interner, sources, destinations = read_similarity_edges()
+    graph = build_snap_graph(interner.packages, sources, destinations)
+    assert graph.GetNodes() == len(interner)
+    assert graph.GetEdges() == len(sources)
+    assert graph.GetStrAttrDatN(5, "pkg") == interner.packages[5]
@@ -0,0 +1,31 @@
+import networkx as nx
+import numpy as np
+
+from conftest import N_NODES
+from graph_distributions import get_components, get_core_numbers, get_kcore_distributions
+from test_pagerank import to_networkx
+
+
+def get_partition(labels):
+    return sorted(sorted(np.flatnonzero(labels == label).tolist()) for label in np.unique(labels))
+
+
+def test_components_match_networkx(csr_graph):
+    graph = to_networkx(csr_graph)
+    assert get_partition(get_components(csr_graph, strong=True)) == \
+        sorted(sorted(component) for component in nx.strongly_connected_components(graph))
+    assert get_partition(get_components(csr_graph, strong=False)) == \
+        sorted(sorted(component) for component in nx.weakly_connected_components(graph))
+
+
+def test_core_numbers_match_networkx(csr_graph):
+    graph = nx.Graph(to_networkx(csr_graph).to_undirected())
+    graph.remove_edges_from(list(nx.selfloop_edges(graph)))
+    core_numbers = get_core_numbers(csr_graph)
+    expected = nx.core_number(graph)
+    assert core_numbers.tolist() == [expected[node] for node in range(N_NODES)]
+
+    (ks, nodes_counts), (_, edges_counts) = get_kcore_distributions(csr_graph, core_numbers)
+    for k, n_nodes, n_edges in zip(ks, nodes_counts, edges_counts):
+        kcore = nx.k_core(graph, k)
+        assert (n_nodes, n_edges) == (kcore.number_of_nodes(), kcore.number_of_edges())
@@ -0,0 +1,59 @@
+import os
+
+import numpy as np
+import pytest
+
+import graph_layout
+from graph_layout import get_layout, get_layout_key, spring_layout
+
+# two triangles joined by an edge, plus an isolated node
+NODES = [10, 11, 12, 20, 21, 22, 30]
+EDGES = [(10, 11), (11, 12), (12, 10), (20, 21), (21, 22), (22, 20), (12, 20)]
+
+
+@pytest.fixture(autouse=True)
+def clear_computed_layouts(monkeypatch):
+    monkeypatch.setattr(graph_layout, "computed_layouts", {})
+
+
+def get_distance(layout, source, destination):
+    return np.hypot(layout[source][0] - layout[destination][0], layout[source][1] - layout[destination][1])
+
+
+def test_spring_layout_keeps_the_edges_short():
+    layout = spring_layout(NODES, EDGES)
+    assert sorted(layout) == NODES
+    positions = np.array(list(layout.values()))
+    assert np.abs(positions).max() == pytest.approx(1.0)
+    assert np.allclose(positions.mean(axis=0), 0)
+    edge_lengths = [get_distance(layout, source, destination) for source, destination in EDGES]
+    others = [get_distance(layout, source, destination) for source in NODES for destination in NODES
+              if source < destination and (source, destination) not in EDGES and (destination, source) not in EDGES]
+    assert max(edge_lengths) < np.mean(others)
+    # the same seed, the same layout
+    assert spring_layout(NODES, EDGES) == layout
+
+
+def test_small_layouts():
+    assert spring_layout([], []) == {}
+    assert spring_layout([5], []) == {5: (0.0, 0.0)}
+
+
+def test_layout_key_ignores_the_order_and_direction():
+    assert get_layout_key(NODES, EDGES) == get_layout_key(list(reversed(NODES)), [(d, s) for s, d in EDGES])
+    assert get_layout_key(NODES, EDGES) != get_layout_key(NODES, EDGES[:-1])
+
+
+def test_layouts_are_cached(tmpdir, monkeypatch):
+    cache_directory = str(tmpdir.join("layouts"))
+    layout = get_layout(NODES, EDGES, cache_directory)
+    assert os.listdir(cache_directory) == [get_layout_key(NODES, EDGES) + ".json"]
+
+    def fail(*args, **kwargs):
+        raise AssertionError("layout computed again")
+
+    monkeypatch.setattr(graph_layout, "spring_layout", fail)
+    assert get_layout(NODES, EDGES, cache_directory) is layout
+    # a new process reads it from the cache directory
+    monkeypatch.setattr(graph_layout, "computed_layouts", {})
+    assert get_layout(NODES, EDGES, cache_directory) == layout
@@ -0,0 +1,41 @@
+import pytest
+
+from keyword_index import KeywordIndex, get_description_hash
+
+
+@pytest.fixture
+def index(tmpdir):
+    index = KeywordIndex(str(tmpdir.join("keywords.sqlite")))
+    yield index
+    index.close()
+
+
+def get_totals(pairs):
+    return dict((phrase, round(score, 6)) for phrase, score in pairs)
+
+
+def test_totals_follow_the_changes_of_the_apps(index):
+    index.set_app("app0", get_description_hash(u"photo editor"), [(4.0, "photo editor"), (1.0, "filters")])
+    index.set_app("app1", get_description_hash(u"photo filters"), [(2.0, "photo editor"), (1.5, "filters")])
+    index.commit()
+    assert index.get_top_keywords() == [("photo editor", 6.0), ("filters", 2.5)]
+    assert index.get_top_keywords(1) == [("photo editor", 6.0)]
+
+    # a changed description replaces the phrases of the app
+    index.set_app("app1", get_description_hash(u"music player"), [(3.0, "music player")])
+    index.remove_app("app0")
+    index.commit()
+    assert get_totals(index.get_top_keywords()) == {"music player": 3.0}
+    assert index.get_docids() == set(["app1"])
+    assert index.get_description_hash("app1") == get_description_hash(u"music player")
+    assert index.get_description_hash("app0") is None
+
+
+def test_subset_top_keywords(index):
+    index.set_app("app0", "h0", [(4.0, "photo editor"), (1.0, "filters")])
+    index.set_app("app1", "h1", [(2.0, "filters")])
+    index.set_app("app2", "h2", [(5.0, "music player")])
+    index.commit()
+    assert index.get_subset_top_keywords(["app0", "app1", "missing"]) == [("photo editor", 4.0), ("filters", 3.0)]
+    assert index.get_subset_top_keywords(["app2"], 1) == [("music player", 5.0)]
+    assert index.count_missing(["app0", "missing", "missing", "other"]) == 2
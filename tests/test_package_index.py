@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import multiprocessing
+import os
+
+import numpy as np
+
+from conftest import save_graph
+from csr_graph import get_base_path
+from package_index import InMemoryPackageIndex, has_package_index, load_package_index, read_packages_file, \
+    save_package_index
+
+PACKAGES = [u"com.b", u"com.a", u"org.cafè", u"com.ab", u"a"]
+
+
+def save_index(graph_path):
+    save_package_index(graph_path, PACKAGES)
+
+
+def make_graph(tmpdir):
+    return save_graph(tmpdir, PACKAGES, np.array([0, 1]), np.array([1, 2]))
+
+
+def test_package_index_maps_packages_and_ids(tmpdir):
+    graph_path = make_graph(tmpdir)
+    assert not has_package_index(graph_path)
+    save_package_index(graph_path, PACKAGES)
+    assert has_package_index(graph_path)
+    index = load_package_index(graph_path)
+    assert len(index) == len(PACKAGES)
+    for node_id, package in enumerate(PACKAGES):
+        assert index.get_package(node_id) == package
+        assert index.get_id(package) == node_id
+    assert index.get_id(u"com") is None
+    assert index.get_id(u"zzz") is None
+    assert index.get_ids([u"a", u"missing", u"com.b"]) == [4, 0]
+
+
+def test_concurrent_saves_leave_a_complete_index(tmpdir):
+    graph_path = make_graph(tmpdir)
+    pool = multiprocessing.Pool(4)
+    try:
+        pool.map(save_index, [graph_path] * 8)
+    finally:
+        pool.close()
+        pool.join()
+    assert [load_package_index(graph_path).get_id(package) for package in PACKAGES] == list(range(len(PACKAGES)))
+    base_name = os.path.basename(get_base_path(graph_path))
+    assert not [name for name in os.listdir(str(tmpdir)) if name.startswith(base_name) and name.endswith(".tmp")]
+
+
+def test_in_memory_package_index():
+    index = InMemoryPackageIndex(dict(enumerate(PACKAGES)))
+    assert len(index) == len(PACKAGES)
+    assert index.get_package(2) == u"org.cafè"
+    assert index.get_id(u"com.ab") == 3
+    assert index.get_id(u"missing") is None
+    assert index.get_ids([u"a", u"missing", u"com.b"]) == [4, 0]
+
+
+def test_read_packages_file(tmpdir):
+    path = tmpdir.join("packages.txt")
+    path.write("com.a com.b\n\ncom.c\ncom.a  com.d\n")
+    assert read_packages_file(str(path)) == ["com.a", "com.b", "com.c", "com.d"]
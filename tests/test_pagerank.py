@@ -0,0 +1,65 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+from conftest import N_NODES, make_edges, save_graph
+from csr_graph import load_csr_graph
+from graph_analyzer import get_warm_start_ranks, save_ranks
+from pagerank import compute_pagerank
+from result_cache import ResultCache
+
+
+def to_networkx(csr_graph):
+    """
+    DiGraph of the CSR graph, weighted by the number of parallel edges
+    """
+    graph = nx.DiGraph()
+    graph.add_nodes_from(range(csr_graph.n_nodes))
+    for source, destination in zip(csr_graph.get_sources().tolist(), np.asarray(csr_graph.indices).tolist()):
+        if graph.has_edge(source, destination):
+            graph[source][destination]["weight"] += 1
+        else:
+            graph.add_edge(source, destination, weight=1)
+    return graph
+
+
+@pytest.mark.parametrize("personalized_nodes", [None, [0, 5, N_NODES - 1]])
+def test_pagerank_matches_networkx(csr_graph, personalized_nodes):
+    ranks, _, residual = compute_pagerank(csr_graph, tolerance=1e-12, max_iterations=1000,
+                                          personalized_nodes=personalized_nodes)
+    assert residual < 1e-12
+    personalization = None if personalized_nodes is None else dict((node, 1) for node in personalized_nodes)
+    # the multi-edges count as many times as they appear, as in the CSR transition matrix
+    expected = nx.pagerank(to_networkx(csr_graph), personalization=personalization, tol=1e-14, max_iter=1000)
+    assert np.allclose(ranks, [expected[node] for node in range(N_NODES)], atol=1e-9)
+
+
+def test_pagerank_rejects_empty_personalization(csr_graph):
+    with pytest.raises(ValueError):
+        compute_pagerank(csr_graph, personalized_nodes=[])
+
+
+def test_warm_start_ranks_are_remapped_by_package(csr_graph, tmpdir):
+    ranks, _, _ = compute_pagerank(csr_graph, tolerance=1e-10, max_iterations=1000)
+    cache = ResultCache(str(tmpdir.join("cache")))
+    cache.put("pageranks", "first build", {}, lambda directory: save_ranks(directory, ranks, csr_graph))
+
+    # the same graph, with the node ids in another order and a new app
+    permutation = np.random.RandomState(1).permutation(N_NODES)
+    packages = [None] * (N_NODES + 1)
+    for node, new_node in enumerate(permutation):
+        packages[new_node] = csr_graph.packages[node]
+    packages[N_NODES] = "new app"
+    sources, destinations = make_edges(N_NODES, 200)
+    rebuilt = load_csr_graph(save_graph(tmpdir.mkdir("rebuilt"), packages, permutation[sources],
+                                        permutation[destinations]))
+
+    assert np.array_equal(get_warm_start_ranks(cache, "first build", csr_graph), ranks)
+    initial_ranks = get_warm_start_ranks(cache, "second build", rebuilt)
+    assert np.isnan(initial_ranks[N_NODES])
+    assert np.array_equal(initial_ranks[permutation], ranks)
+    warm_ranks, warm_iterations, _ = compute_pagerank(rebuilt, tolerance=1e-10, max_iterations=1000,
+                                                      initial_ranks=initial_ranks)
+    cold_ranks, cold_iterations, _ = compute_pagerank(rebuilt, tolerance=1e-10, max_iterations=1000)
+    assert warm_iterations < cold_iterations
+    assert np.allclose(warm_ranks, cold_ranks, atol=1e-8)
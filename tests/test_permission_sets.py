@@ -0,0 +1,68 @@
+from itertools import combinations
+
+import numpy as np
+import pytest
+import scipy.sparse
+
+from permission_sets import get_cooccurrence, get_frequent_sets, get_lift, get_top_pairs
+
+
+def make_matrix(n_rows=300, n_items=12, seed=0):
+    """
+    Random rows x items matrix, the first items more frequent, with some duplicate entries
+    """
+    r = np.random.RandomState(seed)
+    dense = r.rand(n_rows, n_items) < np.linspace(0.6, 0.05, n_items)
+    rows, columns = np.nonzero(dense)
+    rows = np.concatenate([rows, rows[:20]])
+    columns = np.concatenate([columns, columns[:20]])
+    matrix = scipy.sparse.coo_matrix((np.ones(len(rows), dtype=np.int32), (rows, columns)), shape=dense.shape)
+    return matrix.tocsr(), dense
+
+
+def get_count(dense, items):
+    return int(np.count_nonzero(dense[:, list(items)].all(axis=1)))
+
+
+@pytest.mark.parametrize("chunk_size", [1000, 7])
+def test_cooccurrence_counts_the_rows(chunk_size):
+    matrix, dense = make_matrix()
+    cooccurrence = get_cooccurrence(matrix, chunk_size)
+    assert cooccurrence.tolist() == np.dot(dense.T.astype(np.int64), dense.astype(np.int64)).tolist()
+
+
+def test_lift():
+    matrix, dense = make_matrix()
+    n_rows, n_items = dense.shape
+    lift = get_lift(get_cooccurrence(matrix), n_rows)
+    frequencies = dense.mean(axis=0)
+    for i, j in combinations(range(n_items), 2):
+        expected = get_count(dense, (i, j)) / float(n_rows) / (frequencies[i] * frequencies[j])
+        assert lift[i, j] == pytest.approx(expected)
+    assert (get_lift(np.zeros((2, 2), dtype=np.int64), 10) == 0).all()
+
+
+@pytest.mark.parametrize("chunk_size", [1000, 7])
+def test_frequent_sets_match_the_brute_force(chunk_size):
+    matrix, dense = make_matrix()
+    min_count = 15
+    found = get_frequent_sets(matrix, get_cooccurrence(matrix), min_count, max_size=3, chunk_size=chunk_size)
+    expected = []
+    for size in (2, 3):
+        for items in combinations(range(dense.shape[1]), size):
+            count = get_count(dense, items)
+            if count >= min_count:
+                expected.append((items, count))
+    assert any(len(items) == 3 for items, _ in expected)
+    assert sorted(found) == sorted(expected)
+    assert sorted(get_frequent_sets(matrix, get_cooccurrence(matrix), min_count, max_size=2)) == \
+        sorted(pair for pair in expected if len(pair[0]) == 2)
+
+
+def test_top_pairs():
+    scores = np.array([[9.0, 1.0, 3.0],
+                       [1.0, 9.0, 2.0],
+                       [3.0, 2.0, 9.0]])
+    assert get_top_pairs(scores, 2) == [(0, 2, 3.0), (1, 2, 2.0)]
+    mask = np.array([[False, True, False]] * 3)
+    assert get_top_pairs(scores, 2, mask) == [(0, 1, 1.0)]
@@ -0,0 +1,103 @@
+import hashlib
+import json
+import multiprocessing
+import os
+
+import pytest
+
+from result_cache import FILE_FINGERPRINTS, MANIFEST, ResultCache
+
+
+def write_file(path, content):
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def put_value(cache, name, fingerprint, params, value):
+    return cache.put(name, fingerprint, params, lambda directory: write_file(os.path.join(directory, "value"), value))
+
+
+def read_value(entry_path):
+    with open(os.path.join(entry_path, "value"), "r") as f:
+        return f.read()
+
+
+@pytest.fixture
+def cache(tmpdir):
+    return ResultCache(str(tmpdir.join("cache")))
+
+
+def test_entries_are_keyed_by_fingerprint_and_params(cache):
+    put_value(cache, "pageranks", "graph1", {"damping": 0.85}, "a")
+    put_value(cache, "pageranks", "graph1", {"damping": 0.5}, "b")
+    assert read_value(cache.get("pageranks", "graph1", {"damping": 0.85})) == "a"
+    assert read_value(cache.get("pageranks", "graph1", {"damping": 0.5})) == "b"
+    assert cache.get("pageranks", "graph2", {"damping": 0.85}) is None
+    assert cache.get("betweenness", "graph1", {"damping": 0.85}) is None
+    # written again, replaced
+    put_value(cache, "pageranks", "graph1", {"damping": 0.85}, "c")
+    assert read_value(cache.get("pageranks", "graph1", {"damping": 0.85})) == "c"
+
+    cache.put_json("statistics", "graph1", None, {"n": 1})
+    assert cache.get_json("statistics", "graph1") == {"n": 1}
+    assert cache.get_json("statistics", "graph2") is None
+    metadata = cache.get_metadata(cache.get("statistics", "graph1"))
+    assert (metadata["name"], metadata["fingerprint"], metadata["params"]) == ("statistics", "graph1", None)
+
+
+def test_latest_entry(cache):
+    assert cache.get_latest("pageranks") is None
+    first = put_value(cache, "pageranks", "graph1", {}, "a")
+    second = put_value(cache, "pageranks", "graph2", {}, "b")
+    os.utime(os.path.join(first, "entry.json"), (1, 1))
+    assert cache.get_latest("pageranks") == second
+    # get updates the last access time
+    cache.get("pageranks", "graph1", {})
+    assert cache.get_latest("pageranks") == first
+
+
+def test_invalidate_and_evict(tmpdir):
+    cache = ResultCache(str(tmpdir.join("cache")), max_size=2500)
+    for i in range(3):
+        path = put_value(cache, "betweenness" if i else "pageranks", "graph{0}".format(i), {}, "x" * 1000)
+        os.utime(os.path.join(path, "entry.json"), (i + 1, i + 1))
+    cache.write_manifest()
+    # the least recently used entry is evicted
+    assert cache.get("pageranks", "graph0", {}) is None
+    with open(os.path.join(cache.directory, MANIFEST), "r") as f:
+        assert len(json.load(f)["entries"]) == 2
+    assert cache.invalidate(["betweenness"]) == 2
+    assert cache.get_entries() == []
+
+
+def test_file_fingerprint_follows_the_content(cache, tmpdir):
+    path = str(tmpdir.join("apps.graph"))
+    write_file(path, "graph")
+    fingerprint = cache.get_file_fingerprint(path)
+    assert fingerprint == hashlib.sha1(b"graph").hexdigest()
+    assert cache.get_file_fingerprint(path) == fingerprint
+    write_file(path, "another graph")
+    os.utime(path, (1, 1))
+    assert cache.get_file_fingerprint(path) == hashlib.sha1(b"another graph").hexdigest()
+    # the digests directory is not an entry
+    assert cache.get_entries() == []
+
+
+def fingerprint_file(args):
+    directory, path = args
+    return ResultCache(directory).get_file_fingerprint(path)
+
+
+def test_concurrent_fingerprints_are_all_kept(cache, tmpdir):
+    paths = []
+    for i in range(40):
+        paths.append(str(tmpdir.join("input{0}".format(i))))
+        write_file(paths[-1], "content {0}".format(i))
+    pool = multiprocessing.Pool(4)
+    try:
+        fingerprints = pool.map(fingerprint_file, [(cache.directory, path) for path in paths], chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+    assert fingerprints == [hashlib.sha1("content {0}".format(i).encode("utf-8")).hexdigest() for i in range(40)]
+    assert len(os.listdir(os.path.join(cache.directory, FILE_FINGERPRINTS))) == 40
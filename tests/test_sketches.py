@@ -0,0 +1,113 @@
+import random
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from sketches import HyperLogLog, QuantileSketch, SpaceSaving
+
+
+def test_quantiles_are_within_the_rank_error():
+    r = random.Random(0)
+    values = [r.expovariate(1.0) for _ in range(100000)]
+    sketch = QuantileSketch(k=200)
+    for value in values:
+        sketch.add(value)
+    assert len(sketch) == len(values)
+    assert sketch.size < 10 * sketch.k
+    sorted_values = np.sort(values)
+    percentiles = [1, 25, 50, 75, 95, 99]
+    for percentile, estimate in zip(percentiles, sketch.get_percentiles(percentiles)):
+        rank = np.searchsorted(sorted_values, estimate) / float(len(values))
+        assert abs(rank - percentile / 100.0) <= sketch.get_rank_error()
+    mean, std, _ = sketch.describe()
+    assert np.isclose(mean, np.mean(values))
+    assert np.isclose(std, np.std(values))
+
+
+def test_hyperloglog_estimate_is_within_the_error():
+    for n_items in (100, 50000):
+        hll = HyperLogLog(precision=12)
+        for i in range(n_items):
+            # every item twice: the duplicates don't count
+            hll.add("app{0}".format(i))
+            hll.add("app{0}".format(i))
+        assert abs(hll.get_estimate() - n_items) <= 4 * hll.get_relative_error() * n_items
+
+
+def test_space_saving_bounds_the_true_counts():
+    r = random.Random(0)
+    # a few heavy hitters in a long tail
+    stream = ["creator{0}".format(int(r.paretovariate(1.0))) for _ in range(20000)]
+    counter = Counter(stream)
+    sketch = SpaceSaving(capacity=20)
+    for item in stream:
+        sketch.add(item)
+    top = sketch.get_top(20)
+    for item, count, error in top:
+        assert count - error <= counter[item] <= count
+    listed = set(item for item, _, _ in top)
+    assert all(count <= sketch.floor for item, count in counter.items() if item not in sketch.counts)
+    assert [item for item, _ in counter.most_common(3)] == [item for item, _, _ in top[:3]]
+    assert listed >= set(item for item, count in counter.items() if count > sketch.floor)
+
+
+def make_sketches(factory, streams):
+    sketches = []
+    for stream in streams:
+        sketch = factory()
+        for item in stream:
+            sketch.add(item)
+        sketches.append(sketch)
+    return sketches
+
+
+def merge(sketches):
+    merged = sketches[0]
+    for sketch in sketches[1:]:
+        merged.merge(sketch)
+    return merged
+
+
+def test_merged_quantile_sketch_matches_a_single_pass():
+    r = random.Random(1)
+    # streams of different lengths and distributions, one of them empty
+    streams = [[r.expovariate(1.0) for _ in range(60000)], [], [r.uniform(2, 5) for _ in range(15000)],
+               [r.gauss(0, 1) for _ in range(25000)]]
+    values = [value for stream in streams for value in stream]
+    single_pass = make_sketches(lambda: QuantileSketch(k=200), [values])[0]
+    merged = merge(make_sketches(lambda: QuantileSketch(k=200, seed=len(streams)), streams))
+    assert len(merged) == len(values)
+    assert merged.size < 10 * merged.k
+    assert (merged.min, merged.max) == (single_pass.min, single_pass.max)
+    assert np.allclose(merged.describe()[:2], single_pass.describe()[:2])
+    sorted_values = np.sort(values)
+    percentiles = [1, 25, 50, 75, 95, 99]
+    for percentile, estimate in zip(percentiles, merged.get_percentiles(percentiles)):
+        rank = np.searchsorted(sorted_values, estimate) / float(len(values))
+        assert abs(rank - percentile / 100.0) <= merged.get_rank_error()
+
+
+def test_merged_hyperloglog_is_the_single_pass_sketch():
+    # overlapping streams: the items in both count once
+    streams = [["app{0}".format(i) for i in range(0, 30000)], ["app{0}".format(i) for i in range(20000, 50000)]]
+    single_pass = make_sketches(lambda: HyperLogLog(precision=12), [streams[0] + streams[1]])[0]
+    merged = merge(make_sketches(lambda: HyperLogLog(precision=12), streams))
+    assert merged.registers == single_pass.registers
+    assert abs(merged.get_estimate() - 50000) <= 4 * merged.get_relative_error() * 50000
+    with pytest.raises(ValueError):
+        merged.merge(HyperLogLog(precision=10))
+
+
+def test_merged_space_saving_bounds_the_true_counts():
+    r = random.Random(0)
+    streams = [["creator{0}".format(int(r.paretovariate(1.0))) for _ in range(n_items)]
+               for n_items in (12000, 5000, 3000)]
+    counter = Counter(item for stream in streams for item in stream)
+    single_pass = make_sketches(lambda: SpaceSaving(capacity=20), [[item for stream in streams for item in stream]])
+    merged = merge(make_sketches(lambda: SpaceSaving(capacity=20), streams))
+    top = merged.get_top(20)
+    for item, count, error in top:
+        assert count - error <= counter[item] <= count
+    assert all(count <= merged.floor for item, count in counter.items() if item not in merged.counts)
+    assert [item for item, _, _ in top[:3]] == [item for item, _, _ in single_pass[0].get_top(3)]
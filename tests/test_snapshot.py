@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from db_accumulators import CreatorsAccumulator, DownloadsAccumulator, PermissionsAccumulator, \
+    PermissionSetsAccumulator, RatingAccumulator, SizeAccumulator, UploadDateAccumulator, feed, \
+    get_projection_fields
+from db_analyzer import collect_from_snapshot
+from db_interface import get_fields
+from snapshot import Snapshot, export_snapshot
+from test_db_analyzer import summarize
+
+FACTORIES = [DownloadsAccumulator, UploadDateAccumulator, SizeAccumulator,
+             lambda: RatingAccumulator("bayesianMeanRating"), lambda: RatingAccumulator("starRating"),
+             CreatorsAccumulator, PermissionsAccumulator, PermissionSetsAccumulator]
+
+
+def summarize_snapshot(accumulator):
+    # the snapshot stores the upload timestamps, not the date strings
+    if isinstance(accumulator, UploadDateAccumulator):
+        return sorted(accumulator.get_timestamps())
+    return summarize(accumulator)
+
+
+@pytest.fixture
+def snapshot(apps_db, tmpdir):
+    snapshot_path = str(tmpdir.join("apps.snapshot.npz"))
+    # small chunks, so that the columns are appended more times
+    export_snapshot(snapshot_path, None, chunk_size=17)
+    return Snapshot(snapshot_path)
+
+
+@pytest.mark.parametrize("packages", [None, ["app{0}".format(i) for i in range(0, 120, 3)] + ["missing"]])
+@pytest.mark.parametrize("factory", FACTORIES)
+def test_snapshot_statistics_match_the_scan(snapshot, factory, packages):
+    scanned = [factory()]
+    n_apps = feed(scanned, get_fields(packages, get_projection_fields(scanned)))
+    collected = [factory()]
+    assert collect_from_snapshot(collected, snapshot, packages) == n_apps
+    assert summarize_snapshot(collected[0]) == summarize_snapshot(scanned[0])
+
+
+def test_rows_mask(snapshot):
+    package_table = snapshot.get_table("packages")
+    packages = [package_table[package_id] for package_id in snapshot.package_ids]
+    assert len(snapshot) == 120
+    assert snapshot.get_rows_mask(None).all()
+    rows = snapshot.get_rows_mask(["app3", "app7", "missing", "app3"])
+    assert sorted(packages[i] for i in np.flatnonzero(rows)) == ["app3", "app7"]
+    assert not snapshot.get_rows_mask(["missing"]).any()
@@ -0,0 +1,82 @@
+import multiprocessing
+import time
+
+import pytest
+
+from task_scheduler import Task, run_tasks, select_tasks
+
+
+def record_task(context, value):
+    start = time.time()
+    time.sleep(0.05)
+    return {"value": value, "start": start, "end": time.time()}
+
+
+def failing_task(context):
+    raise RuntimeError("failed")
+
+
+def unpicklable_task(context):
+    # the pool can't send it back to the scheduler
+    return {"value": lambda: None}
+
+
+def process_task(context):
+    return {"daemon": multiprocessing.current_process().daemon}
+
+
+def make_tasks(first_function=record_task):
+    return [Task("third", record_task, inputs=["second_output"], args=(3,)),
+            Task("first", first_function, outputs=["first_output"], args=(1,) if first_function is record_task else ()),
+            Task("second", record_task, inputs=["first_output"], outputs=["second_output"], args=(2,)),
+            Task("independent", record_task, args=(4,), default=False)]
+
+
+def test_select_tasks():
+    tasks = make_tasks()
+    assert [task.name for task in select_tasks(tasks)] == ["third", "first", "second"]
+    assert [task.name for task in select_tasks(tasks, only=["independent", "first"])] == ["first", "independent"]
+    assert [task.name for task in select_tasks(tasks, skip=["third"])] == ["first", "second"]
+    with pytest.raises(ValueError):
+        select_tasks(tasks, only=["missing"])
+
+
+@pytest.mark.parametrize("jobs", [1, 3])
+def test_tasks_run_after_their_dependencies(jobs):
+    tasks = make_tasks()
+    results = run_tasks(tasks, dict((task.name, task.name) for task in tasks), jobs)
+    assert all(error is None for _, _, error in results.values())
+    assert dict((name, result[0]["value"]) for name, result in results.items()) == \
+        {"first": 1, "second": 2, "third": 3, "independent": 4}
+    assert results["second"][0]["start"] >= results["first"][0]["end"]
+    assert results["third"][0]["start"] >= results["second"][0]["end"]
+
+
+@pytest.mark.parametrize("jobs", [1, 3])
+def test_dependents_of_a_failed_task_are_not_run(jobs):
+    results = run_tasks(make_tasks(failing_task), [], jobs)
+    assert "RuntimeError" in results["first"][2]
+    assert results["second"] == (None, 0.0, "dependency first failed")
+    assert results["third"] == (None, 0.0, "dependency second failed")
+    assert results["independent"][2] is None
+
+
+def test_results_that_cant_be_sent_back_fail_the_task(monkeypatch):
+    monkeypatch.setattr("task_scheduler.POLL_INTERVAL", 0.05)
+    results = run_tasks(make_tasks(unpicklable_task), [], jobs=2)
+    assert results["first"][2] is not None
+    assert results["second"][2] == "dependency first failed"
+    assert results["independent"][0]["value"] == 4
+
+
+def test_in_parent_tasks_run_in_the_scheduler_process():
+    results = run_tasks([Task("pool", process_task), Task("parent", process_task, in_parent=True)], None, jobs=2)
+    assert results["pool"][0] == {"daemon": True}
+    assert results["parent"][0] == {"daemon": False}
+
+
+def test_circular_dependencies():
+    tasks = [Task("a", record_task, inputs=["b_output"], outputs=["a_output"], args=(1,)),
+             Task("b", record_task, inputs=["a_output"], outputs=["b_output"], args=(2,))]
+    results = run_tasks(tasks, [])
+    assert results == {"a": (None, 0.0, "circular dependency"), "b": (None, 0.0, "circular dependency")}
@@ -0,0 +1,64 @@
+from operator import itemgetter
+
+import numpy as np
+import pytest
+
+from topk import TopK, bottom_k, top_k, top_k_indices
+
+
+def test_top_and_bottom_k():
+    items = [("a", 3), ("b", 1), ("c", 5), ("d", 2)]
+    assert top_k(items, 2) == [("c", 5), ("a", 3)]
+    assert bottom_k(items, 2) == [("b", 1), ("d", 2)]
+    assert top_k(items, 10) == [("c", 5), ("a", 3), ("d", 2), ("b", 1)]
+
+
+@pytest.mark.parametrize("k", [0, -1])
+def test_no_items_for_k_not_positive(k):
+    items = [("a", 3), ("b", 1)]
+    assert top_k(items, k) == []
+    assert bottom_k(items, k) == []
+    top = TopK(k)
+    top.extend(items)
+    assert top.get_sorted() == []
+    assert top_k_indices(np.array([0.1, 0.7]), k).tolist() == []
+
+
+def get_baseline_top(items, k, keep_last):
+    """
+    Top k of the baseline analyzers: > for the DB statistics, >= (keep_last) for the graph top nodes. Both also
+    skipped the items smaller than the minimum before having k of them, which TopK doesn't.
+    """
+    top = []
+    for item in items:
+        if len(top) < k:
+            top.append(item)
+        elif item[1] > min(top, key=itemgetter(1))[1] or (keep_last and item[1] == min(top, key=itemgetter(1))[1]):
+            top.remove(min(top, key=itemgetter(1)))
+            top.append(item)
+    return sorted(top)
+
+
+@pytest.mark.parametrize("keep_last", [False, True])
+def test_ties_are_broken_as_in_the_baseline(keep_last):
+    items = [("a", 1), ("b", 2), ("c", 2), ("d", 2)]
+    assert sorted(top_k(items, 2, keep_last=keep_last)) == get_baseline_top(items, 2, keep_last)
+    items = list(enumerate(np.random.RandomState(0).randint(0, 20, 1000).tolist()))
+    for k in (1, 10, 100):
+        assert sorted(top_k(items, k, keep_last=keep_last)) == get_baseline_top(items, k, keep_last)
+
+
+@pytest.mark.parametrize("keep_last", [False, True])
+def test_top_k_indices(keep_last):
+    scores = np.random.RandomState(0).randint(0, 20, 1000)
+    # stable sort by descending score: the lowest indices first among ties
+    order = np.argsort(-scores, kind="mergesort")
+    if keep_last:
+        order = np.argsort(-scores[::-1], kind="mergesort")
+        order = len(scores) - 1 - order
+    for k in (1, 10, 100, 999, 1000, 2000):
+        indices = top_k_indices(scores, k, keep_last)
+        assert sorted(indices.tolist()) == sorted(order[:k].tolist())
+        assert np.all(np.diff(scores[indices]) <= 0)
+    assert top_k_indices([1, 2, 2, 2], 2).tolist() == [1, 2]
+    assert top_k_indices([1, 2, 2, 2], 2, keep_last=True).tolist() == [2, 3]
@@ -0,0 +1,79 @@
+import heapq
+from itertools import count
+from operator import itemgetter
+
+import numpy as np
+
+
+class TopK(object):
+    """
+    Keeps the k items with the largest key among the ones pushed so far, in O(log k) per push.
+    With largest=False it keeps the k items with the smallest key instead. When k items are kept, an item tied
+    with the worst of them replaces it only with keep_last (>= instead of >, as the graph top nodes always did);
+    the item replaced is the earliest pushed among the worst ones.
+    """
+
+    def __init__(self, k, key=itemgetter(1), largest=True, keep_last=False):
+        self.k = k
+        self.key = key
+        self.sign = 1 if largest else -1
+        self.keep_last = keep_last
+        self.heap = []
+        self.counter = count()
+
+    def __len__(self):
+        return len(self.heap)
+
+    def push(self, item):
+        if self.k <= 0:
+            return
+        entry = (self.sign * self.key(item), next(self.counter), item)
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, entry)
+        elif entry[0] > self.heap[0][0] or (self.keep_last and entry[0] == self.heap[0][0]):
+            # on ties the root is the earliest pushed of the worst items
+            heapq.heapreplace(self.heap, entry)
+
+    def extend(self, items):
+        for item in items:
+            self.push(item)
+
+    def get_sorted(self):
+        """
+        Returns the items sorted from the best to the worst (descending for largest=True)
+        """
+        return [entry[2] for entry in sorted(self.heap, key=itemgetter(0), reverse=True)]
+
+
+def top_k(items, k, key=itemgetter(1), keep_last=False):
+    if k <= 0:
+        return []
+    top = TopK(k, key, keep_last=keep_last)
+    top.extend(items)
+    return top.get_sorted()
+
+
+def bottom_k(items, k, key=itemgetter(1)):
+    if k <= 0:
+        return []
+    bottom = TopK(k, key, largest=False)
+    bottom.extend(items)
+    return bottom.get_sorted()
+
+
+def top_k_indices(scores, k, keep_last=False):
+    """
+    Indices of the k largest scores of an array, sorted by descending score, in O(n + k log k). Among the scores
+    tied with the k-th largest one the lowest indices are selected, or the highest with keep_last.
+    """
+    scores = np.asarray(scores)
+    if k <= 0:
+        return np.empty(0, dtype=int)
+    if k >= len(scores):
+        return np.argsort(-scores, kind="mergesort")
+    threshold = np.partition(scores, len(scores) - k)[len(scores) - k]
+    above = np.flatnonzero(scores > threshold)
+    tied = np.flatnonzero(scores == threshold)
+    n_tied = k - len(above)
+    candidates = np.concatenate([above, tied[len(tied) - n_tied:] if keep_last else tied[:n_tied]])
+    return candidates[np.argsort(-scores[candidates], kind="mergesort")]